@@ -3,6 +3,7 @@ import math
 
 from .config import config
 from .core import wav
+from .core import resampling
 
 
 def ramp(initial, *values):
@@ -41,23 +42,45 @@ def _iter_ramps(initial, values):
         previous_target = target
 
 
-def resample(block, ratio):
+def resample(block, ratio, lengths=None):
     """
     Resamples `block`, returning a new block that has a play rate of `ratio`.
-    """
-    if ratio == 1: return block
 
-    frame_count_in = block.shape[0]
-    frame_count_out = math.floor((frame_count_in - 1) / ratio) + 1
-    x_in = numpy.arange(0, frame_count_in)
+    `block` can also be a batch of blocks, array of shape `(batch, frames, channels)`.
+    If the blocks don't all have the same number of frames, they can be padded
+    with zeros to the same size (see `stack`), and their actual number of frames
+    given in `lengths`. In that case, a tuple `(block, lengths)` is returned.
+    """
+    if ratio == 1:
+        if lengths is None: return block
+        else: return block, lengths
+    if block.ndim == 2 and lengths is None:
+        frame_count_in = block.shape[0]
+        frame_count_out = math.floor((frame_count_in - 1) / ratio) + 1
+        x_in = numpy.arange(0, frame_count_in)
+        x_out = numpy.arange(0, frame_count_out) * ratio
+        
+        block_out = []
+        for block_ch in block.T:
+            block_out.append(numpy.interp(x_out, x_in, block_ch))
+        block_out = numpy.vstack(block_out).transpose()
+
+        return block_out
+
+    # Batch : linear interpolation between frames `i0` and `i1` of each block
+    batch, lengths_in = _as_batch(block, lengths)
+    frame_count_out = int(math.floor((batch.shape[1] - 1) / ratio) + 1)
+    lengths_out = numpy.maximum(numpy.floor((lengths_in - 1) / float(ratio)) + 1, 0).astype('int64')
     x_out = numpy.arange(0, frame_count_out) * ratio
-    
-    block_out = []
-    for block_ch in block.T:
-        block_out.append(numpy.interp(x_out, x_in, block_ch))
-    block_out = numpy.vstack(block_out).transpose()
-
-    return block_out
+    i0 = numpy.floor(x_out).astype('int64')
+    frac = (x_out - i0).reshape((1, frame_count_out, 1))
+    last_frames = numpy.maximum(lengths_in - 1, 0).reshape((-1, 1))
+    i0 = numpy.minimum(i0.reshape((1, frame_count_out)), last_frames)
+    i1 = numpy.minimum(i0 + 1, last_frames)
+    rows = numpy.arange(batch.shape[0]).reshape((-1, 1))
+    block_out = batch[rows, i0] * (1 - frac) + batch[rows, i1] * frac
+    block_out *= _length_mask(lengths_out, frame_count_out)
+    return _from_batch(block_out, block, lengths_out, lengths)
 
 
 def fix_channel_count(block, channel_count):
@@ -65,56 +88,137 @@ def fix_channel_count(block, channel_count):
     Up-mix / down-mix `block` to `channel_count` channels.
     If `block` has too many channels, the extra channels are simply cropped,
     If `block` doesn't have enough channels, the extra channels are copied from
-    the last channel available.
+    the last channel available. `block` can also be a batch of blocks,
+    array of shape `(batch, frames, channels)`.
     """
-    if block.shape[1] == channel_count: return block
-    elif block.shape[1] > channel_count:
-        return block[:,:channel_count]
-    elif block.shape[1] < channel_count:
-        return numpy.hstack([block, block[:,-1:]])
+    if block.shape[-1] == channel_count: return block
+    elif block.shape[-1] > channel_count:
+        return block[...,:channel_count]
+    elif block.shape[-1] < channel_count:
+        extra_channels = numpy.repeat(block[...,-1:], channel_count - block.shape[-1], axis=-1)
+        return numpy.concatenate([block, extra_channels], axis=-1)
 
 
-def fix_frame_count(block, frame_count):
+def fix_frame_count(block, frame_count, lengths=None):
     """
     Fix the number of frames, bringing it to `frame_count` by adding or removing 
     frames at the end of `block`.
+
+    `block` can also be a batch of blocks, array of shape `(batch, frames, channels)`,
+    with `lengths` the actual number of frames of each block (see `resample`).
+    All the blocks have then `frame_count` frames, and `(block, lengths)` is returned.
     """
     sign = numpy.sign(frame_count)
     frame_count = abs(frame_count)
-    if block.shape[0] == frame_count: return block
-    elif block.shape[0] < frame_count:
-        extra_frames = numpy.zeros((frame_count - block.shape[0], block.shape[1]))
+    if lengths is not None:
+        return _fix_frame_count_ragged(block, frame_count, sign, lengths)
+    if block.shape[-2] == frame_count: return block
+    elif block.shape[-2] < frame_count:
+        extra_frames = numpy.zeros(block.shape[:-2] + (frame_count - block.shape[-2], block.shape[-1]))
         if (sign == 1):
-            return numpy.vstack([block, extra_frames])
+            return numpy.concatenate([block, extra_frames], axis=-2)
         else:
-            return numpy.vstack([extra_frames, block])
-    elif block.shape[0] > frame_count:
+            return numpy.concatenate([extra_frames, block], axis=-2)
+    elif block.shape[-2] > frame_count:
         if (sign == 1):
-            return block[:frame_count,:]
+            return block[...,:frame_count,:]
         else:
-            return block[-frame_count:,:]
+            return block[...,-frame_count:,:]
 
 
-def reshape(block, channel_count=None, frame_count=None):
+def reshape(block, channel_count=None, frame_count=None, lengths=None):
     """
     Just combines `fix_frame_count` and `fix_channel_count` in one more handy function.
     """
     if channel_count != None:
         block = fix_channel_count(block, channel_count)
     if frame_count != None:
-        block = fix_frame_count(block, frame_count)
-    return block
+        if lengths is None: block = fix_frame_count(block, frame_count)
+        else: block, lengths = fix_frame_count(block, frame_count, lengths)
+    if lengths is None: return block
+    else: return block, lengths
+
+
+def stack(blocks):
+    """
+    Stacks blocks with different numbers of frames in one array of shape
+    `(batch, frames, channels)`, padding them with zeros at the end.
+    Returns a tuple `(batch, lengths)`, where `lengths` are the number of frames of each block.
+    """
+    lengths = numpy.array([block.shape[0] for block in blocks], dtype='int64')
+    batch = numpy.zeros((len(blocks), lengths.max(), blocks[0].shape[1]))
+    for i, block in enumerate(blocks):
+        batch[i,:block.shape[0]] = block
+    return batch, lengths
+
+
+def _fix_frame_count_ragged(block, frame_count, sign, lengths):
+    batch, lengths = _as_batch(block, lengths)
+    if sign == 1:
+        # Blocks are already aligned at the start, we just need to crop / pad
+        # and make sure that the padding is zeros.
+        batch = fix_frame_count(batch, frame_count)
+        batch = batch * _length_mask(numpy.minimum(lengths, frame_count), frame_count)
+    else:
+        # Blocks are aligned at the end : frame `i` of the output is frame
+        # `lengths - frame_count + i` of the input.
+        indices = numpy.arange(frame_count).reshape((1, -1)) + (lengths - frame_count).reshape((-1, 1))
+        valid = (indices >= 0).reshape(indices.shape + (1,))
+        rows = numpy.arange(batch.shape[0]).reshape((-1, 1))
+        batch = batch[rows, numpy.clip(indices, 0, max(batch.shape[1] - 1, 0))] * valid
+    lengths_out = numpy.ones(lengths.shape, dtype='int64') * frame_count
+    return _from_batch(batch, block, lengths_out, lengths)
+
+
+def _as_batch(block, lengths):
+    """
+    Returns `block` as a batch of blocks, and the lengths of the blocks.
+    """
+    if block.ndim == 2: block = block.reshape((1,) + block.shape)
+    if lengths is None: lengths = numpy.ones(block.shape[0], dtype='int64') * block.shape[1]
+    else: lengths = numpy.asarray(lengths, dtype='int64').reshape((block.shape[0],))
+    return block, lengths
+
+
+def _from_batch(batch, block, lengths_out, lengths):
+    """
+    Returns `batch` in the same form as the input `block` of the operation.
+    """
+    if block.ndim == 2:
+        batch = batch[0]
+        lengths_out = lengths_out[0]
+    if lengths is None: return batch
+    else: return batch, lengths_out
+
+
+def _length_mask(lengths, frame_count):
+    """
+    Returns an array of shape `(batch, frame_count, 1)`, 1 for frames within `lengths`, 0 after.
+    """
+    mask = numpy.arange(frame_count).reshape((1, frame_count)) < lengths.reshape((-1, 1))
+    return mask.reshape(mask.shape + (1,))
 
 
-def read_wav(filelike, start=0, end=None):
+def read_wav(filelike, start=0, end=None, convert_rate=True):
     """
     Reads a whole wav file. Returns a tuple `(<samples>, <infos>)`.
+    If the frame rate of the file is not `config.frame_rate` and `convert_rate` is `True`,
+    the samples are resampled to `config.frame_rate`.
     """
     wfile, infos = wav.open_read_mode(filelike)
     start_frame = start * infos['frame_rate']
     if start_frame > infos['frame_count']:
         return numpy.empty([0, infos['channel_count']]), infos
     frame_count = wav.seek(wfile, start, end)
+    if convert_rate and infos['frame_rate'] != config.frame_rate:
+        resampler = resampling.Resampler(infos['frame_rate'], config.frame_rate, infos['channel_count'])
+        # Resampled in blocks, to keep the memory used by the resampler bounded
+        blocks = []
+        for i in range(0, frame_count, config.block_size):
+            raw = wav.read_raw_block(wfile, min(config.block_size, frame_count - i))
+            blocks.append(resampler.process(raw))
+        blocks.append(resampler.flush())
+        return numpy.concatenate(blocks), infos
     return wav.read_block(wfile, frame_count), infos
     
 
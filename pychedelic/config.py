@@ -1,3 +1,6 @@
+import os
+
+
 class _Config(object):
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
@@ -7,5 +10,14 @@ config = _Config(
   frame_rate = 44100,
 
   # This is a **recommended** block size for stream processing.  
-  block_size = 1024
-)
\ No newline at end of file
+  block_size = 1024,
+
+  # File where loudness measurements are persisted, so that a file is never measured twice.
+  loudness_cache = os.path.join(os.path.expanduser('~'), '.pychedelic', 'loudness.json'),
+
+  # Directory where converted files are kept, its maximum size in bytes,
+  # and how long in seconds unused files are kept (`None` for no limit).
+  conversion_cache = os.path.join(os.path.expanduser('~'), '.pychedelic', 'conversions'),
+  conversion_cache_max_size = 2**30,
+  conversion_cache_max_age = None
+)
@@ -0,0 +1,277 @@
+import gc
+import time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from . import buffering
+from ..config import config
+
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Audit(object):
+    """
+    Audit of the realtime safety of a stream. Each stage of the stream is timed,
+    the memory it allocates is measured with `tracemalloc`, and the garbage
+    collections happening while the stream renders are recorded through `gc.callbacks`.
+    Blocks which took longer to render than their duration (times `deadline_ratio`)
+    are flagged, with the stage that took the most time.
+
+        audit = Audit(freeze_gc=True)
+        stream.playback(source, audit=audit)
+        print(audit.format_report())
+
+    Stages are found by following the attributes `source` and `sources` from the last stage,
+    so sources plugged into a mixer after the audit started are not audited.
+    If `freeze_gc` is `True`, the garbage collector is disabled while the stream renders.
+    `tracemalloc` and `gc.callbacks` are only available with Python 3,
+    so with Python 2 only the timing is audited. Since the package itself
+    only imports with Python 2 for now, the allocations and garbage collections
+    auditing is not tested.
+    """
+
+    def __init__(self, freeze_gc=False, trace_allocations=True, deadline_ratio=1.0):
+        self.freeze_gc = freeze_gc
+        self.trace_allocations = trace_allocations and tracemalloc is not None
+        self.deadline_ratio = deadline_ratio
+        self.stages = []                # `StageStats` of all the stages audited
+        self.blocks = 0                 # number of blocks rendered by the last stage
+        self.late_blocks = []           # (block index, render time, deadline, stage path)
+        self.gc_pauses = []             # (block index, duration, generation, stage path)
+        self._stack = []                # probes being called, the innermost last
+        self._replaced = []             # (consumer, source) for each stage wrapped upstream
+        self._block_times = {}          # {stage path: self time} for the current block
+        self._gc_started = None
+        self._started_tracing = False
+        self._gc_was_enabled = None
+
+    def wrap(self, source, path=None):
+        """
+        Wraps `source` and all the stages upstream for auditing, and returns the wrapped source.
+        Stages upstream are replaced in place in their consumers, until `stop` is called.
+        """
+        name = _stage_name(source)
+        path = name if path is None else '%s/%s' % (path, name)
+        self._wrap_upstream(source, path)
+        probe = _Probe(source, StageStats(path), self)
+        self.stages.append(probe.stats)
+        return probe
+
+    def start(self):
+        """
+        Starts recording allocations and garbage collections.
+        """
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if hasattr(gc, 'callbacks'):
+            gc.callbacks.append(self._gc_callback)
+        if self.freeze_gc:
+            self._gc_was_enabled = gc.isenabled()
+            gc.collect()
+            if hasattr(gc, 'freeze'): gc.freeze()
+            gc.disable()
+
+    def stop(self):
+        """
+        Stops recording, restores the garbage collector, and puts back
+        the stages upstream in their consumers.
+        """
+        while self._replaced:
+            consumer, source = self._replaced.pop()
+            consumer.source = source
+        if self.freeze_gc:
+            if hasattr(gc, 'unfreeze'): gc.unfreeze()
+            if self._gc_was_enabled: gc.enable()
+        if hasattr(gc, 'callbacks') and self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def report(self):
+        """
+        Returns a dictionary with the number of `blocks` rendered, the `late_blocks`,
+        the `gc_pauses`, the statistics of each stage in `stages` (sorted by total self time),
+        and the path of the `worst_stage`.
+        """
+        stages = sorted((stats.as_dict() for stats in self.stages),
+            key=lambda stats: stats['self_time'], reverse=True)
+        return {
+            'blocks': self.blocks,
+            'late_blocks': list(self.late_blocks),
+            'gc_pauses': list(self.gc_pauses),
+            'stages': stages,
+            'worst_stage': stages[0]['path'] if stages else None
+        }
+
+    def format_report(self):
+        """
+        Returns the report as a human-readable string.
+        """
+        report = self.report()
+        lines = ['%s blocks, %s late, %s GC pauses (%.2fms in total)' % (
+            report['blocks'], len(report['late_blocks']), len(report['gc_pauses']),
+            sum(pause[1] for pause in report['gc_pauses']) * 1000)]
+        for block_index, duration, deadline, path in report['late_blocks']:
+            lines.append('  late block %s : %.2fms for a deadline of %.2fms, mostly in %s'
+                % (block_index, duration * 1000, deadline * 1000, path))
+        for block_index, duration, generation, path in report['gc_pauses']:
+            lines.append('  GC pause in block %s : %.2fms, generation %s, in %s'
+                % (block_index, duration * 1000, generation, path))
+        lines.append('stage : calls, self time, max self time, allocated, max allocated')
+        for stats in report['stages']:
+            lines.append('  %s : %s, %.2fms, %.2fms, %s bytes, %s bytes' % (
+                stats['path'], stats['calls'], stats['self_time'] * 1000,
+                stats['max_self_time'] * 1000, stats['allocated'], stats['max_allocated']))
+        return '\n'.join(lines)
+
+    def _wrap_upstream(self, stage, path):
+        if isinstance(getattr(stage, 'source', None), buffering.Buffer):
+            self._replace(stage.source, path)
+        elif _is_stream(getattr(stage, 'source', None)):
+            self._replace(stage, path)
+        for i, buf in enumerate(getattr(stage, 'sources', None) or []):
+            if isinstance(buf, buffering.Buffer):
+                self._replace(buf, '%s[%s]' % (path, i))
+
+    def _replace(self, consumer, path):
+        self._replaced.append((consumer, consumer.source))
+        consumer.source = self.wrap(consumer.source, path)
+
+    def _enter(self, probe):
+        if not self._stack: self._block_times = {}
+        probe.started = clock()
+        probe.children_time = 0
+        probe.children_allocated = 0
+        probe.memory = probe.peak = 0
+        if self._tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # Close the measure of the caller's own peak before measuring the new stage
+                caller = self._stack[-1]
+                caller.peak = max(caller.peak, peak - caller.children_allocated)
+            _reset_peak()
+            probe.memory = probe.peak = current
+        self._stack.append(probe)
+
+    def _exit(self, probe, block):
+        duration = clock() - probe.started
+        self._stack.pop()
+        allocated = retained = 0
+        if self._tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # Memory kept by the stages upstream isn't counted in this stage's peak
+            allocated = max(probe.peak, peak - probe.children_allocated) - probe.memory
+            retained = current - probe.memory
+            _reset_peak()
+        self_time = duration - probe.children_time
+        probe.stats.add(self_time, max(allocated, 0))
+        self._block_times[probe.stats.path] = self._block_times.get(probe.stats.path, 0) + self_time
+
+        if self._stack:
+            self._stack[-1].children_time += duration
+            self._stack[-1].children_allocated += max(retained, 0)
+        elif block is not None:
+            # Last stage, a block is complete
+            deadline = block.shape[0] / float(config.frame_rate) * self.deadline_ratio
+            if duration > deadline:
+                worst = max(self._block_times, key=self._block_times.get)
+                self.late_blocks.append((self.blocks, duration, deadline, worst))
+            self.blocks += 1
+
+    def _tracing(self):
+        return self.trace_allocations and tracemalloc.is_tracing()
+
+    def _gc_callback(self, phase, info):
+        if phase == 'start':
+            self._gc_started = clock()
+        elif self._gc_started is not None:
+            path = self._stack[-1].stats.path if self._stack else None
+            self.gc_pauses.append((self.blocks, clock() - self._gc_started, info.get('generation'), path))
+            self._gc_started = None
+
+
+class StageStats(object):
+    """
+    Statistics of one stage : number of `calls`, total and maximum time
+    spent in the stage itself in seconds (not counting the stages upstream),
+    total and maximum of the peak bytes allocated by the stage during a call,
+    including temporaries freed before the call returns. Without `tracemalloc.reset_peak`
+    (before Python 3.9), only the bytes still in use after the call are counted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.self_time = 0
+        self.max_self_time = 0
+        self.allocated = 0
+        self.max_allocated = 0
+
+    def add(self, self_time, allocated):
+        self.calls += 1
+        self.self_time += self_time
+        self.max_self_time = max(self.max_self_time, self_time)
+        self.allocated += allocated
+        self.max_allocated = max(self.max_allocated, allocated)
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'calls': self.calls,
+            'self_time': self.self_time,
+            'max_self_time': self.max_self_time,
+            'allocated': self.allocated,
+            'max_allocated': self.max_allocated
+        }
+
+
+class _Probe(object):
+    """
+    Wraps a stage, to time each block it generates.
+    Other attributes, e.g. `frame_count_hint` or `seek`, are those of the stage.
+    """
+
+    def __init__(self, stage, stats, audit):
+        self.stage = stage
+        self.stats = stats
+        self.audit = audit
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.audit._enter(self)
+        block = None
+        try:
+            block = next(self.stage)
+            return block
+        finally:
+            self.audit._exit(self, block)
+    next = __next__ # Compatibility Python 2
+
+    def __getattr__(self, name):
+        return getattr(self.stage, name)
+
+
+def _reset_peak():
+    if hasattr(tracemalloc, 'reset_peak'): tracemalloc.reset_peak()
+
+
+def _stage_name(stage):
+    return getattr(stage, '__name__', type(stage).__name__)
+
+
+def _is_stream(obj):
+    return hasattr(obj, '__next__') or hasattr(obj, 'next')
@@ -0,0 +1,150 @@
+import time
+
+from . import wav
+from ..config import config
+
+
+class Backend(object):
+    """
+    Base class for output backends. A backend consumes the audio rendered
+    by a `playback.Engine` until it is done. Options passed to the constructor
+    are available in `self.options`.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def run(self, engine):
+        """
+        Consumes the audio of `engine` until it is done, then returns.
+        Subclasses must implement this, usually by calling `engine.read(frame_count)`
+        in a loop until the returned `done` flag is True. `engine.read` returns
+        the audio as 16 bits PCM bytes, padded with silence on underrun
+        unless it is called with `wait=True`.
+        """
+        raise NotImplementedError()
+
+
+class PyAudioBackend(Backend):
+    """
+    Plays the audio with pyAudio. pyAudio is only imported when this backend is used.
+    """
+
+    def run(self, engine):
+        try:
+            import pyaudio
+        except ImportError:
+            raise ImportError('Please install pyAudio if you want to play back audio')
+
+        def callback(in_data, frame_count, time_info, status):
+            data, done = engine.read(frame_count)
+            if done: return (data, pyaudio.paComplete)
+            else: return (data, pyaudio.paContinue)
+
+        p = pyaudio.PyAudio()
+        stream = p.open(
+            format=p.get_format_from_width(2), # Only format supported right now 16bits
+            channels=engine.channel_count,
+            rate=config.frame_rate,
+            output=True,
+            stream_callback=callback
+        )
+
+        stream.start_stream()
+        while stream.is_active():
+            time.sleep(0.05)
+
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+
+
+class NullBackend(Backend):
+    """
+    Consumes the audio as fast as possible, by periods of `period` frames
+    (by default `config.block_size`), and discards it. Useful to measure throughput.
+    """
+
+    def run(self, engine):
+        period = self.options.get('period', config.block_size)
+        done = False
+        while not done:
+            data, done = engine.read(period, wait=True)
+
+
+class PacedBackend(Backend):
+    """
+    Simulates a realtime audio output, reading periods of `period` frames
+    at the pace of the wall clock, multiplied by `speed`. Whenever the engine
+    doesn't have enough audio ready, the time of the underrun in seconds
+    is appended to `underrun_times`.
+    """
+
+    def __init__(self, **options):
+        super(PacedBackend, self).__init__(**options)
+        self.underrun_times = []
+
+    def run(self, engine):
+        period = self.options.get('period', config.block_size)
+        speed = self.options.get('speed', 1.0)
+        period_duration = period / float(config.frame_rate) / speed
+        started = time.time()
+        period_count = 0
+        done = False
+
+        while not done:
+            underruns = engine.underruns
+            data, done = engine.read(period)
+            if engine.underruns > underruns:
+                self.underrun_times.append(period_count * period / float(config.frame_rate))
+            period_count += 1
+            # Wait until the next period is due
+            delay = started + period_count * period_duration - time.time()
+            if delay > 0: time.sleep(delay)
+
+
+class FileBackend(Backend):
+    """
+    Writes the audio to `filelike`, as a wav file, or as raw PCM if `format` is `'raw'`.
+    """
+
+    def run(self, engine):
+        filelike = self.options['filelike']
+        period = self.options.get('period', config.block_size)
+        if self.options.get('format', 'wav') == 'wav':
+            wfile, infos = wav.open_write_mode(filelike, config.frame_rate, engine.channel_count)
+            write = wfile.writeframes
+        else:
+            wfile = None
+            write = filelike.write
+
+        done = False
+        while not done:
+            data, done = engine.read(period, wait=True)
+            write(data)
+        if wfile is not None: wfile.close()
+
+
+def register(name, backend_class):
+    """
+    Registers `backend_class`, so it can be used with `stream.playback(source, backend=name)`.
+    """
+    _registry[name] = backend_class
+
+
+def get(name, **options):
+    """
+    Creates an instance of the backend registered as `name`.
+    """
+    try:
+        backend_class = _registry[name]
+    except KeyError:
+        raise ValueError('unknown backend %s' % name)
+    return backend_class(**options)
+
+
+_registry = {}
+register('pyaudio', PyAudioBackend)
+register('null', NullBackend)
+register('paced', PacedBackend)
+register('file', FileBackend)
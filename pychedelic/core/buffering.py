@@ -1,4 +1,162 @@
+import sys
+import threading
+import collections
+
 import numpy
+from numpy.lib.stride_tricks import as_strided
+
+
+class Silence(numpy.ndarray):
+    """
+    Block of silence. It is a read-only array of zeros, which doesn't use any memory,
+    so it can be used anywhere a block is expected. Stages which know about it
+    (`Buffer`, `stream.mixer`, `stream.resample`, `stream.to_raw`, `stream.write_wav`)
+    can skip their work. Slices of a silent block are silent blocks as well,
+    while the results of computations and copies are normal arrays.
+    Create silent blocks with `silence`. Stages only return silent blocks
+    when their input was silent : padding, or the output of a mixer without sources,
+    are normal writable arrays, so code which doesn't use `silence` never gets read-only blocks.
+    """
+
+    def __array_wrap__(self, obj, context=None, return_scalar=False):
+        if obj.shape == (): return obj[()]
+        return obj.view(numpy.ndarray)
+
+    def copy(self, order='C'):
+        return numpy.array(self, order=order)
+
+
+def silence(frame_count, channel_count, dtype=float):
+    """
+    Returns a silent block of shape `(frame_count, channel_count)`.
+    """
+    block = as_strided(numpy.zeros(1, dtype=dtype),
+        shape=(int(frame_count), channel_count), strides=(0, 0)).view(Silence)
+    block.flags.writeable = False
+    return block
+
+
+def is_silent(block):
+    """
+    Returns `True` if `block` is known to be silent, without looking at the samples.
+    Only read-only blocks with no strides are, since some numpy functions
+    (e.g. `astype`, `repeat`) return writable copies which are still `Silence` instances.
+    """
+    return (isinstance(block, Silence) and not block.flags.writeable
+        and not any(block.strides))
+
+
+class BlockPool(object):
+    """
+    Pool of blocks, to reuse the memory of the blocks which are not needed anymore
+    instead of allocating new ones. Blocks are kept by `(frames, channels, dtype)`,
+    at most `max_blocks` for each, and at most `max_bytes` in total : when the pool
+    is full, the blocks of the shapes least recently used are freed first.
+
+    Stages get their output blocks with `acquire`. The consumer of a block owns it,
+    and when done with it, can give it back with `release`. A block is only taken back
+    if the caller holds the only reference to it, so releasing a block still
+    used elsewhere (including through views) is safe, it is simply not reused.
+    """
+
+    def __init__(self, max_blocks=16, max_bytes=32 * 1024 * 1024):
+        self.max_blocks = max_blocks
+        self.max_bytes = max_bytes
+        self._free = collections.OrderedDict()       # {(frames, channels, dtype): [block, ...]}, least recently used first
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._hits = 0
+        self._released = 0
+        self._rejected = 0
+        self._resident_bytes = 0
+
+    def acquire(self, frame_count, channel_count, dtype='float64', zeros=False):
+        """
+        Returns a block of shape `(frame_count, channel_count)`. Its content is undefined
+        unless `zeros` is `True`.
+        """
+        key = (int(frame_count), channel_count, numpy.dtype(dtype))
+        with self._lock:
+            self._acquired += 1
+            free = self._free.pop(key, None)
+            if free:
+                self._hits += 1
+                block = free.pop()
+                self._resident_bytes -= block.nbytes
+                if free: self._free[key] = free
+            else: block = None
+        if block is None: block = numpy.empty(key[:2], dtype=key[2])
+        if zeros: block.fill(0)
+        return block
+
+    def release(self, block):
+        """
+        Gives `block` back to the pool. The caller must not use it, nor keep any reference to it afterwards.
+        Returns `True` if the block will be reused, and only then counts it as released.
+        """
+        # References : `block` in the caller, in this function, and the argument of `getrefcount`.
+        if sys.getrefcount(block) > _SINGLE_OWNER_REFCOUNT or type(block) is not numpy.ndarray \
+                or block.base is not None or block.ndim != 2 or not block.flags.c_contiguous \
+                or not block.flags.writeable:
+            with self._lock: self._rejected += 1
+            return False
+        if block.nbytes > self.max_bytes: return False
+
+        key = (block.shape[0], block.shape[1], block.dtype)
+        with self._lock:
+            # Moves the key to the end, as the most recently used
+            free = self._free.pop(key, [])
+            self._free[key] = free
+            if len(free) >= self.max_blocks: return False
+            self._released += 1
+            free.append(block)
+            self._resident_bytes += block.nbytes
+            # Frees the oldest blocks of the least recently used shapes
+            while self._resident_bytes > self.max_bytes:
+                oldest_key = next(iter(self._free))
+                oldest = self._free[oldest_key]
+                self._resident_bytes -= oldest.pop(0).nbytes
+                if not oldest: del self._free[oldest_key]
+        return True
+
+    def clear(self):
+        """
+        Frees all the blocks kept by the pool.
+        """
+        with self._lock:
+            self._free.clear()
+            self._resident_bytes = 0
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of blocks `acquired`, how many were reused (`hits`),
+        the `hit_rate`, the number of blocks `released` and `rejected` because they were
+        still in use, and the `resident_bytes` kept in the pool.
+        """
+        with self._lock:
+            return {
+                'acquired': self._acquired,
+                'hits': self._hits,
+                'hit_rate': self._hits / float(self._acquired) if self._acquired else 0,
+                'released': self._released,
+                'rejected': self._rejected,
+                'resident_bytes': self._resident_bytes
+            }
+
+
+def _count_references(block):
+    return sys.getrefcount(block)
+
+
+def _single_owner_refcount():
+    # The count depends on the Python version, so it is measured with a call like `release(block)`.
+    block = numpy.empty((1, 1))
+    return _count_references(block)
+_SINGLE_OWNER_REFCOUNT = _single_owner_refcount()
+
+
+# Pool used by the streaming stages
+pool = BlockPool()
 
 
 class Buffer(object):
@@ -27,6 +185,76 @@ class Buffer(object):
             return self._make_block_out(self._size)
         else: raise StopIteration
 
+    def peek(self, to_size=1):
+        """
+        Buffers at least `to_size` frames if the source has enough, and returns the list
+        of buffered blocks, starting at the read position. Blocks are views, so nothing
+        is copied, and they must not be modified. Raises `StopIteration` if there is nothing left.
+        """
+        if not self._source_exhausted:
+            while self._size < to_size:
+                try:
+                    block = next(self.source)
+                except StopIteration:
+                    self._source_exhausted = True
+                    break
+                else:
+                    self._blocks.append(block)
+                    self._size += block.shape[0]
+
+        blocks = self._buffered_blocks()
+        if blocks: return blocks
+        else: raise StopIteration
+
+    def drain(self):
+        """
+        Returns all the remaining frames, buffered and from the source, as one single block.
+        If the source advertises how many frames it will generate (with a method
+        `frame_count_hint`), the output is allocated only once. Otherwise, it grows geometrically.
+        Raises `StopIteration` if there is nothing left.
+        """
+        blocks = self._buffered_blocks()
+        self._blocks = []
+        self._size = 0
+        self._read_pos = 0
+        frame_count = None
+        if not self._source_exhausted and hasattr(self.source, 'frame_count_hint'):
+            hint = self.source.frame_count_hint()
+            if hint is not None: frame_count = sum(block.shape[0] for block in blocks) + hint
+        if not blocks:
+            blocks = self.peek()
+            self._blocks = []
+            self._size = 0
+        if frame_count is None: frame_count = 2 * sum(block.shape[0] for block in blocks)
+
+        channel_count = blocks[0].shape[1]
+        capacity = max(frame_count, 1)
+        block_out = numpy.empty((capacity, channel_count), dtype=numpy.result_type(*blocks))
+        write_pos = 0
+
+        while True:
+            if blocks: block = blocks.pop(0)
+            elif self._source_exhausted: break
+            else:
+                try:
+                    block = next(self.source)
+                except StopIteration:
+                    self._source_exhausted = True
+                    break
+            next_pos = write_pos + block.shape[0]
+            if next_pos > capacity:
+                capacity = max(2 * capacity, next_pos)
+                # `block_out` is not referenced anywhere else, so it can be resized in place.
+                block_out.resize((capacity, channel_count), refcheck=False)
+            if not numpy.can_cast(block.dtype, block_out.dtype):
+                block_out = block_out.astype(numpy.result_type(block.dtype, block_out.dtype))
+            block_out[write_pos:next_pos] = block
+            write_pos = next_pos
+
+        if write_pos < capacity:
+            block_out.resize((write_pos, channel_count), refcheck=False)
+        return block_out
+
     def pull(self, block_size, overlap=0, pad=False):
         if overlap and overlap > block_size:
             raise ValueError('overlap cannot be more than block_size')
@@ -54,7 +282,7 @@ class Buffer(object):
             if self._size > 0:
                 if pad is True:
                     channel_count = self._blocks[0].shape[1]
-                    self._blocks.append(numpy.zeros((block_size - self._size, channel_count)))
+                    self._blocks.append(numpy.zeros((int(block_size - self._size), channel_count)))
                 else: block_out_size = numpy.ceil(self._size)
             else:
                 raise StopIteration
@@ -75,30 +303,95 @@ class Buffer(object):
         return block_out
 
     def pull_all(self):
-        blocks = []
-        while True:
-            try:
-                blocks.append(next(self.source))
-            except StopIteration:
-                break
-        return numpy.concatenate(blocks, axis=0)
+        return self.drain()
+
+    def _buffered_blocks(self):
+        """
+        Returns the list of the blocks in `_blocks` from `_read_pos`, as views.
+        """
+        if not self._blocks: return []
+        blocks = [self._blocks[0][int(numpy.floor(self._read_pos)):]] + self._blocks[1:]
+        return [block for block in blocks if block.shape[0]]
 
     def _make_block_out(self, block_size):
         """
         Helper function to create the output block by consuming data from `_blocks` at `_read_pos`.
+        If all the data consumed is silent, a silent block is returned.
         """
         channel_count = self._blocks[0].shape[1]
-        block_out = numpy.zeros((block_size, channel_count))
         read_pos = numpy.floor(self._read_pos)
+        pieces = []                     # (write position, slice of a block)
         write_pos = 0
         i = 0
 
         while write_pos < block_size:
             block = self._blocks[i]
             to_read = min(block.shape[0] - read_pos, block_size - write_pos)
-            block_out[write_pos:write_pos+to_read,:] = block[read_pos:read_pos+to_read,:]
+            pieces.append((write_pos, block[read_pos:read_pos+to_read,:]))
             write_pos += to_read
             read_pos = 0
             i += 1
 
-        return block_out
\ No newline at end of file
+        if all(is_silent(piece) for write_pos, piece in pieces):
+            return silence(block_size, channel_count)
+        block_out = pool.acquire(block_size, channel_count)
+        for write_pos, piece in pieces:
+            if is_silent(piece): block_out[write_pos:write_pos+piece.shape[0],:] = 0
+            else: block_out[write_pos:write_pos+piece.shape[0],:] = piece
+        return block_out
+
+
+class RingBuffer(object):
+    """
+    Preallocated ring of int16 frames, written by one producer thread
+    and read by one consumer thread. Positions only ever grow, and each one
+    is modified by a single thread, so no lock is needed.
+    """
+
+    def __init__(self, frame_count, channel_count):
+        self.frame_count = frame_count
+        self.channel_count = channel_count
+        self._data = numpy.zeros((frame_count, channel_count), dtype='int16')
+        self._write_pos = 0             # total number of frames written
+        self._read_pos = 0              # total number of frames read
+
+    @property
+    def available(self):
+        """
+        Number of frames that can be read.
+        """
+        return self._write_pos - self._read_pos
+
+    @property
+    def space(self):
+        """
+        Number of frames that can be written.
+        """
+        return self.frame_count - self.available
+
+    def write(self, block):
+        """
+        Writes the int16 `block` to the ring. `block` must fit in the available space.
+        """
+        frame_count = block.shape[0]
+        if frame_count > self.space:
+            raise ValueError('block of %s frames does not fit, only %s frames available'
+              % (frame_count, self.space))
+        start = self._write_pos % self.frame_count
+        first = min(frame_count, self.frame_count - start)
+        self._data[start:start+first] = block[:first]
+        self._data[:frame_count-first] = block[first:]
+        self._write_pos += frame_count
+
+    def read(self, frame_count):
+        """
+        Reads at most `frame_count` frames, and returns them as a byte string.
+        """
+        frame_count = min(frame_count, self.available)
+        start = self._read_pos % self.frame_count
+        first = min(frame_count, self.frame_count - start)
+        data = self._data[start:start+first].tobytes()
+        if first < frame_count:
+            data += self._data[:frame_count-first].tobytes()
+        self._read_pos += frame_count
+        return data
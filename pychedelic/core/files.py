@@ -1,9 +1,23 @@
-from tempfile import NamedTemporaryFile
 import os
+import json
 import math
+import time
+import errno
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
 import numpy as np
 import subprocess
 import types
+import collections
+from contextlib import contextmanager
+
+from ..config import config
+
+
+# Maximum number of file hashes remembered
+HASHES_LIMIT = 1024
 
 
 def guess_fileformat(filename):
@@ -16,44 +30,310 @@ def guess_fileformat(filename):
         raise ValueError('unknown file format')
 
 
-def convert_file(filename, to_format, to_filename=None):
+def convert_file(filename, to_format, to_filename=None, options=None, cache=None):
     """
-    Returns None if the file is already of the desired format.
+    Converts `filename` to `to_format` with avconv. `options` is a list of extra
+    output options for avconv, e.g. `['-ar', '44100']`.
+    Returns `filename` if the file is already of the desired format.
+
+    Converted files are kept in `cache` (by default, the cache in `config.conversion_cache`),
+    so converting the same file again is done right away.
+    If `to_filename` is given, the converted file is copied there. Otherwise, a new file
+    is returned, which is a hard link to the file in the cache, so it stays valid when
+    the cache evicts that file. That file belongs to the caller, who should remove it
+    once done with it (see `converted`). It counts in the size of the cache until then,
+    and if the process dies without removing it, it is removed by the next eviction.
+    Raises `ConversionError` if the conversion failed.
     """
     fileformat = guess_fileformat(filename)
-    if fileformat == to_format:
+    if fileformat == to_format and not options:
         if to_filename:
             shutil.copy(filename, to_filename)
             return to_filename
         else:
             return filename
 
-    # Copying source file to a temporary file
-    # TODO: why copying ?
-    origin_file = NamedTemporaryFile(mode='wb', delete=True)
-    with open(filename, 'r') as fd:
-        while True:
-            copy_buffer = fd.read(1024*1024)
-            if copy_buffer: origin_file.write(copy_buffer)
-            else: break
-    origin_file.flush()
-
-    # Converting the file to wav
-    if to_filename is None:
-        dest_file = NamedTemporaryFile(mode='rb', delete=False)
-        to_filename = dest_file.name
+    cache = cache or get_cache()
+    if to_filename: return _convert(filename, to_format, to_filename, False, options, cache)
+    out_filename = cache.output_filename(to_format)
+    try:
+        return _convert(filename, to_format, out_filename, True, options, cache)
+    except BaseException:
+        _remove(out_filename)
+        raise
+
+
+@contextmanager
+def converted(filename, to_format, options=None, cache=None):
+    """
+    Context manager converting `filename` with `convert_file`, and removing
+    the converted file on exit :
+
+        with converted('song.mp3', 'wav') as wav_filename:
+            samples, infos = chunk.read_wav(wav_filename)
+    """
+    out_filename = convert_file(filename, to_format, options=options, cache=cache)
+    try:
+        yield out_filename
+    finally:
+        if out_filename != filename: _remove(out_filename)
+
+
+def convert_many(filenames, to_format, options=None, processes=None, cache=None):
+    """
+    Converts all `filenames` to `to_format`, with a pool of `processes` worker processes
+    (by default, one per CPU). Returns the list of converted files, in the same order
+    as `filenames` (see `convert_file`). Raises `ConversionError` if a conversion failed.
+    """
+    cache = cache or get_cache()
+    # Converted files are created here, so they belong to this process rather than to the workers
+    jobs = []
+    for filename in filenames:
+        if guess_fileformat(filename) == to_format and not options: out_filename = None
+        else: out_filename = cache.output_filename(to_format)
+        jobs.append((filename, to_format, out_filename, options, cache))
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_convert_job, jobs, chunksize=1)
+    except BaseException:
+        for job in jobs:
+            if job[2] is not None: _remove(job[2])
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class ConversionCache(object):
+    """
+    Cache of converted files, in `directory`. Files are identified by the hash of
+    their content, the target format and the conversion options.
+    When the cache exceeds `max_size` bytes, the least recently used files are removed,
+    and files not used for `max_age` seconds are removed as well.
+    Files are published with an atomic rename, so several processes can share a cache.
+    Since another process can evict a file at any time, files should be used
+    through `checkout` rather than through their path in the cache.
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        if not os.path.isdir(directory):
+            try: os.makedirs(directory)
+            except OSError as err:
+                if err.errno != errno.EEXIST: raise
+
+    def key(self, filename, to_format, options=None):
+        """
+        Returns the cache key for converting `filename` to `to_format` with `options`.
+        """
+        content_hash = _hash_file(filename)
+        options_hash = hashlib.sha1(json.dumps([to_format, options or []]).encode('utf8')).hexdigest()
+        return hashlib.sha1((content_hash + options_hash).encode('utf8')).hexdigest()
+
+    def get(self, key, to_format):
+        """
+        Returns the path of the cached file for `key`, or `None`.
+        """
+        path = self._path(key, to_format)
+        try:
+            # Modification time is used to know which files were used the least recently
+            os.utime(path, None)
+        except OSError as err:
+            if err.errno == errno.ENOENT: return None
+            raise
+        return path
+
+    def checkout(self, key, to_format, to_filename, link=False):
+        """
+        Copies the cached file for `key` to `to_filename` and returns `to_filename`,
+        or returns `None` if there is no such file. If `link` is `True`, `to_filename`
+        is a hard link to the cached file instead of a copy, and must be on the same file system.
+        """
+        path = self.get(key, to_format)
+        if path is None: return None
+        try:
+            if link: _link(path, to_filename)
+            else: shutil.copy(path, to_filename)
+        except (OSError, IOError) as err:
+            # Evicted by another process since `get`
+            if err.errno == errno.ENOENT and not os.path.exists(path): return None
+            raise
+        return to_filename
+
+    def put(self, key, to_format, filename):
+        """
+        Moves `filename` in the cache as `key`, and returns its new path.
+        `filename` must be on the same file system as the cache, see `temp_filename`.
+        """
+        path = self._path(key, to_format)
+        os.rename(filename, path)
+        self.evict(keep=[path])
+        return path
+
+    def temp_filename(self, to_format, prefix='.tmp-'):
+        """
+        Returns the name of a new temporary file in the cache directory.
+        Files whose name starts with a dot are not part of the cache.
+        """
+        fd, filename = tempfile.mkstemp(dir=self.directory, prefix=prefix, suffix='.' + to_format)
+        os.close(fd)
+        return filename
+
+    def output_filename(self, to_format):
+        """
+        Returns the name of a new file in the cache directory, for a converted file
+        handed out to the current process.
+        """
+        return self.temp_filename(to_format, prefix='.out-%s-' % os.getpid())
+
+    def evict(self, keep=()):
+        """
+        Removes the files older than `max_age`, then the least recently used files
+        until the cache is smaller than `max_size`. The files in `keep` are not removed.
+        Converted files handed out (see `output_filename`) count in the size of the cache.
+        Files still in use by a process are not removed, but those of the processes that died are.
+        """
+        names = os.listdir(self.directory)
+        for name in names:
+            if name.startswith('.out-') and not _is_alive(int(name.split('-')[1])):
+                _remove(os.path.join(self.directory, name))
+        if self.max_size is None and self.max_age is None: return
+
+        entries = []
+        used = {}                       # {inode: size} of all the files, counting hard links once
+        for name in names:
+            if name.startswith('.tmp-'): continue
+            try: stat = os.stat(os.path.join(self.directory, name))
+            except OSError: continue
+            used[(stat.st_dev, stat.st_ino)] = stat.st_size
+            if not name.startswith('.'):
+                entries.append((stat.st_mtime, stat.st_size, stat.st_nlink, name))
+        entries.sort()
+
+        now = time.time()
+        total_size = sum(used.values())
+        for mtime, size, link_count, name in entries:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_size is not None and total_size > self.max_size
+            if not (too_old or too_big): break
+            # Files handed out are hard links, so removing them from the cache frees nothing
+            if os.path.join(self.directory, name) in keep or link_count > 1: continue
+            _remove(os.path.join(self.directory, name))
+            total_size -= size
+
+    def _path(self, key, to_format):
+        return os.path.join(self.directory, '%s.%s' % (key, to_format))
+
+
+def get_cache():
+    """
+    Returns the conversion cache at `config.conversion_cache`.
+    """
+    global _cache
+    if _cache is None or _cache.directory != config.conversion_cache:
+        _cache = ConversionCache(config.conversion_cache,
+            max_size=config.conversion_cache_max_size, max_age=config.conversion_cache_max_age)
+    return _cache
+_cache = None
+
+
+class ConversionError(Exception):
+    """
+    Raised when converting a file failed. `stderr` contains the output of avconv.
+    """
+
+    def __init__(self, message, stderr=''):
+        super(ConversionError, self).__init__(message, stderr)
+        self.message = message
+        self.stderr = stderr
+
+    def __str__(self):
+        return '%s\n%s' % (self.message, self.stderr)
+
+
+def _avconv(filename, fileformat, to_filename, to_format, options=None):
     avconv_call = ['avconv', '-y',
                     '-f', fileformat,
-                    '-i', origin_file.name,  # input options (filename last)
+                    '-i', filename,  # input options (filename last)
                     '-vn',  # Drop any video streams if there are any
-                    '-f', to_format,  # output options (filename last)
+                    '-f', to_format] + list(options or []) + [  # output options (filename last)
                     to_filename
                   ]
-    # TODO: improve to report error properly
+    with tempfile.TemporaryFile() as stderr, open(os.devnull, 'w') as devnull:
+        try:
+            returncode = subprocess.call(avconv_call, stdout=devnull, stderr=stderr)
+        except OSError as err:
+            raise ConversionError('could not run avconv : %s' % err)
+        if returncode != 0:
+            stderr.seek(0)
+            raise ConversionError('converting %s to %s failed' % (filename, to_format),
+                stderr.read().decode('utf8', 'replace'))
+
+
+def _link(filename, to_filename):
+    if os.path.exists(to_filename): os.remove(to_filename)
+    os.link(filename, to_filename)
+
+
+def _convert(filename, to_format, out_filename, link, options, cache):
+    """
+    Converts `filename` through `cache` to `out_filename`, which is a hard link
+    to the file in the cache if `link` is `True`, a copy otherwise.
+    """
+    key = cache.key(filename, to_format, options)
+    if cache.checkout(key, to_format, out_filename, link=link) is None:
+        temp_filename = cache.temp_filename(to_format)
+        try:
+            _avconv(filename, guess_fileformat(filename), temp_filename, to_format, options)
+            # Checked out before it is published, so it cannot be evicted in between
+            if link: _link(temp_filename, out_filename)
+            else: shutil.copy(temp_filename, out_filename)
+            cache.put(key, to_format, temp_filename)
+        finally:
+            _remove(temp_filename)
+    return out_filename
+
+
+def _convert_job(job):
+    filename, to_format, out_filename, options, cache = job
+    if out_filename is None: return filename
+    return _convert(filename, to_format, out_filename, True, options, cache)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT: raise
+
+
+def _is_alive(pid):
     try:
-        subprocess.check_call(avconv_call, stdout=open(os.devnull,'w'), stderr=open(os.devnull,'w'))
-    except subprocess.CalledProcessError:
-        raise 
-    origin_file.close()
-    return to_filename
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
 
+
+def _hash_file(filename):
+    """
+    Returns the sha1 of the content of `filename`. The hashes of the last
+    `HASHES_LIMIT` files are remembered, as long as the files don't change.
+    """
+    stat = os.stat(filename)
+    identity = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    if identity in _hashes:
+        _hashes[identity] = _hashes.pop(identity)
+    else:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as fd:
+            while True:
+                copy_buffer = fd.read(1024*1024)
+                if copy_buffer: sha1.update(copy_buffer)
+                else: break
+        if len(_hashes) >= HASHES_LIMIT: _hashes.popitem(last=False)
+        _hashes[identity] = sha1.hexdigest()
+    return _hashes[identity]
+_hashes = collections.OrderedDict() # least recently used first
@@ -0,0 +1,240 @@
+import os
+import json
+import math
+import tempfile
+
+import numpy
+try:
+    from scipy import signal
+except ImportError:
+    signal = None
+
+from ..config import config
+
+
+# Length of the gating blocks and of their hop, in seconds. See ITU-R BS.1770-4
+GATING_BLOCK_DURATION = 0.4
+GATING_HOP_DURATION = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+TRUE_PEAK_OVERSAMPLING = 4
+
+
+class Meter(object):
+    """
+    Measures loudness as described in ITU-R BS.1770 / EBU R128, in one pass.
+    Blocks of samples are fed to the meter with `process`. Example of usage :
+
+        meter = Meter(channel_count=2, frame_rate=44100)
+        for block in stream.read_wav('file.wav'):
+            meter.process(block)
+        meter.integrated    # integrated loudness in LUFS
+        meter.true_peak     # true-peak in dBTP
+
+    `channel_weights` are the weights applied to each channel when summing them,
+    by default 1 for all channels.
+    """
+
+    def __init__(self, channel_count, frame_rate=None, channel_weights=None):
+        if signal is None:
+            raise ImportError('Please install scipy if you want to measure loudness')
+        self.channel_count = channel_count
+        self.frame_rate = frame_rate or config.frame_rate
+        if channel_weights is None:
+            channel_weights = numpy.ones(channel_count)
+        self.channel_weights = numpy.asarray(channel_weights, dtype='float64')
+
+        # K-weighting filter, and its state
+        self._k_b, self._k_a = k_weighting_filter(self.frame_rate)
+        self._k_state = numpy.zeros((len(self._k_b) - 1, channel_count))
+
+        # True-peak interpolation filter (one phase per row), and its state
+        self._tp_phases = true_peak_filter(TRUE_PEAK_OVERSAMPLING)
+        self._tp_state = numpy.zeros((TRUE_PEAK_OVERSAMPLING, self._tp_phases.shape[1] - 1, channel_count))
+        self._peak = 0
+
+        # Mean squares are computed for each gating hop, then combined into gating blocks.
+        self._hop_size = int(round(GATING_HOP_DURATION * self.frame_rate))
+        self._hops_per_block = int(round(GATING_BLOCK_DURATION / GATING_HOP_DURATION))
+        self._hop_sums = []                 # list of arrays of sums of squares, one row per hop
+        self._partial_sum = numpy.zeros(channel_count)
+        self._partial_count = 0
+
+    def process(self, block):
+        """
+        Feeds the meter with `block`, array of shape `(frames, channels)`.
+        """
+        if block.shape[1] != self.channel_count:
+            raise ValueError('Received block with %s channels, while meter has %s channels'
+              % (block.shape[1], self.channel_count))
+        if block.shape[0] == 0: return
+
+        # True peak. Each phase of the oversampled signal is filtered separately.
+        for i, phase in enumerate(self._tp_phases):
+            interpolated, self._tp_state[i] = signal.lfilter(phase, [1], block, axis=0, zi=self._tp_state[i])
+            self._peak = max(self._peak, numpy.abs(interpolated).max())
+
+        # Sums of K-weighted squared samples, for each hop.
+        filtered, self._k_state = signal.lfilter(self._k_b, self._k_a, block, axis=0, zi=self._k_state)
+        squares = filtered ** 2
+        pos = 0
+        if self._partial_count:
+            pos = min(self._hop_size - self._partial_count, squares.shape[0])
+            self._partial_sum += squares[:pos].sum(axis=0)
+            self._partial_count += pos
+            if self._partial_count == self._hop_size:
+                self._hop_sums.append(self._partial_sum.reshape((1, self.channel_count)))
+                self._partial_sum = numpy.zeros(self.channel_count)
+                self._partial_count = 0
+        hop_count = (squares.shape[0] - pos) // self._hop_size
+        if hop_count:
+            end = pos + hop_count * self._hop_size
+            self._hop_sums.append(squares[pos:end].reshape(
+                (hop_count, self._hop_size, self.channel_count)).sum(axis=1))
+            pos = end
+        if pos < squares.shape[0]:
+            self._partial_sum += squares[pos:].sum(axis=0)
+            self._partial_count += squares.shape[0] - pos
+
+    @property
+    def integrated(self):
+        """
+        Gated integrated loudness in LUFS, `-inf` if the measured audio is silent
+        or shorter than one gating block.
+        """
+        block_loudness = self._blocks_loudness()
+        gated = block_loudness[block_loudness > ABSOLUTE_GATE]
+        if not gated.size: return float('-inf')
+        relative_gate = _power_to_loudness(_loudness_to_power(gated).mean()) + RELATIVE_GATE
+        gated = gated[gated > relative_gate]
+        if not gated.size: return float('-inf')
+        return _power_to_loudness(_loudness_to_power(gated).mean())
+
+    @property
+    def true_peak(self):
+        """
+        True-peak in dBTP, measured on the signal oversampled 4 times.
+        """
+        if self._peak == 0: return float('-inf')
+        return 20 * math.log10(self._peak)
+
+    def results(self):
+        return {
+            'integrated': self.integrated,
+            'true_peak': self.true_peak
+        }
+
+    def _blocks_loudness(self):
+        """
+        Returns the loudness of all the gating blocks measured so far.
+        """
+        if not self._hop_sums: return numpy.array([])
+        hop_sums = numpy.concatenate(self._hop_sums)
+        self._hop_sums = [hop_sums]
+        block_count = hop_sums.shape[0] - self._hops_per_block + 1
+        if block_count <= 0: return numpy.array([])
+        cumulated = numpy.vstack([numpy.zeros((1, self.channel_count)), hop_sums.cumsum(axis=0)])
+        mean_squares = (cumulated[self._hops_per_block:] - cumulated[:block_count]) \
+            / (self._hops_per_block * self._hop_size)
+        return _power_to_loudness((mean_squares * self.channel_weights).sum(axis=1))
+
+
+class Cache(object):
+    """
+    Persistent cache of loudness measurements, stored as JSON in `path`.
+    Files are identified by their absolute path, size and modification time,
+    so a file that changed is measured again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+
+    def get(self, filename):
+        return self._load().get(_file_identity(filename))
+
+    def set(self, filename, results):
+        self._load()[_file_identity(filename)] = results
+        self._save()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as fd:
+                    self._entries = json.load(fd)
+            except (IOError, OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        # Write to a temporary file first, so the cache is never left half-written
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(dirname): os.makedirs(dirname)
+        fd, temp_path = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(self._entries, temp_file)
+        os.rename(temp_path, self.path)
+
+
+def get_cache():
+    """
+    Returns the loudness cache at `config.loudness_cache`.
+    """
+    global _cache
+    if _cache is None or _cache.path != config.loudness_cache:
+        _cache = Cache(config.loudness_cache)
+    return _cache
+_cache = None
+
+
+def k_weighting_filter(frame_rate):
+    """
+    Returns the coefficients `(b, a)` of the K-weighting filter for `frame_rate`:
+    a high-shelf filter modelling the acoustic effects of the head,
+    followed by a high-pass filter.
+    """
+    # High shelf. Parameters reproduce the coefficients given in BS.1770 for 48kHz.
+    gain, q, freq = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    K = math.tan(math.pi * freq / frame_rate)
+    Vh = 10 ** (gain / 20.0)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / q + K * K
+    shelf_b = [(Vh + Vb * K / q + K * K) / a0, 2 * (K * K - Vh) / a0, (Vh - Vb * K / q + K * K) / a0]
+    shelf_a = [1, 2 * (K * K - 1) / a0, (1 - K / q + K * K) / a0]
+
+    # High pass
+    q, freq = 0.5003270373238773, 38.13547087602444
+    K = math.tan(math.pi * freq / frame_rate)
+    a0 = 1 + K / q + K * K
+    highpass_b = [1, -2, 1]
+    highpass_a = [1, 2 * (K * K - 1) / a0, (1 - K / q + K * K) / a0]
+
+    b = numpy.convolve(shelf_b, highpass_b)
+    a = numpy.convolve(shelf_a, highpass_a)
+    return b / a[0], a / a[0]
+
+
+def true_peak_filter(oversampling, taps_per_phase=12):
+    """
+    Returns the polyphase interpolation filter used for true-peak measurement,
+    array of shape `(oversampling, taps_per_phase)`.
+    """
+    size = oversampling * taps_per_phase
+    x = (numpy.arange(size) - (size - 1) / 2.0) / oversampling
+    taps = numpy.sinc(x) * numpy.kaiser(size, 8)
+    phases = taps.reshape((taps_per_phase, oversampling)).transpose()
+    return phases / phases.sum(axis=1).reshape((oversampling, 1))
+
+
+def _file_identity(filename):
+    stat = os.stat(filename)
+    return '%s:%s:%s' % (os.path.abspath(filename), stat.st_size, int(stat.st_mtime * 1e6))
+
+
+def _power_to_loudness(power):
+    with numpy.errstate(divide='ignore'):
+        return -0.691 + 10 * numpy.log10(power)
+
+
+def _loudness_to_power(loudness):
+    return 10 ** ((loudness + 0.691) / 10)
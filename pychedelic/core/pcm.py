@@ -1,6 +1,12 @@
+import threading
+
 import numpy
 
 
+# Maximum number of samples converted at once, which is the size of the scratch buffers
+SCRATCH_SIZE = 2**16
+
+
 def samples_to_string(samples):
     """
     Takes a float32 numpy array, containing audio samples in the range [-1, 1],
@@ -8,7 +14,7 @@ def samples_to_string(samples):
     `samples` can be stereo, mono, or a one-dimensional array (thus mono).
     """
     return float_to_int(samples).tostring()
-    
+
 
 def string_to_samples(string, channel_count):
     """
@@ -21,12 +27,89 @@ def string_to_samples(string, channel_count):
     return samples.reshape([frame_count, channel_count])
 
 
-def float_to_int(samples):
-    samples = samples.astype(numpy.float32) * 2**15
-    return samples.clip(-2**15, 2**15 - 1).astype(numpy.int16)
+def float_to_int(samples, out=None, dither=None):
+    """
+    Converts float samples in range [-1, 1] to int16. Scaling, dithering, rounding
+    and clipping are all done in place in a scratch buffer, which is reused between calls.
+    Big arrays are converted by chunks of frames, so the scratch buffer stays small.
+    If `out` is given (int16 array with the same shape as `samples`), the result
+    is written there, and no memory is allocated.
+    `dither` is an optional `Dither`, adding noise before rounding.
+    """
+    if out is None:
+        out = numpy.empty(samples.shape, dtype='int16')
+    if samples.size <= SCRATCH_SIZE:
+        _float_to_int(samples, out, dither)
+    else:
+        step = max(SCRATCH_SIZE // (samples.size // samples.shape[0]), 1)
+        for start in range(0, samples.shape[0], step):
+            _float_to_int(samples[start:start+step], out[start:start+step], dither)
+    return out
 
 
-def int_to_float(samples):
-    samples = samples / float(2**15)
-    samples.astype(numpy.float32)
-    return samples
\ No newline at end of file
+def _float_to_int(samples, out, dither):
+    scaled = _get_scratch(samples.size).reshape(samples.shape)
+    numpy.multiply(samples, 2**15, out=scaled)
+    if dither is not None:
+        dither.add_noise(scaled)
+    numpy.rint(scaled, out=scaled)
+    numpy.clip(scaled, -2**15, 2**15 - 1, out=scaled)
+    out[...] = scaled
+
+
+def int_to_float(samples, out=None):
+    """
+    Converts int16 samples to floats in range [-1, 1]. If `out` is given
+    (float array with the same shape as `samples`), the result is written there.
+    """
+    if out is None: return numpy.multiply(samples, 1.0 / 2**15)
+    # Scale factor of the same type as `out`, to avoid an intermediate float64 result
+    return numpy.multiply(samples, out.dtype.type(1.0 / 2**15), out=out)
+
+
+class Dither(object):
+    """
+    Dither noise, added to the samples before they are rounded to 16 bits.
+    Each stream should have its own `Dither`, which keeps its random state.
+
+        - `'tpdf'` : triangular probability density function noise, of 2 LSB peak-to-peak.
+        - `'highpass'` : TPDF noise computed as the difference of successive uniform values.
+          Its spectrum rises with frequency, which is a simple form of noise shaping,
+          moving the noise away from the frequencies where the ear is the most sensitive.
+    """
+
+    def __init__(self, kind='tpdf', seed=None):
+        if not kind in ('tpdf', 'highpass'):
+            raise ValueError('unknown dither %s' % kind)
+        self.kind = kind
+        self.random = numpy.random.RandomState(seed)
+        self._previous = None           # last uniform values, for highpass dither
+
+    def add_noise(self, scaled):
+        """
+        Adds dither noise in place to `scaled`, samples already scaled to the int16 range.
+        """
+        if self.kind == 'tpdf':
+            scaled += self.random.random_sample(scaled.shape)
+            scaled -= self.random.random_sample(scaled.shape)
+        else:
+            shape = scaled.shape
+            scaled = scaled.reshape((shape[0], -1))
+            uniform = self.random.random_sample((shape[0] + 1, scaled.shape[1]))
+            if self._previous is not None and self._previous.shape == (scaled.shape[1],):
+                uniform[0] = self._previous
+            self._previous = uniform[-1].copy()
+            scaled += uniform[1:]
+            scaled -= uniform[:-1]
+
+
+def _get_scratch(size):
+    """
+    Returns a float32 buffer of `size` elements. The buffer is reused between calls,
+    and there is one per thread. `size` is at most `SCRATCH_SIZE`, unless frames are bigger.
+    """
+    scratch = getattr(_local, 'scratch', None)
+    if scratch is None or scratch.size < size:
+        scratch = _local.scratch = numpy.empty(size, dtype='float32')
+    return scratch[:size]
+_local = threading.local()
@@ -0,0 +1,159 @@
+import time
+import threading
+
+import numpy
+
+from . import buffering
+from . import pcm
+from ..config import config
+
+
+class Engine(object):
+    """
+    Renders `source` ahead of the audio output, in a producer thread.
+    The producer pulls blocks from `source`, converts them to int16 and writes
+    them to a preallocated ring holding `latency` seconds of audio.
+    The audio callback only has to call `read`, which copies bytes out of the ring,
+    so a slow stage upstream or a GC pause doesn't cause a dropout.
+
+        engine = Engine(source, channel_count=2, latency=0.2)
+        engine.start()
+        ...
+        data, done = engine.read(frame_count)   # from the audio callback
+
+    Attributes for monitoring :
+
+        - `underruns` : number of reads for which the ring didn't have enough frames
+        - `overruns` : number of times the producer had to wait for space in the ring
+        - `callback_times` : `Histogram` of the durations of the calls to `read`
+    """
+
+    def __init__(self, source, channel_count, latency=0.1, block_size=None):
+        frame_count = max(int(round(latency * config.frame_rate)), 1)
+        self.ring = buffering.RingBuffer(frame_count, channel_count)
+        self.block_size = min(block_size or config.block_size, frame_count)
+        self.channel_count = channel_count
+        self.underruns = 0
+        self.overruns = 0
+        self.callback_times = Histogram()
+        self._encoded = numpy.empty((self.block_size, channel_count), dtype='int16')
+        if isinstance(source, buffering.Buffer): self._source = source
+        else: self._source = buffering.Buffer(source)
+        self._source_exhausted = False
+        self._error = None              # exception raised by the source in the producer thread
+        self._stopped = False
+        self._space_event = threading.Event()
+        self._data_event = threading.Event()
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+
+    def start(self):
+        """
+        Fills the ring, then starts rendering in the producer thread.
+        """
+        while not self._source_exhausted and self.ring.space >= self.block_size:
+            self._render_block()
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the producer thread. If the source raised an error which wasn't raised
+        by `read` yet, it is raised here.
+        """
+        self._stopped = True
+        self._space_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._raise_error()
+
+    def read(self, frame_count, wait=False):
+        """
+        Reads `frame_count` frames, and returns a tuple `(data, done)`,
+        where `data` is a byte string and `done` is `True` when all the audio has been read.
+        If the producer is late, the missing frames are replaced with silence,
+        unless `wait` is `True`, in which case this waits for the producer.
+        If the source raised an error, it is raised once all the audio before it has been read.
+        """
+        if self.ring.available == 0: self._raise_error()
+        started = time.time()
+        frame_size = 2 * self.channel_count
+        data = self.ring.read(frame_count)
+        if wait:
+            # Read in several times, to free space for the producer in between
+            while len(data) < frame_count * frame_size and not self._source_exhausted:
+                self._space_event.set()
+                self._data_event.wait(0.01)
+                self._data_event.clear()
+                data += self.ring.read(frame_count - len(data) // frame_size)
+            data += self.ring.read(frame_count - len(data) // frame_size)
+        missing = frame_count - len(data) // frame_size
+        finished = self._source_exhausted and self.ring.available == 0
+        # With a pending error, the next call raises it instead of finishing
+        done = finished and self._error is None
+        if missing and not finished:
+            self.underruns += 1
+            data += b'\x00' * (missing * frame_size)
+        self._space_event.set()
+        self.callback_times.add(time.time() - started)
+        return data, done
+
+    def stats(self):
+        return {
+            'underruns': self.underruns,
+            'overruns': self.overruns,
+            'callback_times': self.callback_times.counts()
+        }
+
+    def _produce(self):
+        try:
+            while not self._stopped and not self._source_exhausted:
+                if self.ring.space < self.block_size:
+                    self.overruns += 1
+                    self._space_event.wait(self.block_size / float(config.frame_rate))
+                    self._space_event.clear()
+                else:
+                    self._render_block()
+        except Exception as err:
+            # The error is raised in the consumer thread by `read` or `stop`
+            self._error = err
+            self._source_exhausted = True
+            self._data_event.set()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _render_block(self):
+        try:
+            block = self._source.pull(self.block_size)
+        except StopIteration:
+            self._source_exhausted = True
+        else:
+            encoded = self._encoded[:block.shape[0]]
+            self.ring.write(pcm.float_to_int(block, out=encoded))
+            buffering.pool.release(block)
+        self._data_event.set()
+
+
+class Histogram(object):
+    """
+    Histogram of durations in seconds, with bins growing in powers of 2,
+    from `2**min_exponent` to `2**max_exponent` seconds.
+    """
+
+    def __init__(self, min_exponent=-20, max_exponent=0):
+        self.edges = 2.0 ** numpy.arange(min_exponent, max_exponent + 1)
+        self._counts = numpy.zeros(len(self.edges) + 1, dtype='int64')
+        self.max = 0
+
+    def add(self, value):
+        self._counts[numpy.searchsorted(self.edges, value)] += 1
+        self.max = max(self.max, value)
+
+    def counts(self):
+        """
+        Returns a list of tuples `(upper_bound, count)` for all the non-empty bins.
+        """
+        upper_bounds = list(self.edges) + [float('inf')]
+        return [(upper_bounds[i], int(count)) for i, count in enumerate(self._counts) if count]
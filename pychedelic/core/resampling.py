@@ -0,0 +1,138 @@
+from fractions import Fraction
+
+import numpy
+
+
+# Number of zero crossings of the sinc on each side, at the lowest of the 2 rates
+ZERO_CROSSINGS = 16
+KAISER_BETA = 8.6
+# Cutoff frequency, relative to the Nyquist frequency of the lowest of the 2 rates
+ROLLOFF = 0.945
+
+
+class Resampler(object):
+    """
+    Streaming sample rate converter, from `rate_in` to `rate_out`.
+    The conversion ratio is reduced to a fraction `up / down` (for example 147 / 160
+    from 48kHz to 44.1kHz), and a windowed sinc filter is computed for that fraction,
+    split in `up` phases. Filters are cached, so creating a resampler is cheap.
+
+        resampler = Resampler(48000, 44100, channel_count=2)
+        for block in blocks:
+            yield resampler.process(block)
+        yield resampler.flush()
+
+    Blocks can be float, or int16 PCM samples. In the latter case the scaling to [-1, 1]
+    is done by the filter, so the samples are never converted to float first.
+    Output is aligned with the input : frame `n` of the output is at the same time
+    as frame `n * rate_in / rate_out` of the input.
+    """
+
+    def __init__(self, rate_in, rate_out, channel_count):
+        ratio = Fraction(int(rate_out), int(rate_in))
+        self.up, self.down = ratio.numerator, ratio.denominator
+        self.channel_count = channel_count
+        self._phases = get_filter(self.up, self.down)
+        self._taps = self._phases.shape[1]
+        self._half = self._taps // 2
+        self._scaled_phases = {}        # phases with the scaling for each input dtype
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all the frames received, to start resampling a new signal.
+        """
+        self.frames_in = 0             # total number of frames received
+        self.frames_out = 0            # total number of frames returned
+        # Frames kept for the next outputs, starting at frame `_buffer_start` of the input.
+        # The frames before the beginning of the signal are zeros.
+        self._buffer = None
+        self._buffer_start = -(self._half - 1)
+
+    def process(self, block):
+        """
+        Takes a block of shape `(frames, channels)`, and returns all the resampled frames
+        that can be computed so far. Frames need some frames after them to be computed,
+        so the output is delayed and its size varies.
+        """
+        if block.shape[1] != self.channel_count:
+            raise ValueError('Received block with %s channels, while resampler has %s channels'
+              % (block.shape[1], self.channel_count))
+        if self._buffer is None:
+            self._buffer = numpy.zeros((self._half - 1, self.channel_count), dtype=block.dtype)
+        self.frames_in += block.shape[0]
+        self._buffer = numpy.concatenate([self._buffer, block])
+        return self._resample()
+
+    def flush(self):
+        """
+        Returns the last frames of the signal, once all the input has been processed.
+        """
+        if self._buffer is None: return numpy.zeros((0, self.channel_count))
+        total_out = self.output_frame_count(self.frames_in)
+        padding = numpy.zeros((self._half, self.channel_count), dtype=self._buffer.dtype)
+        self._buffer = numpy.concatenate([self._buffer, padding])
+        block_out = self._resample()
+        return block_out[:max(total_out - (self.frames_out - block_out.shape[0]), 0)]
+
+    def output_frame_count(self, input_frame_count):
+        """
+        Returns the number of frames that resampling `input_frame_count` frames will produce.
+        """
+        return -(-input_frame_count * self.up // self.down)
+
+    def _resample(self):
+        # Output frame `n` is at position `n * down / up` in the input.
+        # It is computed from the `taps` input frames around that position,
+        # with the filter phase `(n * down) % up`.
+        last_in = self._buffer_start + self._buffer.shape[0] - 1
+        max_pos = last_in - self._half
+        if max_pos < 0: end_out = self.frames_out
+        else: end_out = max(((max_pos + 1) * self.up - 1) // self.down + 1, self.frames_out)
+
+        positions = numpy.arange(self.frames_out, end_out, dtype='int64') * self.down
+        window_starts = positions // self.up - self._half + 1 - self._buffer_start
+        phases = self._get_phases(self._buffer.dtype)
+        phase_indices = positions % self.up
+        # Accumulate tap by tap, so the memory used stays proportional to the output size
+        block_out = numpy.zeros((positions.shape[0], self.channel_count))
+        for tap in range(self._taps):
+            block_out += phases[phase_indices, tap].reshape((-1, 1)) * self._buffer[window_starts + tap]
+
+        # Discard the frames that are not needed anymore
+        self.frames_out = end_out
+        next_start = (end_out * self.down) // self.up - self._half + 1
+        discard = max(next_start - self._buffer_start, 0)
+        self._buffer = self._buffer[discard:]
+        self._buffer_start += discard
+        return block_out
+
+    def _get_phases(self, dtype):
+        if dtype not in self._scaled_phases:
+            if dtype == numpy.int16: self._scaled_phases[dtype] = self._phases / 2.0**15
+            else: self._scaled_phases[dtype] = self._phases
+        return self._scaled_phases[dtype]
+
+
+def get_filter(up, down):
+    """
+    Returns the polyphase filter for resampling by `up / down`, array of shape `(up, taps)`.
+    Row `p` contains the coefficients to apply to the `taps` input frames around
+    an output frame whose position in the input has a fractional part of `p / up`.
+    """
+    key = (up, down)
+    if key not in _filters:
+        # The filter is designed at the rate `up * rate_in`, and cuts at the Nyquist frequency
+        # of the lowest of the 2 rates.
+        taps = 2 * int(numpy.ceil(ZERO_CROSSINGS * max(1, down / float(up))))
+        half_length = taps // 2 * up
+        cutoff = ROLLOFF * 0.5 / max(up, down)
+        p = numpy.arange(up).reshape((up, 1))
+        j = numpy.arange(taps).reshape((1, taps))
+        m = p + (taps // 2 - 1 - j) * up
+        window = numpy.i0(KAISER_BETA * numpy.sqrt(numpy.clip(1 - (m / float(half_length)) ** 2, 0, 1)))
+        phases = numpy.sinc(2 * cutoff * m) * window
+        # Normalize each phase for unity gain at DC
+        _filters[key] = phases / phases.sum(axis=1).reshape((up, 1))
+    return _filters[key]
+_filters = {}
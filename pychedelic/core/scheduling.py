@@ -1,3 +1,7 @@
+import bisect
+
+import numpy
+
 from ..config import config
 
 
@@ -25,11 +29,23 @@ class Clock(object):
 
                 # Pull all frames until next event
                 yield buffered_source.pull(next_size) * context['gain']
+
+    To avoid cutting blocks too small when events are close to each other,
+    events can be quantized. Events scheduled less than `tolerance` frames after the
+    current frame are executed right away, and blocks are never shorter than
+    `min_block_size` frames, even if this makes events late. The timing errors
+    caused are reported by `stats`.
     """
 
-    def __init__(self):
+    def __init__(self, min_block_size=0, tolerance=0):
         self.current_frame = 0
+        self.min_block_size = min_block_size
+        self.tolerance = tolerance
         self._events = []
+        self._event_count = 0
+        self._moved_count = 0
+        self._total_error = 0
+        self._max_error = 0
 
     def run_after(self, dur, func, args=None, kwargs=None):
         """
@@ -54,15 +70,133 @@ class Clock(object):
         If `force` is `True`, the clock will be advanced from exactly `max_frames`, even if it causes
         some events to be overdue.
         """
-        # Execute events whose time has come
-        while self._events and self._events[0]['time'] <= self.current_frame:
+        # Execute events whose time has come, or is within tolerance
+        while self._events and self._events[0]['time'] <= self.current_frame + self.tolerance:
             event = self._events.pop(0)
+            self._record_error(self.current_frame - event['time'])
             event['func'](*event['args'], **event['kwargs'])
 
         # Calculate how many frames we can run before we meet the next event.
         if self._events and force is False:
             next_event = self._events[0]
             advance_frames = min(max_frames, next_event['time'] - self.current_frame)
+            advance_frames = max(advance_frames, min(self.min_block_size, max_frames))
         else: advance_frames = max_frames
         self.current_frame += advance_frames
-        return advance_frames
\ No newline at end of file
+        return advance_frames
+
+    def stats(self):
+        """
+        Returns statistics about the timing of the events executed so far :
+        number of events, number of events executed on a different frame than scheduled,
+        and maximum and mean error in frames.
+        """
+        return {
+            'events': self._event_count,
+            'moved': self._moved_count,
+            'max_error': self._max_error,
+            'mean_error': self._total_error / float(self._event_count) if self._event_count else 0
+        }
+
+    def _record_error(self, error):
+        self._event_count += 1
+        if error:
+            self._moved_count += 1
+            self._total_error += abs(error)
+            self._max_error = max(self._max_error, abs(error))
+
+
+class Lane(object):
+    """
+    Automation lane for a parameter. Changes of the value are scheduled in advance,
+    and `render` returns the values of the parameter for each frame of a block,
+    so they can be applied vectorized, without cutting the block at each change.
+    Example of usage :
+
+        def gain(source):
+            lane = Lane(1)
+            buffered_source = Buffer(source)
+            block_size = 1024
+
+            # Gain jumps to 2 after 1 sec, then goes down linearly to 0 at 3 secs.
+            lane.set_after(1, 2)
+            lane.ramp_after(3, 0)
+
+            while True:
+                block = buffered_source.pull(block_size)
+                yield block * lane.render(block.shape[0])
+    """
+
+    def __init__(self, value=0):
+        self.current_frame = 0
+        self.value = value              # value at `current_frame`
+        self._points = []               # list of (frame, order, value, is_ramp), sorted
+        self._cursor = 0                # index of the first point not rendered yet in `_points`
+        self._order = 0                 # keeps points on the same frame in the order they were added
+
+    def set_after(self, dur, value):
+        """
+        Sets the value to `value` after `dur` seconds.
+        """
+        if dur <= 0:
+            self.value = value
+            return
+        self._add_point(dur, value, False)
+
+    def ramp_after(self, dur, value):
+        """
+        Goes linearly to `value` in `dur` seconds, starting from the previous scheduled change,
+        or from the current frame if there is none.
+        """
+        if dur <= 0:
+            self.value = value
+            return
+        self._add_point(dur, value, True)
+
+    def render(self, frame_count):
+        """
+        Returns the values of the parameter for the next `frame_count` frames,
+        as an array of shape `(frame_count, 1)`, and advances the lane.
+        """
+        end = self.current_frame + frame_count
+        points, start = self._points, self._cursor
+        if start == len(points) or (points[start][0] >= end and not points[start][3]):
+            values = numpy.empty((frame_count, 1))
+            values.fill(self.value)
+            self.current_frame = end
+            return values
+
+        # Break points of a piecewise linear function. A step is a point holding the
+        # previous value one frame before the change.
+        xp, fp = [self.current_frame], [self.value]
+        stop = bisect.bisect_left(points, (end,), start)
+        for frame, order, value, is_ramp in points[start:stop]:
+            if not is_ramp and frame - 1 > xp[-1]:
+                xp.append(frame - 1)
+                fp.append(fp[-1])
+            if frame == xp[-1]: fp[-1] = value
+            else:
+                xp.append(frame)
+                fp.append(value)
+        # Ramp still running at the end of the block
+        if stop < len(points) and points[stop][3]:
+            xp.append(points[stop][0])
+            fp.append(points[stop][2])
+
+        # Points rendered are dropped once they are the majority,
+        # so that removing them doesn't cost more than rendering them.
+        if stop > len(points) // 2:
+            del points[:stop]
+            stop = 0
+        self._cursor = stop
+
+        values = numpy.interp(numpy.arange(self.current_frame, end + 1), xp, fp)
+        self.value = values[-1]
+        self.current_frame = end
+        return values[:-1].reshape((frame_count, 1))
+
+    def _add_point(self, dur, value, is_ramp):
+        frame = int(self.current_frame + round(dur * config.frame_rate))
+        self._order += 1
+        # New points are never before the current frame, so never before the cursor
+        bisect.insort(self._points, (frame, self._order, value, is_ramp), self._cursor)
@@ -2,6 +2,8 @@
 import wave
 import struct
 
+import numpy
+
 from . import pcm
 
 
@@ -49,6 +51,17 @@ def read_block(wfile, block_size):
     return pcm.string_to_samples(wfile.readframes(frame_count), wfile.getnchannels())
 
 
+def read_raw_block(wfile, block_size):
+    """
+    Same as `read_block`, but returns the int16 PCM samples, without converting them.
+    """
+    start_frame = wfile.tell()
+    end_frame = min(start_frame + block_size, wfile.getnframes())
+    frame_count = end_frame - start_frame
+    samples = numpy.frombuffer(wfile.readframes(frame_count), dtype='int16')
+    return samples.reshape((-1, wfile.getnchannels()))
+
+
 def write_block(wfile, block):
     try:
         wfile.writeframes(pcm.samples_to_string(block))
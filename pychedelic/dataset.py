@@ -0,0 +1,180 @@
+import collections
+import multiprocessing
+
+import numpy
+
+from .core import wav
+from .core import pcm
+from . import chunk
+from .config import config
+
+
+# Maximum number of wav files kept open by each worker
+OPEN_FILES_LIMIT = 64
+
+
+class Dataset(object):
+    """
+    Windows of `duration` seconds cut from a set of wav files, every `hop` seconds
+    (by default, windows don't overlap). The index of all the windows is built once
+    from the headers of the files, so files are not parsed again for each window.
+    Example of usage :
+
+        windows = Dataset(filenames, duration=1, hop=0.5, channel_count=1)
+        for samples, segments in windows.batches(32, shuffle=True, processes=4):
+            # `samples` is an array of shape (32, 44100, 1)
+            # `segments` contains the `(file_index, start_frame)` of each window
+            train(samples)
+
+    All the files must have a frame rate of `config.frame_rate`. Windows are up-mixed /
+    down-mixed to `channel_count` channels, by default the channel count of the first file.
+    """
+
+    def __init__(self, filenames, duration, hop=None, channel_count=None):
+        self.filenames = list(filenames)
+        self.frame_count = int(round(duration * config.frame_rate))
+        hop_frames = int(round((hop or duration) * config.frame_rate))
+        if self.frame_count <= 0 or hop_frames <= 0:
+            raise ValueError('duration and hop must be positive')
+
+        segments = []
+        for file_index, filename in enumerate(self.filenames):
+            wfile, infos = wav.open_read_mode(filename)
+            wfile.close()
+            if infos['frame_rate'] != config.frame_rate:
+                raise ValueError('%s has a frame rate of %s, expected %s'
+                  % (filename, infos['frame_rate'], config.frame_rate))
+            if channel_count is None: channel_count = infos['channel_count']
+            starts = numpy.arange(0, infos['frame_count'] - self.frame_count + 1, hop_frames)
+            segments.append(numpy.column_stack([numpy.ones(len(starts)) * file_index, starts]))
+        self.channel_count = channel_count
+        self._reader = None             # `_Reader` used by `read`, keeping the files open
+        # Array of shape (window_count, 2), containing `(file_index, start_frame)` for each window
+        self.segments = numpy.concatenate(segments).astype('int64') if segments \
+            else numpy.zeros((0, 2), dtype='int64')
+
+    def __len__(self):
+        return self.segments.shape[0]
+
+    def read(self, index):
+        """
+        Reads the window `index`, and returns it as a float32 array.
+        The files read are kept open, until `close` is called.
+        """
+        if self._reader is None: self._reader = _Reader(self.filenames, self.channel_count)
+        samples = numpy.empty((self.frame_count, self.channel_count), dtype='float32')
+        self._reader.read(self.segments[index], samples)
+        return samples
+
+    def close(self):
+        """
+        Closes the files kept open by `read`.
+        """
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def batches(self, batch_size, shuffle=False, seed=None, processes=None, prefetch=2):
+        """
+        Iterates over all the windows by batches of `batch_size`. Yields tuples
+        `(samples, segments)`, where `samples` is a float32 array of shape
+        `(batch_size, frames, channels)` (the last batch can be smaller).
+
+        Windows are decoded in advance by a pool of `processes` worker processes
+        (by default, one per CPU, and if `0`, in the current process), `prefetch` batches ahead.
+        Workers write directly to shared memory, so `samples` is only valid until
+        the next batch is requested. Copy it if it needs to be kept.
+        """
+        order = numpy.arange(len(self))
+        if shuffle: numpy.random.RandomState(seed).shuffle(order)
+        batch_indices = [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+
+        # One slot of shared memory for each batch being decoded, plus one for the batch
+        # being used by the caller.
+        slot_count = prefetch + 1
+        slot_shape = (batch_size, self.frame_count, self.channel_count)
+        shared = multiprocessing.RawArray('f', slot_count * int(numpy.prod(slot_shape)))
+        slots = numpy.frombuffer(shared, dtype='float32').reshape((slot_count,) + slot_shape)
+        initargs = (shared, slots.shape, self.filenames, self.channel_count)
+
+        if processes == 0:
+            _init_worker(*initargs)
+            pool = None
+        else: pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs)
+
+        def submit(batch_number):
+            slot = batch_number % slot_count
+            tasks = [(slot, row, self.segments[index]) for row, index in enumerate(batch_indices[batch_number])]
+            if pool is None: result = list(map(_read_window, tasks))
+            else: result = pool.map_async(_read_window, tasks)
+            pending.append((batch_number, result))
+
+        pending = collections.deque()
+        try:
+            for batch_number in range(min(prefetch, len(batch_indices))):
+                submit(batch_number)
+            for batch_number in range(len(batch_indices)):
+                # The slot of the batch yielded before is now free
+                if batch_number + prefetch < len(batch_indices):
+                    submit(batch_number + prefetch)
+                batch_number, result = pending.popleft()
+                if pool is not None: result.get()
+                indices = batch_indices[batch_number]
+                yield slots[batch_number % slot_count][:len(indices)], self.segments[indices]
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            # Without a pool, the worker state is in this process, and keeps the shared memory
+            else: _clear_worker()
+
+
+class _Reader(object):
+    """
+    Reads windows from the files of a dataset, keeping the last files used open.
+    """
+
+    def __init__(self, filenames, channel_count):
+        self.filenames = filenames
+        self.channel_count = channel_count
+        self._files = collections.OrderedDict()
+
+    def read(self, segment, out):
+        file_index, start_frame = segment
+        wfile = self._open(file_index)
+        wfile.setpos(start_frame)
+        samples = wav.read_raw_block(wfile, out.shape[0])
+        pcm.int_to_float(chunk.fix_channel_count(samples, self.channel_count), out=out)
+
+    def _open(self, file_index):
+        if file_index in self._files:
+            wfile = self._files.pop(file_index)
+        else:
+            wfile, infos = wav.open_read_mode(self.filenames[file_index])
+            if len(self._files) >= OPEN_FILES_LIMIT:
+                self._files.popitem(last=False)[1].close()
+        self._files[file_index] = wfile
+        return wfile
+
+    def close(self):
+        while self._files:
+            self._files.popitem()[1].close()
+
+
+def _init_worker(shared, shape, filenames, channel_count):
+    global _slots, _reader
+    _slots = numpy.frombuffer(shared, dtype='float32').reshape(shape)
+    _reader = _Reader(filenames, channel_count)
+_slots = None
+_reader = None
+
+
+def _clear_worker():
+    global _slots, _reader
+    if _reader is not None: _reader.close()
+    _slots = _reader = None
+
+
+def _read_window(task):
+    slot, row, segment = task
+    _reader.read(segment, _slots[slot, row])
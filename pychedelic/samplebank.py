@@ -0,0 +1,193 @@
+import os
+import json
+import glob
+import uuid
+import errno
+import tempfile
+
+import numpy
+
+from .core import wav
+from .core import pcm
+from .core import files
+from .config import config
+
+
+class SampleBank(object):
+    """
+    Samples decoded once in shared memory, and shared between processes.
+    Each sample is stored as float32 in a segment file, which all the processes using
+    the bank `name` memory-map, and get as a read-only numpy array, without copy :
+
+        # Main process
+        bank = SampleBank('drums')
+        bank.load('kick', 'kick.wav')
+
+        # Worker processes
+        bank = SampleBank('drums')
+        samples = bank.get('kick')
+
+    The bank is stored in `directory`, by default `/dev/shm` if it exists (so the segments
+    are in memory), or the temporary directory. Each process using a sample holds
+    a reference to it, and the sample is freed when the last process releases it.
+    References of processes that died without releasing their samples are cleaned up as well.
+    """
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.directory = os.path.join(directory or _default_directory(), 'pychedelic-bank-%s' % name)
+        if not os.path.isdir(self.directory):
+            try: os.makedirs(self.directory)
+            except OSError as err:
+                if err.errno != errno.EEXIST: raise
+        self._attached = {}             # {sample name: (segment name, array)}
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex[:8]  # identifies this bank object in its process
+
+    def load(self, sample_name, filename):
+        """
+        Decodes the wav file `filename` in shared memory as `sample_name`,
+        and returns the samples. If the sample is already in the bank, it is not decoded again.
+        """
+        self.collect()
+        if self._description(sample_name) is not None:
+            return self.get(sample_name)
+
+        wfile, infos = wav.open_read_mode(filename)
+        shape = (infos['frame_count'], infos['channel_count'])
+        segment = 'pyc%s' % uuid.uuid4().hex[:20]
+        samples = _map_segment(self._segment_path(segment), shape, 'w+')
+        # Decoded by blocks, so the whole file is never in memory besides the segment
+        for start in range(0, shape[0], config.block_size):
+            raw = wav.read_raw_block(wfile, config.block_size)
+            pcm.int_to_float(raw, out=samples[start:start + raw.shape[0]])
+        wfile.close()
+        if isinstance(samples, numpy.memmap): samples.flush()
+        del samples
+
+        # Publish the description, with a reference from this process already,
+        # so the sample is not collected right away. If another process loaded
+        # the same sample in the meantime, we use theirs.
+        ref_path = self._ref_path(segment)
+        open(ref_path, 'w').close()
+        description = {'segment': segment, 'shape': shape, 'dtype': 'float32'}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(description, temp_file)
+        try:
+            os.link(temp_path, self._description_path(sample_name))
+        except OSError as err:
+            if err.errno != errno.EEXIST: raise
+            files._remove(ref_path)
+            files._remove(self._segment_path(segment))
+        finally:
+            os.remove(temp_path)
+        return self.get(sample_name)
+
+    def get(self, sample_name):
+        """
+        Returns the samples `sample_name` as a read-only float32 array.
+        Raises `KeyError` if the sample is not in the bank.
+        """
+        self._check_fork()
+        if sample_name in self._attached:
+            return self._attached[sample_name][1]
+
+        description = self._description(sample_name)
+        if description is None: raise KeyError(sample_name)
+        open(self._ref_path(description['segment']), 'w').close()
+        try:
+            samples = _map_segment(self._segment_path(description['segment']),
+                tuple(description['shape']), 'r')
+        except (OSError, IOError):
+            os.remove(self._ref_path(description['segment']))
+            raise KeyError(sample_name)
+        samples.flags.writeable = False
+        self._attached[sample_name] = (description['segment'], samples)
+        return samples
+
+    def release(self, sample_name):
+        """
+        Releases the samples `sample_name` for this process. The sample is freed
+        if no other process uses it. Arrays returned by `get` stay valid until they are deleted.
+        """
+        self._check_fork()
+        if sample_name in self._attached:
+            segment = self._attached.pop(sample_name)[0]
+            files._remove(self._ref_path(segment))
+        self.collect()
+
+    def close(self):
+        """
+        Releases all the samples used by this process.
+        """
+        for sample_name in list(self._attached):
+            self.release(sample_name)
+
+    def names(self):
+        """
+        Returns the names of the samples in the bank.
+        """
+        return sorted(os.path.basename(path)[:-len('.json')]
+            for path in glob.glob(os.path.join(self.directory, '*.json')))
+
+    def collect(self):
+        """
+        Removes the references of the processes that died, and frees the samples
+        that are not used by any process.
+        """
+        for sample_name in self.names():
+            description = self._description(sample_name)
+            if description is None: continue
+            ref_count = 0
+            for path in glob.glob(self._ref_path(description['segment'], '*', '*')):
+                pid = int(path.rsplit('.', 3)[1])
+                if files._is_alive(pid): ref_count += 1
+                else: files._remove(path)
+            if ref_count == 0:
+                # The memory is freed once the processes still mapping the segment unmap it
+                files._remove(self._description_path(sample_name))
+                files._remove(self._segment_path(description['segment']))
+
+    def _check_fork(self):
+        # After a fork, the samples attached by the parent are not referenced by this process.
+        if os.getpid() != self._pid:
+            self._attached = {}
+            self._pid = os.getpid()
+
+    def _description(self, sample_name):
+        try:
+            with open(self._description_path(sample_name), 'r') as fd:
+                return json.load(fd)
+        except (IOError, OSError):
+            return None
+
+    def _description_path(self, sample_name):
+        return os.path.join(self.directory, '%s.json' % sample_name)
+
+    def _segment_path(self, segment_name):
+        return os.path.join(self.directory, '%s.f32' % segment_name)
+
+    def _ref_path(self, segment_name, pid=None, token=None):
+        """
+        Path of the file marking that the process `pid` references the segment.
+        """
+        pid = pid or os.getpid()
+        token = token or self._token
+        return os.path.join(self.directory, '%s.%s.%s.ref' % (segment_name, pid, token))
+
+
+def _default_directory():
+    if os.path.isdir('/dev/shm'): return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _map_segment(path, shape, mode):
+    # Empty files cannot be memory-mapped
+    if int(numpy.prod(shape)) == 0:
+        if mode == 'w+': open(path, 'w').close()
+        elif not os.path.exists(path): raise IOError(errno.ENOENT, 'no such segment', path)
+        return numpy.zeros(shape, dtype='float32')
+    samples = numpy.memmap(path, dtype='float32', mode=mode, shape=shape)
+    if mode == 'r': return samples.view(numpy.ndarray)
+    return samples
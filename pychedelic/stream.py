@@ -1,17 +1,32 @@
-import time
+import os
 import math
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+import collections
 from contextlib import contextmanager
-
-import numpy
 try:
-    import pyaudio
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from itertools import imap
 except ImportError:
-    print('Please install pyAudio if you want to play back audio')
+    imap = map
+
+import numpy
 
 from .core import wav
 from .core import pcm
 from .core import buffering
 from .core import scheduling
+from .core import loudness
+from .core import resampling
+from .core import files
+from .core import playback as core_playback
+from .core import backends
 from . import chunk
 from .config import config
 
@@ -31,59 +46,415 @@ def ramp(initial, *values):
 
         while counter < frame_count:
             next_size = min(frame_count - counter, config.block_size)
-            block = numpy.ones((next_size, 1)) * step
-            block = acc + numpy.cumsum(block, axis=0)
+            block = buffering.pool.acquire(next_size, 1)
+            block.fill(step)
+            numpy.cumsum(block, axis=0, out=block)
+            block += acc
             counter += next_size
             acc = block[-1,0]
             yield block
             
 
 class resample(object):
+    """
+    Resamples `source`. The ratio is set with `set_ratio`, and can be changed
+    at any time without discontinuity.
+    """
 
     def __init__(self, source):
         self.source = buffering.Buffer(source)
+        self.frame_in = 0               # next frame that will be pulled from `source`
+        self.frame_out = None           # position in `source` of the last frame output
+        self._ratios = None             # buffered stream of ratios
+        self._last_frame = None         # last frame returned by the fast path
         self.set_ratio(1)
 
     def set_ratio(self, val):
-        self.ratio = val
-        self.frame_in = 0
-        self.frame_out = -val
+        """
+        Sets the resampling ratio. `val` can be a number, a stream of ratios
+        (blocks of shape `(frames, 1)`, for example from `ramp`), or an array
+        with one ratio per output frame. When the stream or the array is exhausted,
+        the last ratio is kept.
+        """
+        if numpy.isscalar(val):
+            self.ratio = val
+            self._ratios = None
+        else:
+            if isinstance(val, numpy.ndarray):
+                val = (block for block in [val.reshape((val.shape[0], 1))])
+            self._ratios = buffering.Buffer(val)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.ratio == 1: return self.source.pull(config.block_size)
-        overlap = 1 # We always keep the last `frame_in` for next iteration
+        ratios = self._pull_ratios()
+        if ratios is None:
+            if self.frame_out is None: self.frame_out = -self.ratio
+            # Fast path, only if we are exactly on a frame of `source`
+            if self.ratio == 1 and self.frame_out + 1 == self.frame_in:
+                block = self.source.pull(config.block_size)
+                self.frame_in += block.shape[0]
+                self.frame_out = self.frame_in - 1
+                self._last_frame = block[-1:]
+                return block
+            x_out = self.frame_out + (numpy.ones(config.block_size) * self.ratio).cumsum()
+            next_ratio = self.ratio
+        else:
+            if self.frame_out is None: self.frame_out = -ratios[0]
+            x_out = self.frame_out + ratios.cumsum()
+            # Next ratio is unknown, so we assume the smallest
+            next_ratio = 0
 
-        x_out = self.frame_out + (numpy.ones(config.block_size) * self.ratio).cumsum()
-        x_in = numpy.arange(self.frame_in, math.ceil(x_out[-1]) + 1)
+        overlap = 1 # We always keep the last `frame_in` for next iteration
+        # After the fast path, the last frame was not kept in the buffer
+        after_fast_path = x_out[0] < self.frame_in
+        x_in = numpy.arange(self.frame_in - after_fast_path, math.ceil(x_out[-1]) + 1)
 
         self.frame_out = x_out[-1]
-        next_size = math.ceil(len(x_in))
+        next_size = len(x_in) - after_fast_path
         # If next `frame_out` is in interval [x_in[-2], x_in[-1]),
         # it means we'll need x_in[-2] for next iteration
-        overlap += (self.frame_out + self.ratio) < x_in[-1]
+        overlap += (self.frame_out + next_ratio) < x_in[-1]
         self.frame_in = x_in[-1] + 1 - overlap
 
         block_in = self.source.pull(next_size, overlap=overlap, pad=True)
-        block_out = []
-        for block_ch in block_in.T:
-            block_out.append(numpy.interp(x_out, x_in, block_ch))
-        block_out = numpy.vstack(block_out).transpose()
-
+        # Interpolating between silent frames gives silence
+        if buffering.is_silent(block_in) and (not after_fast_path or buffering.is_silent(self._last_frame)):
+            return buffering.silence(x_out.shape[0], block_in.shape[1])
+        if after_fast_path:
+            block_in = numpy.vstack([self._last_frame, block_in])
+        block_out = buffering.pool.acquire(x_out.shape[0], block_in.shape[1])
+        for ch in range(block_in.shape[1]):
+            block_out[:,ch] = numpy.interp(x_out, x_in, block_in[:,ch])
+        buffering.pool.release(block_in)
         return block_out
+
+    def _pull_ratios(self):
+        """
+        Returns the ratios for the next block, or `None` if the ratio is constant.
+        """
+        if self._ratios is None: return None
+        try:
+            ratios = self._ratios.pull(config.block_size)[:,0]
+        except StopIteration:
+            self._ratios = None
+            return None
+        if ratios.shape[0] < config.block_size:
+            ratios = numpy.concatenate([ratios, numpy.ones(config.block_size - ratios.shape[0]) * ratios[-1]])
+        self.ratio = ratios[-1]
+        return ratios
 resample.next = resample.__next__ # Compatibility Python 2
 
 
+class convolve(object):
+    """
+    Convolves `source` with the impulse response `ir`, using uniformly partitioned
+    overlap-save FFT convolution. `ir` is an array `(frames, channels)`, with either
+    one channel (applied to all the channels of `source`) or as many channels as `source`.
+
+    The latency is bounded by `partition_size` (by default `config.block_size`).
+    The output is `ir.shape[0] - 1` frames longer than the source.
+    """
+
+    _spectra_cache = collections.OrderedDict() # IR spectra, shared across instances, least recently used first
+    _spectra_cache_limit = 16
+
+    def __init__(self, source, ir, partition_size=None):
+        if ir.ndim == 1: ir = ir.reshape((ir.shape[0], 1))
+        self.partition_size = partition_size or config.block_size
+        self.ir_spectra = self._get_ir_spectra(ir, self.partition_size)
+        self.ir_frame_count = ir.shape[0]
+        # The first partition must be preceded by `partition_size` frames of silence.
+        self.source = buffering.Buffer(_prepend_silence(self._count_frames(source), self.partition_size))
+        self._fdl = None            # frequency-domain delay line, one spectrum per partition
+        self._fdl_pos = 0
+        self._frames_in = 0
+        self._frames_out = 0
+        self._input_done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        partition_size = self.partition_size
+        if self._input_done and self._frames_out >= self._frames_in + self.ir_frame_count - 1:
+            raise StopIteration
+
+        try:
+            block_in = self.source.pull(2 * partition_size, overlap=partition_size, pad=True)
+        except StopIteration:
+            # Source exhausted, we are only flushing the tail of the convolution
+            if self._fdl is None: raise
+            spectrum = 0
+        else:
+            # All the channels are transformed at once
+            spectrum = numpy.fft.rfft(block_in, axis=0)
+
+        partition_count = self.ir_spectra.shape[0]
+        if self._fdl is None:
+            channel_count = max(spectrum.shape[1], self.ir_spectra.shape[2])
+            if self.ir_spectra.shape[2] not in (1, channel_count):
+                raise ValueError('Impulse response with %s channels cannot be applied to a source with %s channels'
+                  % (self.ir_spectra.shape[2], spectrum.shape[1]))
+            self._fdl = numpy.zeros((partition_count, partition_size + 1, channel_count), dtype='complex')
+        self._fdl_pos = (self._fdl_pos - 1) % partition_count
+        self._fdl[self._fdl_pos] = spectrum
+
+        # Multiply-accumulate each partition of the IR with the matching delayed input spectrum
+        split = partition_count - self._fdl_pos
+        acc = (self._fdl[self._fdl_pos:] * self.ir_spectra[:split]).sum(axis=0)
+        if self._fdl_pos > 0:
+            acc += (self._fdl[:self._fdl_pos] * self.ir_spectra[split:]).sum(axis=0)
+        block_out = numpy.fft.irfft(acc, n=2 * partition_size, axis=0)[partition_size:]
+
+        if self._input_done:
+            block_out = block_out[:self._frames_in + self.ir_frame_count - 1 - self._frames_out]
+            if block_out.shape[0] == 0: raise StopIteration
+        self._frames_out += block_out.shape[0]
+        return block_out
+
+    def _count_frames(self, source):
+        # We count the frames going through, to know when the tail ends.
+        for block in source:
+            self._frames_in += block.shape[0]
+            yield block
+        self._input_done = True
+
+    @classmethod
+    def _get_ir_spectra(cls, ir, partition_size):
+        """
+        Returns the spectra of all the partitions of `ir`, shape `(partitions, bins, channels)`.
+        """
+        key = (hashlib.sha1(numpy.ascontiguousarray(ir)).hexdigest(),
+            ir.shape, ir.dtype.str, partition_size)
+        if key in cls._spectra_cache:
+            spectra = cls._spectra_cache.pop(key)
+        else:
+            partition_count = int(math.ceil(ir.shape[0] / float(partition_size)))
+            partitions = numpy.zeros((partition_count * partition_size, ir.shape[1]))
+            partitions[:ir.shape[0]] = ir
+            partitions = partitions.reshape((partition_count, partition_size, ir.shape[1]))
+            # Each partition is zero-padded to `2 * partition_size` by rfft
+            spectra = numpy.fft.rfft(partitions, n=2 * partition_size, axis=1)
+            if len(cls._spectra_cache) >= cls._spectra_cache_limit:
+                cls._spectra_cache.popitem(last=False)
+        cls._spectra_cache[key] = spectra
+        return spectra
+convolve.next = convolve.__next__ # Compatibility Python 2
+
+
+def stft(source, n_fft, hop, window='hann', frame_count=None, dtype=None):
+    """
+    Short-time Fourier transform of `source`. Yields arrays of spectra of shape
+    `(frames, n_fft // 2 + 1, channels)`, each containing `frame_count` frames
+    (by default, as many frames as there are hops in `config.block_size`).
+    `window` is the name of a window (`'hann'`, `'hamming'`, `'blackman'`),
+    an array of size `n_fft`, or `None` for a rectangular window.
+    Pass `dtype='complex64'` to halve the memory used by the output.
+
+    The source is preceded with `n_fft - hop` frames of silence, so that each frame
+    of the source is covered by the same number of analysis windows,
+    and can be reconstructed with `istft`.
+    """
+    if not 1 <= hop <= n_fft:
+        raise ValueError('hop should be between 1 and n_fft (%s), got %s' % (n_fft, hop))
+    window = _get_window(window, n_fft).reshape((1, n_fft, 1))
+    frame_count = frame_count or max(1, config.block_size // hop)
+    block_size = (frame_count - 1) * hop + n_fft
+    buf = buffering.Buffer(_prepend_silence(source, n_fft - hop))
+
+    with _until_StopIteration():
+        while True:
+            block = buf.pull(block_size, overlap=block_size - frame_count * hop, pad=True)
+            # View of all the frames of the block, without copying
+            frames = numpy.lib.stride_tricks.as_strided(block,
+                shape=(frame_count, n_fft, block.shape[1]),
+                strides=(hop * block.strides[0], block.strides[0], block.strides[1]))
+            spectra = numpy.fft.rfft(frames * window, axis=1)
+            if dtype is not None:
+                spectra = spectra.astype(dtype, copy=False)
+            yield spectra
+
+
+def istft(source, hop, window='hann'):
+    """
+    Inverse of `stft`. Takes blocks of spectra `(frames, bins, channels)`, and yields
+    the resynthesized audio using weighted overlap-add. The silence prepended by `stft`
+    is removed, but the output might end with some extra silence.
+    """
+    tail = None
+
+    with _until_StopIteration():
+        while True:
+            spectra = next(source)
+            frame_count, bin_count, channel_count = spectra.shape
+
+            if tail is None:
+                n_fft = 2 * (bin_count - 1)
+                overlap_count = int(math.ceil(n_fft / float(hop)))
+                padded_window = numpy.zeros(overlap_count * hop)
+                padded_window[:n_fft] = _get_window(window, n_fft)
+                # Sum of the squared windows overlapping on each frame of a hop
+                norm = (padded_window ** 2).reshape((overlap_count, hop)).sum(axis=0)
+                norm[norm < 1e-10] = numpy.inf
+                norm = (1 / norm).reshape((1, hop, 1))
+                tail = numpy.zeros((overlap_count - 1, hop, channel_count))
+                to_skip = n_fft - hop
+
+            frames = numpy.zeros((frame_count, overlap_count * hop, channel_count))
+            frames[:,:n_fft,:] = numpy.fft.irfft(spectra, n=n_fft, axis=1) \
+                * padded_window[:n_fft].reshape((1, n_fft, 1))
+            frames = frames.reshape((frame_count, overlap_count, hop, channel_count))
+
+            # Overlap-add, hop by hop
+            block = numpy.zeros((frame_count + overlap_count - 1, hop, channel_count))
+            block[:overlap_count - 1] = tail
+            for i in range(overlap_count):
+                block[i:i + frame_count] += frames[:,i]
+            tail = block[frame_count:]
+            block = (block[:frame_count] * norm).reshape((frame_count * hop, channel_count))
+
+            if to_skip:
+                skipped = min(to_skip, block.shape[0])
+                block = block[skipped:]
+                to_skip -= skipped
+            if block.shape[0]: yield block
+
+
+def tee(source, n=2, max_blocks=None, policy='wait'):
+    """
+    Splits `source` into `n` streams, returned as a tuple. Blocks pulled from `source`
+    are shared by all the streams without copying, so they shouldn't be modified in place.
+    Only the blocks that the slowest stream hasn't read yet are kept.
+
+    `max_blocks` limits the number of blocks kept. When a stream is `max_blocks` ahead
+    of the slowest stream, `policy` decides what happens :
+
+        - `'wait'` : it waits for the slowest stream to catch up. This is for streams
+          consumed in different threads, otherwise it would wait forever.
+        - `'drop'` : the oldest block is dropped, and the slowest streams skip it.
+        - `'error'` : `BufferError` is raised.
+
+    A stream that is not used anymore should be closed, so that the others don't wait for it.
+    """
+    if not policy in ('wait', 'drop', 'error'):
+        raise ValueError('unknown policy %s' % policy)
+    shared = _tee_shared(source, n, max_blocks, policy)
+    return tuple([_tee_branch(shared, i) for i in range(n)])
+
+
+class _tee_branch(object):
+
+    def __init__(self, shared, index):
+        self.shared = shared
+        self.index = index
+
+    @property
+    def dropped(self):
+        """
+        Number of blocks this stream skipped because they were dropped.
+        """
+        return self.shared.dropped[self.index]
+
+    def close(self):
+        self.shared.close(self.index)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.shared.get(self.index)
+_tee_branch.next = _tee_branch.__next__ # Compatibility Python 2
+
+
+class _tee_shared(object):
+
+    def __init__(self, source, n, max_blocks, policy):
+        self.source = source
+        self.max_blocks = max_blocks
+        self.policy = policy
+        self.blocks = collections.deque()
+        self.first_index = 0                # index of `blocks[0]` in the stream
+        self.positions = [0] * n            # index of the next block for each branch
+        self.dropped = [0] * n
+        self.exhausted = False
+        self.fetching = False               # True while a branch pulls from the source
+        self.condition = threading.Condition()
+
+    def get(self, index):
+        with self.condition:
+            while True:
+                # Blocks might have been dropped while this branch wasn't reading
+                if self.positions[index] < self.first_index:
+                    self.dropped[index] += self.first_index - self.positions[index]
+                    self.positions[index] = self.first_index
+
+                offset = self.positions[index] - self.first_index
+                if offset < len(self.blocks):
+                    block = self.blocks[offset]
+                    self.positions[index] += 1
+                    self._discard_read_blocks()
+                    return block
+                if self.exhausted: raise StopIteration
+                # Another branch is pulling from the source, and will notify when done
+                if self.fetching:
+                    self.condition.wait()
+                    continue
+
+                # This branch is the fastest, so we need a new block from the source
+                full = self.max_blocks is not None and len(self.blocks) >= self.max_blocks
+                if full and self.policy == 'wait':
+                    self.condition.wait()
+                    continue
+                elif full and self.policy == 'error':
+                    raise BufferError('tee buffer full, %s blocks' % self.max_blocks)
+
+                # The lock is released while pulling, so the other branches
+                # can read the blocks already buffered in the meantime.
+                self.fetching = True
+                self.condition.release()
+                exhausted = False
+                try:
+                    block = next(self.source)
+                except StopIteration:
+                    exhausted = True
+                finally:
+                    self.condition.acquire()
+                    self.fetching = False
+                    self.condition.notify_all()
+                if exhausted:
+                    self.exhausted = True
+                    raise StopIteration
+                self.blocks.append(block)
+                if self.max_blocks is not None and len(self.blocks) > self.max_blocks:
+                    self.blocks.popleft()
+                    self.first_index += 1
+
+    def close(self, index):
+        with self.condition:
+            self.positions[index] = float('inf')
+            self._discard_read_blocks()
+
+    def _discard_read_blocks(self):
+        slowest = min(self.positions)
+        if slowest > self.first_index:
+            while self.blocks and self.first_index < slowest:
+                self.blocks.popleft()
+                self.first_index += 1
+            self.condition.notify_all()
+
+
 class mixer(object):
     """
     Mixes several streams of audio into one.
+    `min_block_size` and `tolerance` are passed to the mixer's `Clock`,
+    to limit how small blocks get when events are scheduled close to each other.
     """
 
-    def __init__(self, channel_count, stop_when_empty=True):
+    def __init__(self, channel_count, stop_when_empty=True, min_block_size=0, tolerance=0):
         self.sources = []
-        self.clock = scheduling.Clock()
+        self.clock = scheduling.Clock(min_block_size=min_block_size, tolerance=tolerance)
         self.channel_count = channel_count
         self.stop_when_empty = stop_when_empty
 
@@ -99,32 +470,41 @@ class mixer(object):
     def __next__(self):
         empty_sources = []
         next_size = self.clock.advance(config.block_size)
-        block_channels = [numpy.zeros(next_size, dtype='float32') for ch in range(self.channel_count)]
+        blocks = []
+        silent = False                  # `True` if a source returned a silent block
 
-        # Iterating through all the sources and do the mixing
+        # Iterating through all the sources. Silent blocks don't need to be mixed.
         for buf in self.sources:
             try:
                 block = buf.pull(next_size, pad=True)
             except StopIteration:
                 empty_sources.append(buf)
             else:
-                # !!! If the source is empty, the buffer might return a smaller block than expected 
-                # Also, if not same number of channels, the block is down-mixed / up-mixed here
-                for ch in range(0, min(block.shape[1], self.channel_count)):
-                    block_channels[ch] = numpy.sum([block_channels[ch], block[:,ch]], axis=0)
+                if buffering.is_silent(block): silent = True
+                else: blocks.append(block)
         
         # Forget empty sources
         for buf in empty_sources:
             self.sources.remove(buf)
 
         # Handle case when all sources are empty
-        if len(self.sources) is 0:
-            if self.stop_when_empty:
-                raise StopIteration
-            elif len(block_channels) is 0:
-                return numpy.zeros((next_size, self.channel_count), dtype='float32')
+        if len(self.sources) == 0 and self.stop_when_empty:
+            raise StopIteration
+
+        # Silence is returned only if the sources were silent
+        if silent and not blocks:
+            return buffering.silence(next_size, self.channel_count, dtype='float32')
 
-        return numpy.column_stack(block_channels)
+        # If not same number of channels, the block is down-mixed / up-mixed here
+        block_out = buffering.pool.acquire(next_size, self.channel_count,
+            dtype=numpy.result_type('float32', *blocks), zeros=True)
+        while blocks:
+            block = blocks.pop()
+            channel_count = min(block.shape[1], self.channel_count)
+            block_out[:,:channel_count] += block[:,:channel_count]
+            # Blocks pulled from the buffers belong to the mixer
+            buffering.pool.release(block)
+        return block_out
 mixer.next = mixer.__next__ # Compatibility Python 2
 
 
@@ -132,68 +512,127 @@ class iter(object):
     """
     Creates a simple generator which will iter blocks from `samples`.
     Each ouput block is guaranteed to have `config.block_size` frames, if pad is `True`.
+
+    Blocks are views of `samples`, so big arrays, for example memory-mapped
+    with `numpy.memmap`, are streamed without copying. Only the last block is copied
+    if it needs to be padded. Therefore, blocks shouldn't be modified in place.
+    With `step`, only one frame every `step` frames is read, still without copying.
     """
 
-    def __init__(self, samples, pad=False, start=0, end=None):
+    def __init__(self, samples, pad=False, start=0, end=None, step=1):
         self.samples = samples
         self.pad = pad
         self.end = end
+        self.step = step
         self.seek(start)
 
     def seek(self, position):
-        def _source():
-            if self.end is None:
-                yield self.samples[math.floor(position * config.frame_rate):,:]
-            else:
-                start_frame = math.floor(position * config.frame_rate)
-                end_frame = math.floor(self.end * config.frame_rate)
-                yield self.samples[start_frame:end_frame,:]
-        self.buffer = buffering.Buffer(_source())
+        # Rounding like `wav.seek`, so that `frame / frame_rate` seconds is exactly `frame`.
+        self._position = int(round(position * config.frame_rate))
+        if self.end is None:
+            self._end_frame = self.samples.shape[0]
+        else:
+            self._end_frame = min(int(round(self.end * config.frame_rate)), self.samples.shape[0])
+
+    def frame_count_hint(self):
+        frame_count = max(0, int(math.ceil((self._end_frame - self._position) / float(self.step))))
+        if self.pad:
+            return int(math.ceil(frame_count / float(config.block_size))) * config.block_size
+        return frame_count
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        return self.buffer.pull(config.block_size, pad=self.pad)
+        if self._position >= self._end_frame: raise StopIteration
+        next_position = min(self._position + config.block_size * self.step, self._end_frame)
+        block = self.samples[self._position:next_position:self.step]
+        self._position += block.shape[0] * self.step
+
+        if self.pad and block.shape[0] < config.block_size:
+            padded = numpy.zeros((config.block_size, block.shape[1]), dtype=block.dtype)
+            padded[:block.shape[0]] = block
+            block = padded
+        return block
 iter.next = iter.__next__ # Compatibility Python 2
 
 
 class read_wav(object):
+    """
+    Reads a wav file by blocks. If the frame rate of the file is not `config.frame_rate`
+    and `convert_rate` is `True`, the file is resampled to `config.frame_rate`.
+    """
 
-    def __init__(self, filelike, start=0, end=None):
+    def __init__(self, filelike, start=0, end=None, convert_rate=True):
         self.wfile, self.infos = wav.open_read_mode(filelike)
         self.end = end
+        if convert_rate and self.infos['frame_rate'] != config.frame_rate:
+            self.resampler = resampling.Resampler(self.infos['frame_rate'],
+                config.frame_rate, self.infos['channel_count'])
+        else: self.resampler = None
         self.seek(start)
-        self.frames_read = 0
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.frames_read < self.frames_to_read:
+        if self.resampler is None:
+            if self.frames_read < self.frames_to_read:
+                next_size = min(config.block_size, self.frames_to_read - self.frames_read)
+                block = wav.read_block(self.wfile, next_size)
+                self.frames_read += next_size
+                return block
+            else: raise StopIteration
+
+        # Resampling. The int16 samples are scaled by the resampler.
+        while self.frames_read < self.frames_to_read:
             next_size = min(config.block_size, self.frames_to_read - self.frames_read)
-            block = wav.read_block(self.wfile, next_size)
+            block = self.resampler.process(wav.read_raw_block(self.wfile, next_size))
             self.frames_read += next_size
-            return block
-        else: raise StopIteration
+            if block.shape[0]: return block
+        if not self._flushed:
+            self._flushed = True
+            block = self.resampler.flush()
+            if block.shape[0]: return block
+        raise StopIteration
+
+    def frame_count_hint(self):
+        frame_count = max(0, self.frames_to_read - self.frames_read)
+        if self.resampler is None: return frame_count
+        if self._flushed: return 0
+        return self.resampler.output_frame_count(self.frames_to_read) - self.resampler.frames_out
 
     def seek(self, position):
         """
         Seek `position` in seconds in the wav file.
         """
         self.frames_to_read = wav.seek(self.wfile, position, self.end)
+        self.frames_read = 0
+        if self.resampler is not None:
+            self.resampler.reset()
+            self._flushed = False
 read_wav.next = read_wav.__next__ # Compatibility Python 2
 
 
 class write_wav(object):
+    """
+    Writes all the blocks from `source` to the wav file `filelike`.
+    `audit` is an optional `core.audit.Audit`, to audit the realtime safety of `source`.
+    """
 
-    def __init__(self, source, filelike):
-        self.source = source
-        self._block = next(source)
-        channel_count = self._block.shape[1]
-        self.wfile, self.infos = wav.open_write_mode(filelike, config.frame_rate, channel_count)
-        # Pull all audio
-        for i in self: pass
+    def __init__(self, source, filelike, audit=None):
+        if audit is not None:
+            source = audit.wrap(source)
+            audit.start()
+        try:
+            self.source = source
+            self._block = next(source)
+            channel_count = self._block.shape[1]
+            self.wfile, self.infos = wav.open_write_mode(filelike, config.frame_rate, channel_count)
+            # Pull all audio
+            for i in self: pass
+        finally:
+            if audit is not None: audit.stop()
 
     def __iter__(self):
         return self
@@ -203,7 +642,13 @@ class write_wav(object):
             raise ValueError('Received block with %s channels, while writing wav file with %s channels' 
               % (self._block.shape[1], self.infos['channel_count'])) 
 
-        wav.write_block(self.wfile, self._block)
+        block, self._block = self._block, None
+        if buffering.is_silent(block):
+            self.wfile.writeframes(b'\x00' * (block.size * 2))
+        else:
+            wav.write_block(self.wfile, block)
+            buffering.pool.release(block)
+        del block # released blocks must not be referenced while the next one is rendered
         try:
             self._block = next(self.source)
         except StopIteration:
@@ -212,54 +657,523 @@ class write_wav(object):
 write_wav.next = write_wav.__next__ # Compatibility Python 2
 
 
-def to_raw(source):
-    with _until_StopIteration(): 
+class write_audio(object):
+    """
+    Encodes the blocks from `source` to `filename` with avconv, while they are rendered.
+    `format` is guessed from the extension of `filename` if not given, and `options`
+    is a list of extra output options for avconv, e.g. `['-b', '192k']`.
+
+    Blocks are converted to 16-bit PCM, and a writer thread sends them to avconv,
+    through a queue of at most `queue_size` blocks. Raises `core.files.ConversionError`
+    with the output of avconv if the encoding failed.
+    `audit` is an optional `core.audit.Audit`, to audit the realtime safety of `source`.
+    """
+
+    def __init__(self, source, filename, format=None, options=None, queue_size=8, audit=None):
+        if audit is not None:
+            source = audit.wrap(source)
+            audit.start()
+        try:
+            self._encode(source, filename, format, options, queue_size)
+        finally:
+            if audit is not None: audit.stop()
+
+    def _encode(self, source, filename, format, options, queue_size):
+        self.source = source
+        self.filename = filename
+        self.format = format or files.guess_fileformat(filename)
+        block = next(source)
+        self.infos = {'frame_rate': config.frame_rate, 'channel_count': block.shape[1]}
+
+        self._stderr = tempfile.TemporaryFile()
+        self._devnull = open(os.devnull, 'w')
+        try:
+            self._process = subprocess.Popen(['avconv', '-y',
+                '-f', 's16le', '-ar', str(config.frame_rate), '-ac', str(block.shape[1]),
+                '-i', '-',  # input options, raw PCM from stdin
+                '-vn', '-f', self.format] + list(options or []) + [filename],
+                stdin=subprocess.PIPE, stdout=self._devnull, stderr=self._stderr)
+        except OSError as err:
+            self._stderr.close()
+            self._devnull.close()
+            raise files.ConversionError('could not run avconv : %s' % err)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._write_error = None
+        self._stopped_early = False     # avconv stopped before the end of the source
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+        try:
+            while True:
+                if block.shape[1] != self.infos['channel_count']:
+                    raise ValueError('Received block with %s channels, while writing file with %s channels'
+                      % (block.shape[1], self.infos['channel_count']))
+                self._queue.put(pcm.float_to_int(block).tobytes())
+                # If avconv stopped, rendering the rest of the source is useless
+                if self._write_error is not None or self._process.poll() is not None:
+                    self._stopped_early = True
+                    break
+                try:
+                    block = next(source)
+                except StopIteration:
+                    break
+        except BaseException:
+            # An error of the encoder must not hide the original error
+            self._close(raise_errors=False)
+            raise
+        self._close()
+
+    def _write(self):
+        while True:
+            data = self._queue.get()
+            if data is None: break
+            # If avconv died, we keep emptying the queue so the rendering doesn't block
+            if self._write_error is not None: continue
+            try:
+                self._process.stdin.write(data)
+            except (IOError, OSError) as err:
+                self._write_error = err
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+    def _close(self, raise_errors=True):
+        self._queue.put(None)
+        self._thread.join()
+        returncode = self._process.wait()
+        self._devnull.close()
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode('utf8', 'replace')
+        self._stderr.close()
+        if raise_errors and (returncode != 0 or self._write_error is not None or self._stopped_early):
+            raise files.ConversionError('encoding %s failed' % self.filename, stderr)
+
+
+def render_wav(factory, filelike, duration, segment_duration=60, preroll=0, processes=None):
+    """
+    Renders a timeline of `duration` seconds to the wav file `filelike`, in segments
+    of `segment_duration` seconds, rendered in parallel by a pool of `processes`
+    worker processes (by default, one per CPU, and if `0`, in the current process).
+
+    `factory` is called as `factory(start)` in the workers, and must return a stream
+    of the timeline starting at `start` seconds. It must therefore be picklable,
+    e.g. a function defined at module level :
+
+        def timeline(start):
+            mix = stream.mixer(2)
+            mix.plug(stream.read_wav('voice.wav', start=start))
+            mix.plug(stream.read_wav('music.wav', start=start))
+            return mix
+
+        stream.render_wav(timeline, 'out.wav', duration=3 * 3600)
+
+    Streams with state (filters, resampling) need some time before they render
+    the same output as if they had started from the beginning. Each segment is therefore
+    rendered from `preroll` seconds before its start, and those frames are discarded.
+    Segments are joined exactly at the frame, and the timeline is padded
+    with silence if it ends before `duration`.
+    """
+    frame_count = int(round(duration * config.frame_rate))
+    segment_frames = int(round(segment_duration * config.frame_rate))
+    preroll_frames = int(round(preroll * config.frame_rate))
+    if segment_frames <= 0: raise ValueError('segment_duration must be positive')
+    jobs = [(factory, start, min(preroll_frames, start), min(segment_frames, frame_count - start))
+        for start in range(0, frame_count, segment_frames)]
+
+    if processes == 0:
+        pool = None
+        segments = imap(_render_segment, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        # Only a few segments are rendered ahead, so they don't pile up in memory
+        # when the workers are faster than writing the file.
+        segments = _imap_window(pool, _render_segment, jobs, processes or multiprocessing.cpu_count())
+
+    wfile = None
+    silent_frames = 0       # silence received before the channel count is known
+    try:
+        # Segments are received in order, and written as soon as they are available.
+        for samples in segments:
+            if samples.shape[1] == 0:
+                # The timeline ended before this segment
+                if wfile is None:
+                    silent_frames += samples.shape[0]
+                    continue
+                samples = numpy.zeros((samples.shape[0], infos['channel_count']), dtype='int16')
+            if wfile is None:
+                wfile, infos = wav.open_write_mode(filelike, config.frame_rate, samples.shape[1])
+                wfile.writeframes(numpy.zeros((silent_frames, samples.shape[1]), dtype='int16').tobytes())
+            elif samples.shape[1] != infos['channel_count']:
+                raise ValueError('Received segment with %s channels, while writing wav file with %s channels'
+                  % (samples.shape[1], infos['channel_count']))
+            wfile.writeframes(samples.tobytes())
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        # Also on error, so the header is updated with the segments already written
+        if wfile is not None: wfile.close()
+    if wfile is None: raise ValueError('the timeline generated no audio')
+
+
+MeterSnapshot = collections.namedtuple('MeterSnapshot', ['position', 'peak', 'rms', 'clips', 'dc_offset', 'silent'])
+
+
+class meter(object):
+    """
+    Passes the blocks from `source` through unchanged, while measuring their level
+    over windows of `window` seconds. At the end of each window, the measurements are
+    published in `snapshot`, a `MeterSnapshot` containing tuples with, for each channel :
+
+        - `peak` : maximum absolute value
+        - `rms` : root mean square
+        - `clips` : number of samples at or beyond full scale
+        - `dc_offset` : mean value
+        - `silent` : `True` if the RMS is below `silence_threshold` dBFS
+
+    and `position`, the number of frames metered at the end of the window.
+    Snapshots are never modified but replaced, so another thread, e.g. a monitoring UI,
+    can read `snapshot` at any time without lock. It is `None` until the first window is complete.
+    """
+
+    def __init__(self, source, window=0.4, silence_threshold=-60):
+        self.source = source
+        self.window_size = max(int(round(window * config.frame_rate)), 1)
+        self.silence_level = 10 ** (silence_threshold / 20.0)
+        self.snapshot = None
+        self._position = 0
+        self._peak = None
+
+    def frame_count_hint(self):
+        return frame_count_hint(self.source)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            block = next(self.source)
+        except StopIteration:
+            # Publish the last window, even if incomplete
+            if self._peak is not None and self._frames: self._publish()
+            raise
+
+        # Blocks are cut at the end of the windows, with views.
+        start = 0
+        while start < block.shape[0]:
+            if self._peak is None or self._peak.shape[0] != block.shape[1]:
+                # The channel count changed, the partial window is published as is
+                if self._peak is not None and self._frames: self._publish()
+                self._reset(block.shape[1])
+            size = min(block.shape[0] - start, self.window_size - self._frames)
+            self._measure(block[start:start+size])
+            start += size
+            if self._frames == self.window_size:
+                self._publish()
+                self._reset(block.shape[1])
+        return block
+
+    def _reset(self, channel_count):
+        self._frames = 0
+        self._peak = numpy.zeros(channel_count)
+        self._squares = numpy.zeros(channel_count)
+        self._sum = numpy.zeros(channel_count)
+        self._clips = numpy.zeros(channel_count, dtype='int64')
+
+    def _measure(self, block):
+        self._frames += block.shape[0]
+        self._position += block.shape[0]
+        if buffering.is_silent(block): return
+        # Vectorized over the channels, without copying the samples
+        peak = numpy.maximum(block.max(axis=0), -block.min(axis=0))
+        numpy.maximum(self._peak, peak, out=self._peak)
+        self._squares += numpy.einsum('ij,ij->j', block, block, dtype='float64')
+        self._sum += block.sum(axis=0)
+        if (peak >= 1).any():
+            self._clips += (block >= 1).sum(axis=0) + (block <= -1).sum(axis=0)
+
+    def _publish(self):
+        rms = numpy.sqrt(self._squares / self._frames)
+        self.snapshot = MeterSnapshot(
+            position=self._position,
+            peak=tuple(self._peak.tolist()),
+            rms=tuple(rms.tolist()),
+            clips=tuple(self._clips.tolist()),
+            dc_offset=tuple((self._sum / self._frames).tolist()),
+            silent=tuple((rms < self.silence_level).tolist())
+        )
+meter.next = meter.__next__ # Compatibility Python 2
+
+
+def measure_loudness(filename):
+    """
+    Measures the loudness of the wav file `filename` in one pass, and returns a dictionary
+    `{'integrated': <LUFS>, 'true_peak': <dBTP>}`. Results are persisted
+    in `config.loudness_cache`, so a file is measured only once.
+    """
+    cache = loudness.get_cache()
+    results = cache.get(filename)
+    if results is None:
+        # Measured at the rate of the file, which is the rate the meter is built for
+        blocks = read_wav(filename, convert_rate=False)
+        meter = loudness.Meter(blocks.infos['channel_count'], blocks.infos['frame_rate'])
+        for block in blocks:
+            meter.process(block)
+        results = meter.results()
+        cache.set(filename, results)
+    return results
+
+
+class normalize(object):
+    """
+    Reads the wav file `filename`, applying a gain so that its integrated loudness
+    is `target` LUFS (EBU R128 recommends -23, ReplayGain 2.0 uses -18).
+    If `peak_limit` is not `None`, the gain is reduced so that the true-peak
+    doesn't exceed `peak_limit` dBTP.
+    """
+
+    def __init__(self, filename, target=-23, peak_limit=-1, start=0, end=None):
+        results = measure_loudness(filename)
+        gain = 0
+        if results['integrated'] != float('-inf'):
+            gain = target - results['integrated']
+            if peak_limit is not None:
+                gain = min(gain, peak_limit - results['true_peak'])
+        self.gain = 10 ** (gain / 20.0)
+        self.source = read_wav(filename, start=start, end=end)
+        self.infos = self.source.infos
+
+    def frame_count_hint(self):
+        return self.source.frame_count_hint()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.source) * self.gain
+normalize.next = normalize.__next__ # Compatibility Python 2
+
+
+def to_raw(source, reuse_buffer=False):
+    """
+    Converts the blocks from `source` to raw 16-bit PCM byte strings.
+    If `reuse_buffer` is `True`, all the blocks are encoded into the same buffer,
+    and memoryviews of that buffer are yielded instead. Each memoryview is therefore
+    only valid until the next block is pulled.
+    """
+    if not reuse_buffer:
+        with _until_StopIteration(): 
+            while True:
+                block = next(source)
+                if buffering.is_silent(block): yield b'\x00' * (block.size * 2)
+                else:
+                    raw = pcm.samples_to_string(block)
+                    buffering.pool.release(block)
+                    del block
+                    yield raw
+        return
+
+    raw = bytearray()
+    samples_int = numpy.frombuffer(raw, dtype='int16')
+    zeros = bytearray()
+    with _until_StopIteration():
         while True:
-            yield pcm.samples_to_string(next(source))
+            block = next(source)
+            size = block.size
+            if buffering.is_silent(block):
+                if len(zeros) < size * 2: zeros = bytearray(size * 2)
+                yield memoryview(zeros)[:size * 2]
+                continue
+            if len(raw) < size * 2:
+                raw = bytearray(size * 2)
+                samples_int = numpy.frombuffer(raw, dtype='int16')
+            pcm.float_to_int(block, out=samples_int[:size].reshape(block.shape))
+            buffering.pool.release(block)
+            del block
+            yield memoryview(raw)[:size * 2]
+
+
+class from_raw(object):
+    """
+    Reads raw PCM data from the file-like `fileobj` (file, pipe, socket file ...),
+    and yields blocks of `config.block_size` frames. `dtype` is the sample format,
+    either `'int16'` or `'float32'`. Data is read with `readinto`,
+    in a buffer that is allocated only once.
+    """
+
+    def __init__(self, fileobj, channel_count, dtype='int16'):
+        self.fileobj = fileobj
+        self.channel_count = channel_count
+        self.dtype = numpy.dtype(dtype)
+        if not self.dtype in (numpy.dtype('int16'), numpy.dtype('float32')):
+            raise ValueError('unsupported dtype %s' % dtype)
+        self.frame_size = channel_count * self.dtype.itemsize
+        self._raw = bytearray()
+        self._pending = 0           # bytes of an incomplete frame, at the beginning of `_raw`
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        size = config.block_size * self.frame_size
+        if len(self._raw) != size:
+            raw = bytearray(size)
+            raw[:self._pending] = self._raw[:self._pending]
+            self._raw = raw
+
+        # Sockets and pipes might return less data than asked
+        filled = self._pending
+        view = memoryview(self._raw)
+        while filled < size:
+            count = self.fileobj.readinto(view[filled:])
+            if not count: break
+            filled += count
+        del view
+
+        frame_count = filled // self.frame_size
+        if frame_count == 0: raise StopIteration
+        samples = numpy.frombuffer(self._raw, dtype=self.dtype, count=frame_count * self.channel_count)
+        samples = samples.reshape((frame_count, self.channel_count))
+        if self.dtype == numpy.dtype('int16'):
+            block = pcm.int_to_float(samples)
+        else:
+            block = samples.astype('float64')
+
+        # Keep the bytes of an incomplete frame for next time
+        self._pending = filled - frame_count * self.frame_size
+        self._raw[:self._pending] = self._raw[frame_count * self.frame_size:filled]
+        return block
+from_raw.next = from_raw.__next__ # Compatibility Python 2
 
 
 def concatenate(source):
     """
     Concatenates all the blocks generated by source until exhaustion into one single block,
-    and returns it. 
+    and returns it. If `source` advertises how many frames it will generate
+    (see `frame_count_hint`), the output is allocated only once. Otherwise,
+    it grows geometrically.
+    """
+    try:
+        return buffering.Buffer(source).drain()
+    except StopIteration:
+        return numpy.concatenate([])
+
+
+def frame_count_hint(source):
     """
-    blocks = []
-    with _until_StopIteration(): 
+    Returns the number of frames that `source` will still generate,
+    or `None` if this is unknown. Sources can advertise it by implementing
+    a method `frame_count_hint`.
+    """
+    if hasattr(source, 'frame_count_hint'):
+        return source.frame_count_hint()
+    return None
+
+
+def playback(source, latency=0.1, backend='pyaudio', audit=None, **options):
+    """
+    Plays `source` back. Blocks are rendered ahead by a producer thread,
+    `latency` seconds in advance. Returns the `core.playback.Engine` used,
+    which can be inspected for underruns and callback timings.
+
+    `backend` is the name of a backend registered in `core.backends`, or a backend instance.
+    Available backends are `'pyaudio'`, `'null'` (consumes the audio as fast as possible),
+    `'paced'` (simulates a realtime output) and `'file'` (writes to `filelike`).
+    Extra keyword arguments are passed as options to the backend :
+
+        stream.playback(source, backend='file', filelike='out.wav')
+
+    `audit` is an optional `core.audit.Audit`, to audit the realtime safety of `source`.
+    """
+    if not isinstance(backend, backends.Backend):
+        backend = backends.get(backend, **options)
+    if audit is not None:
+        source = audit.wrap(source)
+        audit.start()
+    try:
+        buf = buffering.Buffer(source)
+        channel_count = buf.peek()[0].shape[1]
+        engine = core_playback.Engine(buf, channel_count, latency=latency)
+        engine.start()
+        try:
+            backend.run(engine)
+        finally:
+            engine.stop()
+    finally:
+        if audit is not None: audit.stop()
+    return engine
+
+
+def _imap_window(pool, func, jobs, window):
+    """
+    Same as `pool.imap(func, jobs)`, but with at most `window` jobs
+    submitted and not consumed yet.
+    """
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(func, (job,)))
+        if len(pending) >= window: yield pending.popleft().get()
+    while pending: yield pending.popleft().get()
+
+
+def _render_segment(job):
+    """
+    Renders `frame_count` frames of the timeline from frame `start`, as int16 PCM samples.
+    If the timeline generated nothing, the samples returned have 0 channels.
+    """
+    factory, start, preroll_frames, frame_count = job
+    source = factory(float(start - preroll_frames) / config.frame_rate)
+    samples = None
+    position = -preroll_frames
+    with _until_StopIteration():
+        while position < frame_count:
+            block = next(source)
+            if samples is None:
+                samples = numpy.zeros((frame_count, block.shape[1]), dtype='int16')
+            # Part of the block that is in the segment, after the pre-roll
+            block_start, block_end = max(-position, 0), min(block.shape[0], frame_count - position)
+            if block_end > block_start:
+                pcm.float_to_int(block[block_start:block_end],
+                    out=samples[position + block_start:position + block_end])
+            position += block.shape[0]
+    if samples is None: return numpy.zeros((frame_count, 0), dtype='int16')
+    return samples
+
+
+def _prepend_silence(source, frame_count):
+    """
+    Yields `frame_count` frames of silence, then all the blocks from `source`.
+    """
+    with _until_StopIteration():
+        block = next(source)
+        if frame_count: yield buffering.silence(frame_count, block.shape[1])
         while True:
-            blocks.append(next(source))
-    return numpy.concatenate(blocks)
+            yield block
+            block = next(source)
 
 
-def playback(source):
-    buf = buffering.Buffer(source)
-    channel_count = buf.fill(1).shape[1]
+_windows = {
+    'hann': numpy.hanning,
+    'hamming': numpy.hamming,
+    'blackman': numpy.blackman
+}
 
-    def callback(in_data, current_time, time_info, status):
-        block = buf.pull(current_time)
-        block_size = block.shape[0]
-        if block_size == current_time:
-            return (pcm.float_to_int(block), pyaudio.paContinue)
-        elif block_size > 0:
-            return (pcm.float_to_int(block), pyaudio.paComplete)
-        else:
-            return (None, pyaudio.paComplete)
-
-    p = pyaudio.PyAudio()
-    stream = p.open(
-        format=p.get_format_from_width(2), # Only format supported right now 16bits
-        channels=channel_count, 
-        rate=config.frame_rate,
-        output=True,
-        stream_callback=callback
-    )
-
-    stream.start_stream()
-    while stream.is_active():
-        time.sleep(0.05)
-
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
+
+def _get_window(window, size):
+    """
+    Returns the periodic window named `window` of `size` frames.
+    """
+    if window is None: return numpy.ones(size)
+    elif hasattr(window, 'shape'):
+        if window.shape != (size,):
+            raise ValueError('window should be an array of shape (%s,)' % size)
+        return window
+    try:
+        return _windows[window](size + 1)[:-1]
+    except KeyError:
+        raise ValueError('unknown window %s' % window)
 
 
 @contextmanager
@@ -75,6 +75,27 @@ class Resampler_test(unittest.TestCase):
             numpy.round(block, 8)
         )
 
+    def batch_test(self):
+        blocks = numpy.array([
+            numpy.arange(0, 9).reshape(9, 1),
+            numpy.arange(10, 19).reshape(9, 1)
+        ])
+        actual = chunk.resample(blocks, 4)
+        self.assertEqual(actual.shape, (2, 3, 1))
+        numpy.testing.assert_array_equal(actual[:,:,0], [[0, 4, 8], [10, 14, 18]])
+
+    def ragged_batch_test(self):
+        blocks = [numpy.random.random((n, 2)) for n in [10, 7, 1, 13]]
+        batch, lengths = chunk.stack(blocks)
+        for ratio in [0.5, 1.7, 3]:
+            actual, lengths_out = chunk.resample(batch, ratio, lengths=lengths)
+            for i, block in enumerate(blocks):
+                expected = chunk.resample(block, ratio)
+                self.assertEqual(lengths_out[i], expected.shape[0])
+                numpy.testing.assert_array_almost_equal(actual[i,:lengths_out[i]], expected)
+                # Padding is zeros
+                self.assertTrue((actual[i,lengths_out[i]:] == 0).all())
+
 
 class fix_channel_count_Test(unittest.TestCase):
     
@@ -92,6 +113,13 @@ class fix_channel_count_Test(unittest.TestCase):
         down_mixed_samples = numpy.array([[0, 1, 2, 3, 4]]).transpose()
         numpy.testing.assert_array_equal(chunk.fix_channel_count(samples, 1), down_mixed_samples)
 
+    def batch_test(self):
+        samples = numpy.array([[[0, 1, 2], [5, 6, 7]], [[10, 11, 12], [15, 16, 17]]]).transpose((0, 2, 1))
+        actual = chunk.fix_channel_count(samples, 4)
+        self.assertEqual(actual.shape, (2, 3, 4))
+        numpy.testing.assert_array_equal(actual[1], [[10, 15, 15, 15], [11, 16, 16, 16], [12, 17, 17, 17]])
+        numpy.testing.assert_array_equal(chunk.fix_channel_count(samples, 1), samples[:,:,:1])
+
 
 class fix_frame_count_Test(unittest.TestCase):
 
@@ -121,9 +149,30 @@ class fix_frame_count_Test(unittest.TestCase):
         cropped_samples = numpy.array([[2, 3, 4], [7, 8, 9]]).transpose()
         numpy.testing.assert_array_equal(chunk.fix_frame_count(samples, -3), cropped_samples)
 
+    def batch_test(self):
+        samples = numpy.array([[[1, 2, 3]], [[4, 5, 6]]]).transpose((0, 2, 1))
+        numpy.testing.assert_array_equal(chunk.fix_frame_count(samples, 4)[:,:,0], [[1, 2, 3, 0], [4, 5, 6, 0]])
+        numpy.testing.assert_array_equal(chunk.fix_frame_count(samples, -2)[:,:,0], [[2, 3], [5, 6]])
+
+    def ragged_batch_test(self):
+        batch, lengths = chunk.stack([numpy.array([[1], [2], [3]]), numpy.array([[4]])])
+        actual, lengths_out = chunk.fix_frame_count(batch, 2, lengths=lengths)
+        numpy.testing.assert_array_equal(actual[:,:,0], [[1, 2], [4, 0]])
+        numpy.testing.assert_array_equal(lengths_out, [2, 2])
+
+        actual, lengths_out = chunk.fix_frame_count(batch, -2, lengths=lengths)
+        numpy.testing.assert_array_equal(actual[:,:,0], [[2, 3], [0, 4]])
+
+        actual, lengths_out = chunk.reshape(batch, channel_count=2, frame_count=-4, lengths=lengths)
+        self.assertEqual(actual.shape, (2, 4, 2))
+        numpy.testing.assert_array_equal(actual[:,:,1], [[0, 1, 2, 3], [0, 0, 0, 4]])
+
 
 class read_wav_Test(unittest.TestCase):
 
+    def tearDown(self):
+        config.frame_rate = 44100
+
     def simple_file_test(self):
         samples, infos = chunk.read_wav(STEPS_STEREO_16B)
 
@@ -166,6 +215,15 @@ class read_wav_Test(unittest.TestCase):
         samples, infos = chunk.read_wav(A440_MONO_16B, start=0, end=0)
         self.assertEqual(samples.shape, (0, 1))
 
+    def convert_rate_test(self):
+        config.frame_rate = 48000
+        samples, infos = chunk.read_wav(STEPS_STEREO_16B)
+        self.assertEqual(infos['frame_rate'], 44100)
+        self.assertEqual(samples.shape, (100800, 2))
+
+        samples, infos = chunk.read_wav(STEPS_STEREO_16B, convert_rate=False)
+        self.assertEqual(samples.shape, (92610, 2))
+
 
 class write_wav_Test(unittest.TestCase):
 
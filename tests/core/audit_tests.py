@@ -0,0 +1,138 @@
+import gc
+import time
+from tempfile import NamedTemporaryFile
+import unittest
+
+import numpy
+
+from pychedelic.core import audit as core_audit
+from pychedelic.core.audit import Audit
+from pychedelic import stream
+from pychedelic import config
+
+
+def quiet():
+    for i in range(4):
+        yield numpy.ones((1024, 1)) * 0.1
+
+
+def slow():
+    for i in range(4):
+        if i == 2: time.sleep(0.05)
+        yield numpy.ones((1024, 1)) * 0.1
+
+
+def allocating():
+    kept = []
+    for i in range(4):
+        kept.append(numpy.ones(100000))
+        yield numpy.ones((1024, 1)) * 0.1
+
+
+def temporary():
+    for i in range(4):
+        numpy.ones(100000).sum()
+        yield numpy.ones((1024, 1)) * 0.1
+
+
+def collecting():
+    for i in range(4):
+        if i == 1: gc.collect()
+        yield numpy.zeros((1024, 1))
+
+
+class Audit_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+        config.block_size = 1024
+
+    def stages_test(self):
+        audit = Audit()
+        mixer = stream.mixer(1)
+        mixer.plug(quiet())
+        mixer.plug(stream.iter(numpy.zeros((4096, 1))))
+        stream.write_wav(mixer, NamedTemporaryFile(), audit=audit)
+
+        report = audit.report()
+        self.assertEqual(report['blocks'], 4)
+        self.assertEqual(sorted((stage['path'], stage['calls']) for stage in report['stages']),
+            [('mixer', 5), ('mixer[0]/quiet', 5), ('mixer[1]/iter', 5)])
+        self.assertTrue(report['worst_stage'] in ['mixer', 'mixer[0]/quiet', 'mixer[1]/iter'])
+        self.assertTrue('mixer[0]/quiet' in audit.format_report())
+
+    def restore_sources_test(self):
+        audit = Audit()
+        mixer = stream.mixer(1)
+        mixer.plug(quiet())
+        buf = mixer.sources[0]
+        source = buf.source
+        resampled = stream.resample(mixer)
+        stream.write_wav(resampled, NamedTemporaryFile(), audit=audit)
+        self.assertEqual(len(audit.stages), 3)
+        # The stages are not wrapped anymore once the audit is over
+        self.assertTrue(resampled.source.source is mixer)
+        self.assertTrue(buf.source is source)
+
+    def late_block_test(self):
+        audit = Audit()
+        mixer = stream.mixer(1)
+        mixer.plug(quiet())
+        mixer.plug(slow())
+        stream.write_wav(mixer, NamedTemporaryFile(), audit=audit)
+
+        # Other blocks can be late too on a loaded machine, but block 2 must be
+        late_blocks = dict((late[0], late) for late in audit.report()['late_blocks'])
+        self.assertTrue(2 in late_blocks)
+        block_index, duration, deadline, path = late_blocks[2]
+        self.assertEqual(path, 'mixer[1]/slow')
+        self.assertEqual(deadline, 1024 / 44100.0)
+        self.assertTrue(duration >= 0.05)
+        self.assertEqual(audit.report()['worst_stage'], 'mixer[1]/slow')
+
+    def playback_test(self):
+        audit = Audit(freeze_gc=True)
+        enabled = []
+
+        def source():
+            for i in range(4):
+                enabled.append(gc.isenabled())
+                yield numpy.zeros((1024, 1))
+
+        stream.playback(source(), backend='null', audit=audit)
+        self.assertEqual(audit.report()['blocks'], 4)
+        self.assertEqual(enabled, [False] * 4)
+        self.assertTrue(gc.isenabled())
+
+    @unittest.skipIf(core_audit.tracemalloc is None, 'tracemalloc is not available')
+    def allocations_test(self):
+        audit = Audit()
+        mixer = stream.mixer(1)
+        mixer.plug(quiet())
+        mixer.plug(allocating())
+        stream.write_wav(mixer, NamedTemporaryFile(), audit=audit)
+
+        stages = dict((stage['path'], stage) for stage in audit.report()['stages'])
+        self.assertTrue(stages['mixer[1]/allocating']['max_allocated'] >= 800000)
+        self.assertTrue(stages['mixer[0]/quiet']['max_allocated'] < 800000)
+
+    @unittest.skipIf(not hasattr(core_audit.tracemalloc, 'reset_peak'), 'tracemalloc.reset_peak is not available')
+    def temporary_allocations_test(self):
+        audit = Audit()
+        mixer = stream.mixer(1)
+        mixer.plug(quiet())
+        mixer.plug(temporary())
+        stream.write_wav(mixer, NamedTemporaryFile(), audit=audit)
+
+        stages = dict((stage['path'], stage) for stage in audit.report()['stages'])
+        self.assertTrue(stages['mixer[1]/temporary']['max_allocated'] >= 800000)
+        self.assertTrue(stages['mixer[0]/quiet']['max_allocated'] < 800000)
+        self.assertTrue(stages['mixer']['max_allocated'] < 800000)
+
+    @unittest.skipIf(not hasattr(gc, 'callbacks'), 'gc.callbacks is not available')
+    def gc_pauses_test(self):
+        audit = Audit()
+        stream.write_wav(collecting(), NamedTemporaryFile(), audit=audit)
+        gc_pauses = audit.report()['gc_pauses']
+        self.assertTrue(len(gc_pauses) >= 1)
+        self.assertTrue((1, 'collecting') in [(pause[0], pause[3]) for pause in gc_pauses])
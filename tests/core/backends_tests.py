@@ -0,0 +1,76 @@
+import io
+import time
+import unittest
+
+import numpy
+
+from pychedelic.core import backends
+from pychedelic.core import pcm
+from pychedelic.core.playback import Engine
+from pychedelic import config
+
+
+class backends_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.block_size = 1024
+
+    def register_test(self):
+        class MyBackend(backends.Backend):
+            def run(self, engine): pass
+        backends.register('mine', MyBackend)
+        backend = backends.get('mine', bla=1)
+        self.assertTrue(isinstance(backend, MyBackend))
+        self.assertEqual(backend.options, {'bla': 1})
+        self.assertRaises(ValueError, backends.get, 'unknown')
+
+    def null_test(self):
+        consumed = []
+
+        def gen():
+            for i in range(20):
+                block = numpy.zeros((100, 1))
+                consumed.append(block)
+                # The producer is slower than the backend, which has to wait
+                time.sleep(0.001)
+                yield block
+
+        engine = Engine(gen(), 1, latency=100.0 / config.frame_rate)
+        engine.start()
+        backends.get('null', period=64).run(engine)
+        engine.stop()
+        self.assertEqual(len(consumed), 20)
+        self.assertEqual(engine.underruns, 0)
+
+    def paced_test(self):
+        config.block_size = 10
+
+        def gen():
+            yield numpy.zeros((20, 1))
+            time.sleep(0.05)
+            yield numpy.zeros((20, 1))
+
+        engine = Engine(gen(), 1, latency=20.0 / config.frame_rate)
+        engine.start()
+        backend = backends.get('paced', period=10, speed=100)
+        started = time.time()
+        backend.run(engine)
+        engine.stop()
+        self.assertTrue(engine.underruns > 0)
+        self.assertEqual(len(backend.underrun_times), engine.underruns)
+        # The exact period at which the first underrun happens depends on
+        # thread scheduling, but it can't be later than the end of the first block.
+        period_duration = 10.0 / config.frame_rate
+        self.assertTrue(0 <= backend.underrun_times[0] <= 20.0 / config.frame_rate)
+        self.assertEqual(backend.underrun_times, sorted(backend.underrun_times))
+        for underrun_time in backend.underrun_times:
+            self.assertAlmostEqual(underrun_time / period_duration, round(underrun_time / period_duration))
+
+    def file_raw_test(self):
+        samples = numpy.random.random((500, 2)) * 2 - 1
+        engine = Engine(iter([samples[:200], samples[200:]]), 2, latency=64.0 / config.frame_rate)
+        engine.start()
+        fd = io.BytesIO()
+        backends.get('file', filelike=fd, format='raw', period=50).run(engine)
+        engine.stop()
+        self.assertEqual(fd.getvalue(), pcm.float_to_int(samples).tobytes())
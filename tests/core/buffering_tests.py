@@ -2,7 +2,7 @@ import unittest
 
 import numpy
 
-from pychedelic.core.buffering import Buffer
+from pychedelic.core.buffering import Buffer, RingBuffer, BlockPool, Silence, silence, is_silent
 
 
 class Buffer_Test(unittest.TestCase):
@@ -247,4 +247,183 @@ class Buffer_Test(unittest.TestCase):
         buf = Buffer(gen())
         numpy.testing.assert_array_equal(buf.pull_all(), [
             [0], [11], [22], [33], [44], [55]
-        ])
\ No newline at end of file
+        ])
+
+    def pull_all_buffered_test(self):
+        def gen():
+            for i in range(6):
+                yield numpy.array([[i * 11], [i * 11 + 1]])
+        buf = Buffer(gen())
+        numpy.testing.assert_array_equal(buf.pull(3), [[0], [1], [11]])
+        numpy.testing.assert_array_equal(buf.pull_all(), [
+            [12], [22], [23], [33], [34], [44], [45], [55], [56]
+        ])
+        self.assertRaises(StopIteration, buf.pull_all)
+
+    def peek_test(self):
+        samples = numpy.arange(10).reshape((5, 2))
+        def gen():
+            yield samples
+            yield samples * 10
+        buf = Buffer(gen())
+        blocks = buf.peek()
+        self.assertEqual(len(blocks), 1)
+        self.assertTrue(numpy.may_share_memory(blocks[0], samples))
+
+        buf.pull(3)
+        blocks = buf.peek(4)
+        self.assertEqual([block.shape for block in blocks], [(2, 2), (5, 2)])
+        numpy.testing.assert_array_equal(blocks[0], [[6, 7], [8, 9]])
+        numpy.testing.assert_array_equal(buf.pull(3), [[6, 7], [8, 9], [0, 10]])
+        buf.pull(4)
+        self.assertRaises(StopIteration, buf.peek)
+
+    def drain_hint_test(self):
+        class Source(object):
+            def __init__(self):
+                self.blocks = [numpy.ones((3, 1)) * i for i in range(4)]
+            def frame_count_hint(self):
+                return 3 * len(self.blocks)
+            def __next__(self):
+                if not self.blocks: raise StopIteration
+                return self.blocks.pop(0)
+            next = __next__
+
+        buf = Buffer(Source())
+        buf.pull(2)
+        block = buf.drain()
+        self.assertTrue(block.flags.owndata)
+        numpy.testing.assert_array_equal(block[:,0], [0] + [1] * 3 + [2] * 3 + [3] * 3)
+
+
+class silence_Test(unittest.TestCase):
+
+    def silence_test(self):
+        block = silence(1000, 2)
+        self.assertEqual(block.shape, (1000, 2))
+        self.assertTrue(is_silent(block))
+        self.assertTrue(is_silent(block[10:20]))
+        self.assertFalse(is_silent(numpy.zeros((1000, 2))))
+        self.assertFalse(block.flags.writeable)
+        numpy.testing.assert_array_equal(block, numpy.zeros((1000, 2)))
+
+    def computations_not_silent_test(self):
+        block = silence(4, 1)
+        self.assertFalse(is_silent(block + 1))
+        self.assertFalse(is_silent(block.copy()))
+        self.assertFalse(is_silent(numpy.concatenate([block, numpy.ones((1, 1))])))
+        self.assertEqual(block.sum(), 0)
+
+    def writable_copies_not_silent_test(self):
+        block = silence(4, 1)
+        for copy in [block.astype('float32'), numpy.tile(block, (2, 1)), block.repeat(2, axis=0)]:
+            copy[0, 0] = 1
+            self.assertFalse(is_silent(copy))
+
+    def pad_silent_test(self):
+        def gen():
+            yield numpy.ones((3, 2))
+        buf = Buffer(gen())
+        block = buf.pull(5, pad=True)
+        self.assertFalse(is_silent(block))
+        numpy.testing.assert_array_equal(block, [[1, 1]] * 3 + [[0, 0]] * 2)
+
+    def pull_silent_test(self):
+        def gen():
+            yield silence(3, 1)
+            yield numpy.array([[1], [2]])
+            yield silence(4, 1)
+        buf = Buffer(gen())
+        blocks = [buf.pull(2) for i in range(0, 4)]
+        self.assertEqual([is_silent(block) for block in blocks], [True, False, False, True])
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks), [[0], [0], [0], [1], [2], [0], [0], [0]])
+
+    def pad_writable_test(self):
+        def gen():
+            yield silence(3, 1)
+        buf = Buffer(gen())
+        buf.pull(2)
+        # Padding is not silence, only the frames pulled from the source can be
+        block = buf.pull(3, pad=True)
+        self.assertFalse(is_silent(block))
+        block *= 0.5
+        numpy.testing.assert_array_equal(block, [[0], [0], [0]])
+
+
+class BlockPool_Test(unittest.TestCase):
+
+    def reuse_test(self):
+        pool = BlockPool()
+        block = pool.acquire(10, 2)
+        self.assertEqual((block.shape, block.dtype), ((10, 2), numpy.dtype('float64')))
+        block_id = id(block)
+        self.assertTrue(pool.release(block))
+        self.assertEqual(pool.stats()['resident_bytes'], 160)
+
+        block = pool.acquire(10, 2, zeros=True)
+        self.assertEqual(id(block), block_id)
+        numpy.testing.assert_array_equal(block, numpy.zeros((10, 2)))
+        self.assertNotEqual(id(pool.acquire(10, 2, dtype='float32')), block_id)
+        self.assertEqual(pool.stats(), {'acquired': 3, 'hits': 1, 'hit_rate': 1 / 3.0,
+            'released': 1, 'rejected': 0, 'resident_bytes': 0})
+
+    def still_in_use_test(self):
+        pool = BlockPool()
+        block = pool.acquire(10, 2)
+        blocks = [block]
+        self.assertFalse(pool.release(block))
+        del blocks
+        view = block[2:5]
+        self.assertFalse(pool.release(block))
+        self.assertFalse(pool.release(view))
+        del view
+        self.assertFalse(pool.release(silence(10, 2)))
+        self.assertEqual(pool.stats()['rejected'], 4)
+        self.assertTrue(pool.release(block))
+
+    def max_blocks_test(self):
+        pool = BlockPool(max_blocks=2)
+        for i in range(3):
+            block = numpy.empty((4, 1))
+            pool.release(block)
+        self.assertEqual(pool.stats()['resident_bytes'], 64)
+        # Only the blocks kept are counted as released
+        self.assertEqual(pool.stats()['released'], 2)
+        pool.clear()
+        self.assertEqual(pool.stats()['resident_bytes'], 0)
+
+    def max_bytes_test(self):
+        pool = BlockPool(max_bytes=100)
+        self.assertTrue(pool.release(numpy.empty((4, 1))))
+        self.assertTrue(pool.release(numpy.empty((5, 1))))
+        # The block of 4 frames is the least recently used, so it is freed first
+        self.assertTrue(pool.release(numpy.empty((6, 1))))
+        self.assertEqual(pool.stats()['resident_bytes'], 88)
+        pool.acquire(4, 1)
+        pool.acquire(5, 1)
+        self.assertEqual(pool.stats()['hits'], 1)
+
+        # Blocks bigger than the pool are not kept
+        self.assertFalse(pool.release(numpy.empty((20, 1))))
+        self.assertEqual(pool.stats()['released'], 3)
+
+
+class RingBuffer_Test(unittest.TestCase):
+
+    def wrap_around_test(self):
+        ring = RingBuffer(5, 2)
+        self.assertEqual((ring.available, ring.space), (0, 5))
+        ring.write(numpy.array([[1, -1], [2, -2], [3, -3]], dtype='int16'))
+        self.assertEqual((ring.available, ring.space), (3, 2))
+        self.assertEqual(ring.read(2), numpy.array([[1, -1], [2, -2]], dtype='int16').tobytes())
+
+        ring.write(numpy.array([[4, -4], [5, -5], [6, -6], [7, -7]], dtype='int16'))
+        self.assertEqual((ring.available, ring.space), (5, 0))
+        self.assertEqual(ring.read(10), numpy.array([
+            [3, -3], [4, -4], [5, -5], [6, -6], [7, -7]], dtype='int16').tobytes())
+        self.assertEqual(ring.read(10), b'')
+
+    def overflow_test(self):
+        ring = RingBuffer(3, 1)
+        ring.write(numpy.zeros((2, 1), dtype='int16'))
+        self.assertRaises(ValueError, ring.write, numpy.zeros((2, 1), dtype='int16'))
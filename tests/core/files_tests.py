@@ -0,0 +1,163 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from pychedelic.core import files
+
+
+FAKE_AVCONV = '''#!/bin/sh
+# Fake avconv, copying the input file to the output file, and logging the calls.
+echo "$@" >> "$FAKE_AVCONV_LOG"
+for last; do true; done
+if grep -q FAIL "$5"; then echo "invalid data in $5" >&2; exit 1; fi
+cp "$5" "$last"
+'''
+
+
+def cache_files(cache):
+    return [name for name in os.listdir(cache.directory) if not name.startswith('.')]
+
+
+def output_files(cache):
+    return [name for name in os.listdir(cache.directory) if name.startswith('.out-')]
+
+
+class convert_file_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        bin_dir = os.path.join(self.tempdir, 'bin')
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, 'avconv'), 'w') as fd: fd.write(FAKE_AVCONV)
+        os.chmod(os.path.join(bin_dir, 'avconv'), 0o755)
+        self.environ = dict(os.environ)
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_AVCONV_LOG'] = os.path.join(self.tempdir, 'log')
+        self.cache = files.ConversionCache(os.path.join(self.tempdir, 'cache'))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tempdir)
+
+    def make_file(self, name, content):
+        filename = os.path.join(self.tempdir, name)
+        with open(filename, 'w') as fd: fd.write(content)
+        return filename
+
+    def avconv_calls(self):
+        if not os.path.exists(os.environ['FAKE_AVCONV_LOG']): return 0
+        with open(os.environ['FAKE_AVCONV_LOG'], 'r') as fd:
+            return len(fd.readlines())
+
+    def cache_test(self):
+        filename = self.make_file('a.mp3', 'blabla')
+        converted = files.convert_file(filename, 'wav', cache=self.cache)
+        self.assertEqual(self.avconv_calls(), 1)
+        with open(converted, 'r') as fd: self.assertEqual(fd.read(), 'blabla')
+
+        # Same content, other file : converted file is reused
+        other_filename = self.make_file('b.mp3', 'blabla')
+        other_converted = files.convert_file(other_filename, 'wav', cache=self.cache)
+        self.assertNotEqual(other_converted, converted)
+        self.assertTrue(os.path.samefile(other_converted, converted))
+        self.assertEqual(self.avconv_calls(), 1)
+
+        # Other options, or other content
+        files.convert_file(filename, 'wav', options=['-ar', '48000'], cache=self.cache)
+        self.assertEqual(self.avconv_calls(), 2)
+        files.convert_file(self.make_file('a.mp3', 'blablabla'), 'wav', cache=self.cache)
+        self.assertEqual(self.avconv_calls(), 3)
+
+        # Copy to `to_filename`
+        to_filename = os.path.join(self.tempdir, 'c.wav')
+        self.assertEqual(files.convert_file(other_filename, 'wav', to_filename, cache=self.cache), to_filename)
+        with open(to_filename, 'r') as fd: self.assertEqual(fd.read(), 'blabla')
+        self.assertEqual(self.avconv_calls(), 3)
+
+        # No temporary file left behind
+        self.assertEqual([name for name in os.listdir(self.cache.directory) if name.startswith('.tmp')], [])
+
+    def same_format_test(self):
+        filename = self.make_file('a.wav', 'blabla')
+        self.assertEqual(files.convert_file(filename, 'wav', cache=self.cache), filename)
+        to_filename = os.path.join(self.tempdir, 'b.wav')
+        self.assertEqual(files.convert_file(filename, 'wav', to_filename, cache=self.cache), to_filename)
+        self.assertEqual(self.avconv_calls(), 0)
+
+    def error_test(self):
+        filename = self.make_file('a.mp3', 'FAIL')
+        try:
+            files.convert_file(filename, 'wav', cache=self.cache)
+        except files.ConversionError as err:
+            self.assertTrue('invalid data' in err.stderr)
+        else: raise AssertionError('should have failed')
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def eviction_test(self):
+        cache = files.ConversionCache(self.cache.directory, max_size=20)
+        filenames = [self.make_file('%s.mp3' % i, str(i) * 8) for i in range(3)]
+        # Converted files are removed right away, so they are not in use anymore
+        for filename in filenames[:2]: os.remove(files.convert_file(filename, 'wav', cache=cache))
+        converted = [cache.get(cache.key(filename, 'wav'), 'wav') for filename in filenames[:2]]
+        # Oldest file was used, so the other one will be evicted first
+        old_time = time.time() - 100
+        os.utime(converted[0], (old_time, old_time))
+        os.utime(converted[1], (old_time - 10, old_time - 10))
+        os.remove(files.convert_file(filenames[0], 'wav', cache=cache))
+        os.remove(files.convert_file(filenames[2], 'wav', cache=cache))
+        self.assertTrue(os.path.exists(converted[0]))
+        self.assertFalse(os.path.exists(converted[1]))
+
+        cache = files.ConversionCache(self.cache.directory, max_age=50)
+        os.utime(converted[0], (old_time, old_time))
+        cache.evict()
+        self.assertFalse(os.path.exists(converted[0]))
+        self.assertEqual(len(cache_files(cache)), 1)
+
+    def eviction_new_file_test(self):
+        # The file just converted is kept, even if it is bigger than `max_size`
+        cache = files.ConversionCache(self.cache.directory, max_size=5)
+        os.remove(files.convert_file(self.make_file('a.mp3', 'blablabla'), 'wav', cache=cache))
+        self.assertEqual(len(cache_files(cache)), 1)
+        cache.evict()
+        self.assertEqual(cache_files(cache), [])
+
+    def eviction_in_use_test(self):
+        cache = files.ConversionCache(self.cache.directory, max_size=10)
+        filename = self.make_file('a.mp3', 'blablabla')
+        with files.converted(filename, 'wav', cache=cache) as converted:
+            os.remove(files.convert_file(self.make_file('b.mp3', 'blobloblo'), 'wav', cache=cache))
+            # The file in use is not evicted, and counts in the size of the cache
+            cache.evict()
+            self.assertEqual(cache_files(cache), [os.path.basename(cache.get(cache.key(filename, 'wav'), 'wav'))])
+            with open(converted, 'r') as fd: self.assertEqual(fd.read(), 'blablabla')
+        # Removed once done
+        self.assertFalse(os.path.exists(converted))
+        self.assertEqual(output_files(cache), [])
+
+    def dead_process_outputs_test(self):
+        process = multiprocessing.Process(target=files.convert_file,
+            args=(self.make_file('a.mp3', 'blabla'), 'wav'), kwargs={'cache': self.cache})
+        process.start()
+        process.join()
+        # The process died without removing its converted file
+        self.assertEqual(len(output_files(self.cache)), 1)
+        self.cache.evict()
+        self.assertEqual(output_files(self.cache), [])
+
+    def convert_many_test(self):
+        filenames = [self.make_file('%s.mp3' % i, str(i)) for i in range(5)]
+        converted = files.convert_many(filenames, 'wav', processes=2, cache=self.cache)
+        self.assertEqual(len(converted), 5)
+        for i, filename in enumerate(converted):
+            with open(filename, 'r') as fd: self.assertEqual(fd.read(), str(i))
+
+        for filename in converted: os.remove(filename)
+
+        filenames.append(self.make_file('bad.mp3', 'FAIL'))
+        self.assertRaises(files.ConversionError, files.convert_many, filenames, 'wav', processes=2, cache=self.cache)
+        self.assertEqual(output_files(self.cache), [])
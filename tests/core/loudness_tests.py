@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from pychedelic.core import loudness
+from pychedelic import config
+
+
+def sine(amplitude, duration, freq=997, frame_rate=48000, channel_count=1):
+    time = numpy.arange(0, int(duration * frame_rate)) / float(frame_rate)
+    samples = amplitude * numpy.sin(2 * numpy.pi * freq * time)
+    return numpy.tile(samples.reshape((samples.shape[0], 1)), (1, channel_count))
+
+
+class Meter_Test(unittest.TestCase):
+
+    def sine_test(self):
+        """
+        A 0 dBFS 1 kHz sine yields -3.01 LUFS
+        """
+        meter = loudness.Meter(1, 48000)
+        meter.process(sine(1, 2))
+        self.assertEqual(round(meter.integrated, 1), -3.0)
+
+        meter = loudness.Meter(1, 44100)
+        meter.process(sine(0.1, 2, frame_rate=44100))
+        self.assertEqual(round(meter.integrated, 1), -23.0)
+
+    def stereo_test(self):
+        meter = loudness.Meter(2, 48000)
+        meter.process(sine(0.1, 2, channel_count=2))
+        self.assertEqual(round(meter.integrated, 1), -20.0)
+
+    def block_size_test(self):
+        """
+        Result doesn't depend on how the samples are cut in blocks.
+        """
+        samples = sine(0.5, 3) * numpy.linspace(0, 1, 3 * 48000).reshape((3 * 48000, 1))
+        meter1 = loudness.Meter(1, 48000)
+        meter1.process(samples)
+        meter2 = loudness.Meter(1, 48000)
+        for i in range(0, samples.shape[0], 1000):
+            meter2.process(samples[i:i+1000])
+        self.assertAlmostEqual(meter1.integrated, meter2.integrated)
+        self.assertAlmostEqual(meter1.true_peak, meter2.true_peak)
+
+    def gating_test(self):
+        """
+        Silence and very quiet parts are gated out.
+        """
+        meter = loudness.Meter(1, 48000)
+        meter.process(sine(0.1, 2))
+        meter.process(numpy.zeros((48000 * 5, 1)))
+        meter.process(sine(0.0001, 2))
+        # Only the blocks overlapping the end of the sine are not gated out
+        self.assertTrue(abs(meter.integrated + 23) < 0.5)
+
+    def silence_test(self):
+        meter = loudness.Meter(1, 48000)
+        self.assertEqual(meter.integrated, float('-inf'))
+        meter.process(numpy.zeros((48000, 1)))
+        self.assertEqual(meter.integrated, float('-inf'))
+        self.assertEqual(meter.true_peak, float('-inf'))
+
+    def true_peak_test(self):
+        """
+        Sine at fs/4 with a phase shift, so that samples never hit the actual peak.
+        """
+        time = numpy.arange(0, 48000)
+        samples = numpy.sin(numpy.pi / 2 * time + numpy.pi / 4).reshape((48000, 1))
+        meter = loudness.Meter(1, 48000)
+        meter.process(samples)
+        self.assertEqual(round(20 * numpy.log10(numpy.abs(samples).max()), 1), -3.0)
+        self.assertTrue(abs(meter.true_peak) < 0.5)
+
+
+class Cache_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def persist_test(self):
+        filename = os.path.join(self.tempdir, 'file.wav')
+        with open(filename, 'w') as fd: fd.write('blabla')
+        cache_path = os.path.join(self.tempdir, 'cache', 'loudness.json')
+
+        cache = loudness.Cache(cache_path)
+        self.assertEqual(cache.get(filename), None)
+        cache.set(filename, {'integrated': -12.5, 'true_peak': float('-inf')})
+
+        cache = loudness.Cache(cache_path)
+        self.assertEqual(cache.get(filename), {'integrated': -12.5, 'true_peak': float('-inf')})
+
+        # File changed
+        with open(filename, 'w') as fd: fd.write('blablabla')
+        self.assertEqual(cache.get(filename), None)
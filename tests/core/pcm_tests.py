@@ -0,0 +1,68 @@
+import unittest
+
+import numpy
+
+from pychedelic.core import pcm
+
+
+class float_to_int_Test(unittest.TestCase):
+
+    def simple_test(self):
+        samples = numpy.array([[0, 0.5], [1, -1], [2, -2], [0.00002, -0.00002]])
+        numpy.testing.assert_array_equal(pcm.float_to_int(samples), [
+            [0, 2**14], [2**15 - 1, -2**15], [2**15 - 1, -2**15], [1, -1]
+        ])
+
+    def out_test(self):
+        samples = numpy.random.random((50, 3)) * 2 - 1
+        out = numpy.zeros((50, 3), dtype='int16')
+        result = pcm.float_to_int(samples, out=out)
+        self.assertTrue(result is out)
+        # Scaling is done in float32
+        expected = numpy.rint((samples * 2**15).astype('float32')).astype('int16')
+        numpy.testing.assert_array_equal(out, expected)
+
+    def big_block_test(self):
+        # Not clipped, so the expected values are easy to compute
+        samples = (numpy.random.random((pcm.SCRATCH_SIZE + 100, 3)) * 2 - 1) * 0.99
+        expected = numpy.rint((samples * 2**15).astype('float32')).astype('int16')
+        numpy.testing.assert_array_equal(pcm.float_to_int(samples), expected)
+        numpy.testing.assert_array_equal(pcm.float_to_int(samples[:,0]), expected[:,0])
+        # Converted by chunks, so the scratch buffer doesn't grow with the block
+        self.assertTrue(pcm._local.scratch.size <= pcm.SCRATCH_SIZE)
+
+    def dither_test(self):
+        samples = numpy.zeros((10000, 2))
+        for kind in ['tpdf', 'highpass']:
+            dithered = pcm.float_to_int(samples, dither=pcm.Dither(kind, seed=1))
+            self.assertEqual(set(numpy.unique(dithered)), set([-1, 0, 1]))
+            self.assertTrue(abs(dithered.mean()) < 0.05)
+
+        # Same seed, same noise
+        numpy.testing.assert_array_equal(
+            pcm.float_to_int(samples, dither=pcm.Dither(seed=2)),
+            pcm.float_to_int(samples, dither=pcm.Dither(seed=2))
+        )
+        self.assertRaises(ValueError, pcm.Dither, 'blabla')
+
+    def highpass_dither_test(self):
+        """
+        The noise is continuous across blocks, and its energy is in the high frequencies.
+        """
+        dither = pcm.Dither('highpass', seed=3)
+        scaled = numpy.zeros((20000, 1))
+        dither.add_noise(scaled[:10000])
+        dither.add_noise(scaled[10000:])
+        spectrum = numpy.abs(numpy.fft.rfft(scaled[:,0])) ** 2
+        self.assertTrue(spectrum[:2500].sum() * 10 < spectrum[2500:].sum())
+
+
+class int_to_float_Test(unittest.TestCase):
+
+    def out_test(self):
+        samples = numpy.array([[0, 2**14], [2**15 - 1, -2**15]], dtype='int16')
+        out = numpy.zeros((2, 2), dtype='float32')
+        result = pcm.int_to_float(samples, out=out)
+        self.assertTrue(result is out)
+        numpy.testing.assert_array_equal(out, [[0, 0.5], [(2**15 - 1) / float(2**15), -1]])
+        self.assertEqual(pcm.int_to_float(samples).dtype, numpy.float64)
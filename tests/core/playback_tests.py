@@ -0,0 +1,94 @@
+import threading
+import unittest
+
+import numpy
+
+from pychedelic.core.playback import Engine, Histogram
+from pychedelic.core import pcm
+from pychedelic import config
+
+
+class Engine_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+        config.block_size = 1024
+
+    def read_all_test(self):
+        config.block_size = 10
+        samples = numpy.random.random((95, 2)) * 2 - 1
+
+        def gen():
+            for i in range(0, 95, 7):
+                yield samples[i:i+7]
+
+        engine = Engine(gen(), 2, latency=30.0 / config.frame_rate)
+        engine.start()
+        data = b''
+        done = False
+        while not done:
+            chunk, done = engine.read(16, wait=True)
+            data += chunk
+        engine.stop()
+        self.assertEqual(engine.underruns, 0)
+        self.assertEqual(data, pcm.float_to_int(samples).tobytes())
+
+    def source_error_test(self):
+        config.block_size = 10
+
+        def gen():
+            for i in range(0, 3):
+                yield numpy.ones((10, 1)) * 0.5
+            raise RuntimeError('source failed')
+
+        engine = Engine(gen(), 1, latency=20.0 / config.frame_rate)
+        engine.start()
+        data = b''
+        done = False
+        with self.assertRaises(RuntimeError):
+            while not done:
+                chunk, done = engine.read(10, wait=True)
+                data += chunk
+        self.assertEqual(data, pcm.float_to_int(numpy.ones((30, 1)) * 0.5).tobytes())
+        engine.stop()
+
+        # If the error was not raised by `read`, it is raised by `stop`
+        engine = Engine(gen(), 1, latency=20.0 / config.frame_rate)
+        engine.start()
+        engine.read(20)
+        # The producer thread ends when the source raises
+        engine._thread.join(5)
+        self.assertFalse(engine._thread.is_alive())
+        self.assertRaises(RuntimeError, engine.stop)
+
+    def underrun_test(self):
+        config.block_size = 10
+
+        resume = threading.Event()
+
+        def gen():
+            yield numpy.zeros((10, 1))
+            # The producer is late until the second read is done
+            resume.wait(5)
+            yield numpy.zeros((10, 1))
+
+        engine = Engine(gen(), 1, latency=10.0 / config.frame_rate)
+        engine.start()
+        self.assertEqual(engine.read(10), (b'\x00' * 20, False))
+        data, done = engine.read(10)
+        self.assertEqual((data, done), (b'\x00' * 20, False))
+        self.assertEqual(engine.underruns, 1)
+        resume.set()
+        engine.stop()
+        self.assertEqual(engine.stats()['underruns'], 1)
+        self.assertEqual(sum(count for bound, count in engine.stats()['callback_times']), 2)
+
+
+class Histogram_Test(unittest.TestCase):
+
+    def add_test(self):
+        histogram = Histogram(min_exponent=-3, max_exponent=0)
+        for value in [0.01, 0.1, 0.2, 0.3, 10]:
+            histogram.add(value)
+        self.assertEqual(histogram.counts(), [(0.125, 2), (0.25, 1), (0.5, 1), (float('inf'), 1)])
+        self.assertEqual(histogram.max, 10)
@@ -0,0 +1,64 @@
+import unittest
+
+import numpy
+
+from pychedelic.core import resampling
+
+
+def sine(freq, frame_count, frame_rate, amplitude=0.5):
+    time = numpy.arange(0, frame_count) / float(frame_rate)
+    return (amplitude * numpy.sin(2 * numpy.pi * freq * time)).reshape((frame_count, 1))
+
+
+class Resampler_Test(unittest.TestCase):
+
+    def ratio_test(self):
+        resampler = resampling.Resampler(48000, 44100, 1)
+        self.assertEqual((resampler.up, resampler.down), (147, 160))
+        self.assertEqual(resampler.output_frame_count(48000), 44100)
+        # Filters are cached
+        self.assertTrue(resampling.get_filter(147, 160) is resampler._phases)
+
+    def sine_test(self):
+        """
+        Sine resampled from 48kHz to 44.1kHz, and from 22.05kHz to 44.1kHz
+        """
+        for rate_in, rate_out in [(48000, 44100), (22050, 44100)]:
+            resampler = resampling.Resampler(rate_in, rate_out, 1)
+            samples = sine(1000, rate_in, rate_in)
+            actual = numpy.concatenate([resampler.process(samples), resampler.flush()])
+            self.assertEqual(actual.shape, (rate_out, 1))
+            expected = sine(1000, rate_out, rate_out)
+            # Edges are not compared, as the signal starts abruptly there
+            self.assertTrue(numpy.abs(actual - expected)[100:-100].max() < 1e-4)
+
+    def int16_test(self):
+        """
+        int16 samples are scaled to [-1, 1]
+        """
+        samples = sine(440, 4800, 48000)
+        samples_int = numpy.round(samples * 2**15).astype('int16')
+        resampler = resampling.Resampler(48000, 44100, 1)
+        expected = numpy.concatenate([resampler.process(samples_int / float(2**15)), resampler.flush()])
+        resampler.reset()
+        actual = numpy.concatenate([resampler.process(samples_int), resampler.flush()])
+        self.assertEqual(actual.dtype, numpy.float64)
+        numpy.testing.assert_array_almost_equal(actual, expected)
+
+    def block_size_test(self):
+        """
+        Result doesn't depend on how the input is cut in blocks.
+        """
+        samples = numpy.random.random((5000, 2)) * 2 - 1
+        resampler = resampling.Resampler(44100, 48000, 2)
+        expected = numpy.concatenate([resampler.process(samples), resampler.flush()])
+        self.assertEqual(expected.shape, (5443, 2))
+
+        resampler.reset()
+        blocks = [resampler.process(samples[i:i+37]) for i in range(0, 5000, 37)]
+        actual = numpy.concatenate(blocks + [resampler.flush()])
+        numpy.testing.assert_array_almost_equal(actual, expected)
+
+    def wrong_channel_count_test(self):
+        resampler = resampling.Resampler(48000, 44100, 2)
+        self.assertRaises(ValueError, resampler.process, numpy.zeros((10, 1)))
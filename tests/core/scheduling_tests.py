@@ -2,7 +2,7 @@ import unittest
 
 import numpy
 
-from pychedelic.core.scheduling import Clock
+from pychedelic.core.scheduling import Clock, Lane
 from pychedelic import config
 
 
@@ -66,3 +66,98 @@ class Clock_Test(unittest.TestCase):
         self.assertEqual(clock.current_frame, 23 * config.frame_rate)
         self.assertEqual(ran, [0, 1, 2, 3, 4])
 
+    def quantization_test(self):
+        """Test that events close to each other are coalesced, and blocks not cut too small"""
+        config.frame_rate = 44100
+        clock = Clock(min_block_size=100, tolerance=10)
+
+        ran = []
+        for frame in [1000, 1005, 1050, 1300]:
+            clock.run_after(frame / 44100.0, lambda k: ran.append(k), args=[frame])
+
+        self.assertEqual(clock.advance(1024), 1000)
+        self.assertEqual(ran, [])
+        # 1000 and 1005 are coalesced, 1050 is too close so it's late
+        self.assertEqual(clock.advance(1024), 100)
+        self.assertEqual(ran, [1000, 1005])
+        self.assertEqual(clock.advance(1024), 200)
+        self.assertEqual(ran, [1000, 1005, 1050])
+        self.assertEqual(clock.advance(1024), 1024)
+        self.assertEqual(ran, [1000, 1005, 1050, 1300])
+
+        stats = clock.stats()
+        self.assertEqual(stats['events'], 4)
+        self.assertEqual(stats['moved'], 2)
+        self.assertEqual(stats['max_error'], 50)
+        self.assertEqual(stats['mean_error'], (5 + 50) / 4.0)
+
+    def min_block_size_test(self):
+        """Test that `min_block_size` is never more than `max_frames`"""
+        clock = Clock(min_block_size=100)
+        clock.run_after(1 / 44100.0, lambda: None)
+        self.assertEqual(clock.advance(50), 50)
+        self.assertEqual(clock.advance(50), 50)
+        self.assertEqual(clock.stats()['max_error'], 49)
+
+
+class Lane_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+
+    def step_test(self):
+        config.frame_rate = 10
+        lane = Lane(1)
+        lane.set_after(0.5, 2)
+        lane.set_after(0.8, 3)
+        lane.set_after(0, 0.5)
+        values = lane.render(4)
+        self.assertEqual(values.shape, (4, 1))
+        numpy.testing.assert_array_equal(values[:,0], [0.5, 0.5, 0.5, 0.5])
+        numpy.testing.assert_array_equal(lane.render(4)[:,0], [0.5, 2, 2, 2])
+        numpy.testing.assert_array_equal(lane.render(3)[:,0], [3, 3, 3])
+        self.assertEqual(lane.current_frame, 11)
+
+    def ramp_test(self):
+        config.frame_rate = 10
+        lane = Lane(0)
+        lane.ramp_after(0.4, 4)
+        lane.set_after(0.6, 0)
+        lane.ramp_after(0.8, 1)
+        numpy.testing.assert_array_equal(lane.render(3)[:,0], [0, 1, 2])
+        numpy.testing.assert_array_equal(lane.render(3)[:,0], [3, 4, 4])
+        numpy.testing.assert_array_equal(lane.render(4)[:,0], [0, 0.5, 1, 1])
+
+    def dense_test(self):
+        """
+        Many changes inside one block are rendered without splitting the block
+        """
+        lane = Lane(0)
+        for i in range(1, 1000):
+            lane.set_after(i / 1000.0, i)
+        values = lane.render(44100)
+        self.assertEqual(values.shape, (44100, 1))
+        self.assertEqual(values[0, 0], 0)
+        self.assertEqual(values[43, 0], 0)
+        self.assertEqual(values[44, 0], 1)
+        self.assertEqual(values[-1, 0], 999)
+
+    def dense_blocks_test(self):
+        """
+        Dense automation rendered over many blocks, with points added as it plays
+        """
+        config.frame_rate = 1000
+        whole, lane = Lane(0), Lane(0)
+        for i in range(1, 2000):
+            if i % 2: whole.set_after(i / 100.0, i)
+            else: whole.ramp_after(i / 100.0, i)
+        expected = whole.render(20000)[:,0]
+
+        values = []
+        for i in range(1, 2000):
+            if i % 2: lane.set_after(0.01, i)
+            else: lane.ramp_after(0.01, i)
+            values.append(lane.render(10)[:,0])
+        numpy.testing.assert_array_equal(numpy.concatenate(values), expected[:19990])
+        # Points rendered are forgotten
+        self.assertTrue(len(lane._points) <= 2)
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy
+import scipy.io.wavfile as sp_wavfile
+
+from .__init__ import STEPS_MONO_16B, STEPS_STEREO_16B, A440_MONO_16B
+from pychedelic import dataset
+from pychedelic import config
+
+
+def expected_window(filename, start_frame, frame_count, channel_count):
+    frame_rate, samples = sp_wavfile.read(filename)
+    samples = samples.reshape((samples.shape[0], -1))[start_frame:start_frame + frame_count]
+    if samples.shape[1] < channel_count:
+        samples = numpy.hstack([samples] * channel_count)
+    return samples[:,:channel_count] / float(2**15)
+
+
+class Dataset_Test(unittest.TestCase):
+
+    def index_test(self):
+        windows = dataset.Dataset([A440_MONO_16B, A440_MONO_16B], 0.004, hop=0.002)
+        # A440 files have 441 frames
+        self.assertEqual(windows.frame_count, 176)
+        self.assertEqual(len(windows), 8)
+        numpy.testing.assert_array_equal(windows.segments[:5], [[0, 0], [0, 88], [0, 176], [0, 264], [1, 0]])
+        self.assertEqual(windows.channel_count, 1)
+
+    def wrong_frame_rate_test(self):
+        config.frame_rate = 48000
+        try:
+            self.assertRaises(ValueError, dataset.Dataset, [A440_MONO_16B], 0.001)
+        finally:
+            config.frame_rate = 44100
+
+    def read_test(self):
+        windows = dataset.Dataset([STEPS_MONO_16B, STEPS_STEREO_16B], 0.1, channel_count=2)
+        file_index, start_frame = windows.segments[-1]
+        samples = windows.read(-1)
+        self.assertEqual(samples.dtype, numpy.float32)
+        numpy.testing.assert_array_almost_equal(samples,
+            expected_window(STEPS_STEREO_16B, start_frame, 4410, 2))
+
+        # Files are not opened again for each window
+        opened = []
+        open_read_mode = dataset.wav.open_read_mode
+        dataset.wav.open_read_mode = lambda filename: opened.append(filename) or open_read_mode(filename)
+        try:
+            windows.read(-1)
+            windows.read(-2)
+        finally:
+            dataset.wav.open_read_mode = open_read_mode
+        self.assertEqual(opened, [])
+        windows.close()
+
+    def batches_test(self):
+        filenames = [STEPS_MONO_16B, STEPS_STEREO_16B]
+        windows = dataset.Dataset(filenames, 0.1, hop=0.05, channel_count=2)
+        for processes in [0, 2]:
+            seen = []
+            for samples, segments in windows.batches(7, shuffle=True, seed=1, processes=processes):
+                self.assertEqual(samples.shape, (len(segments), 4410, 2))
+                for row, (file_index, start_frame) in enumerate(segments):
+                    numpy.testing.assert_array_almost_equal(samples[row],
+                        expected_window(filenames[file_index], start_frame, 4410, 2))
+                seen.extend(tuple(segment) for segment in segments)
+            self.assertEqual(sorted(seen), sorted(tuple(segment) for segment in windows.segments))
+
+        # Shuffled
+        samples, segments = next(windows.batches(len(windows), shuffle=True, seed=1, processes=0))
+        self.assertNotEqual(segments.tolist(), windows.segments.tolist())
+        self.assertEqual(sorted(segments.tolist()), windows.segments.tolist())
+
+        # Once done, the shared memory is not referenced by this process anymore
+        for batch in windows.batches(7, processes=0): pass
+        self.assertTrue(dataset._slots is None)
+        self.assertTrue(dataset._reader is None)
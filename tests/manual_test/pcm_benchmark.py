@@ -0,0 +1,30 @@
+"""
+Benchmarks the float <-> int16 conversions, with and without preallocated output.
+"""
+import timeit
+
+import numpy
+
+import __init__
+from pychedelic.core import pcm
+
+
+if __name__ == '__main__':
+    frame_count = 1024
+    repeat = 200
+
+    print('%8s %14s %14s %14s %14s' % ('channels', 'f2i (us)', 'f2i out= (us)', 'i2f (us)', 'i2f out= (us)'))
+    for channel_count in [1, 2, 4, 8, 16, 32, 64]:
+        samples = numpy.random.random((frame_count, channel_count)) * 2 - 1
+        samples_int = pcm.float_to_int(samples)
+        out_int = numpy.empty(samples.shape, dtype='int16')
+        out_float = numpy.empty(samples.shape, dtype='float32')
+
+        timings = [
+            timeit.timeit(lambda: pcm.float_to_int(samples), number=repeat),
+            timeit.timeit(lambda: pcm.float_to_int(samples, out=out_int), number=repeat),
+            timeit.timeit(lambda: pcm.int_to_float(samples_int), number=repeat),
+            timeit.timeit(lambda: pcm.int_to_float(samples_int, out=out_float), number=repeat),
+        ]
+        print('%8s %14.1f %14.1f %14.1f %14.1f'
+          % tuple([channel_count] + [t * 1e6 / repeat for t in timings]))
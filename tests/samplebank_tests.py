@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy
+import scipy.io.wavfile as sp_wavfile
+
+from .__init__ import STEPS_STEREO_16B, A440_MONO_16B
+from pychedelic import samplebank
+
+
+def _worker_sum(directory, queue):
+    bank = samplebank.SampleBank('test', directory=directory)
+    queue.put(float(bank.get('steps').sum()))
+    bank.close()
+
+
+def _worker_crash(directory, queue):
+    bank = samplebank.SampleBank('test', directory=directory)
+    bank.get('steps')
+    queue.put('attached')
+    queue.close()
+    queue.join_thread()
+    os._exit(1)
+
+
+class SampleBank_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bank = samplebank.SampleBank('test', directory=self.directory)
+
+    def tearDown(self):
+        self.bank.close()
+        shutil.rmtree(self.directory)
+
+    def segment_exists(self, name):
+        return os.path.exists(self.bank._segment_path(name))
+
+    def load_get_test(self):
+        samples = self.bank.load('steps', STEPS_STEREO_16B)
+        frame_rate, expected = sp_wavfile.read(STEPS_STEREO_16B)
+        self.assertEqual(samples.dtype, numpy.float32)
+        numpy.testing.assert_array_almost_equal(samples, expected / float(2**15))
+        self.assertFalse(samples.flags.writeable)
+        self.assertTrue(self.bank.get('steps') is samples)
+        self.assertEqual(self.bank.names(), ['steps'])
+        self.assertRaises(KeyError, self.bank.get, 'bla')
+
+        # Another bank object sees the same sample, and doesn't decode it again
+        other = samplebank.SampleBank('test', directory=self.directory)
+        other_samples = other.load('steps', A440_MONO_16B)
+        self.assertEqual(other_samples.shape, samples.shape)
+        del other_samples
+        other.close()
+
+    def release_test(self):
+        samples = self.bank.load('steps', STEPS_STEREO_16B)
+        segment_name = self.bank._description('steps')['segment']
+        other = samplebank.SampleBank('test', directory=self.directory)
+        other_samples = other.get('steps')
+
+        self.bank.release('steps')
+        # Still used by `other`
+        self.assertTrue(self.segment_exists(segment_name))
+        self.assertEqual(float(other_samples[0, 0]), float(other.get('steps')[0, 0]))
+
+        other.release('steps')
+        self.assertFalse(self.segment_exists(segment_name))
+        self.assertEqual(self.bank.names(), [])
+        # Arrays still referenced stay valid
+        numpy.testing.assert_array_equal(samples, other_samples)
+        self.assertEqual(samples.shape, (other_samples.shape[0], 2))
+
+    def processes_test(self):
+        samples = self.bank.load('steps', STEPS_STEREO_16B)
+        segment_name = self.bank._description('steps')['segment']
+        queue = multiprocessing.Queue()
+
+        process = multiprocessing.Process(target=_worker_sum, args=(self.directory, queue))
+        process.start()
+        self.assertAlmostEqual(queue.get(timeout=10), float(samples.sum()), places=2)
+        process.join()
+
+        # A worker crashing doesn't keep the sample alive
+        process = multiprocessing.Process(target=_worker_crash, args=(self.directory, queue))
+        process.start()
+        self.assertEqual(queue.get(timeout=10), 'attached')
+        process.join()
+        del samples
+        self.bank.release('steps')
+        self.assertFalse(self.segment_exists(segment_name))
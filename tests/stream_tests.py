@@ -1,5 +1,10 @@
 import os
+import io
+import shutil
+import tempfile
+import time
 import types
+import threading
 from tempfile import TemporaryFile, NamedTemporaryFile
 import unittest
 
@@ -8,8 +13,13 @@ import scipy.io.wavfile as sp_wavfile
 
 from .__init__ import A440_MONO_16B, A440_STEREO_16B, STEPS_MONO_16B
 from pychedelic import stream
+from pychedelic import chunk
 from pychedelic import config
 from pychedelic.core import wav as core_wav
+from pychedelic.core import pcm
+from pychedelic.core import loudness as core_loudness
+from pychedelic.core import files as core_files
+from pychedelic.core import buffering
 
 
 class ramp_Test(unittest.TestCase):
@@ -290,6 +300,272 @@ class resampler_test(unittest.TestCase):
         )
         self.assertRaises(StopIteration, next, resampler)
 
+    def set_ratio_continuous_test(self):
+        """
+        Changing the ratio doesn't restart from the beginning of the source.
+        """
+        config.block_size = 4
+
+        def gen():
+            yield numpy.arange(0, 100).reshape((100, 1))
+
+        resampler = stream.resample(gen())
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [0, 1, 2, 3])
+        resampler.set_ratio(0.5)
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [3.5, 4, 4.5, 5])
+        resampler.set_ratio(2)
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [7, 9, 11, 13])
+        resampler.set_ratio(1)
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [14, 15, 16, 17])
+
+    def variable_ratio_test(self):
+        """
+        Ratio given as an array, then as a stream.
+        """
+        config.block_size = 4
+
+        def gen():
+            yield numpy.arange(0, 100).reshape((100, 1))
+
+        resampler = stream.resample(gen())
+        resampler.set_ratio(numpy.array([1, 1, 0.5, 0.5, 0.25, 2]))
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [0, 1, 1.5, 2])
+        # Last ratio of the array is kept
+        numpy.testing.assert_array_equal(next(resampler)[:,0], [2.25, 4.25, 6.25, 8.25])
+        self.assertEqual(resampler.ratio, 2)
+
+        resampler.set_ratio(stream.ramp(1, (2, 4.0 / config.frame_rate)))
+        # ramp yields [1, 1.333, 1.666, 2]
+        numpy.testing.assert_array_almost_equal(next(resampler)[:,0], [9.25, 10.5 + 1 / 12.0, 12.25, 14.25])
+        numpy.testing.assert_array_almost_equal(next(resampler)[:,0], [16.25, 18.25, 20.25, 22.25])
+
+    def glide_test(self):
+        """
+        A ratio sweep is rendered smoothly, whatever the block size.
+        """
+        samples = numpy.sin(numpy.arange(0, 20000) * 0.01).reshape((20000, 1))
+        ratios = numpy.linspace(0.5, 1.5, 10000)
+        expected = numpy.interp(ratios.cumsum() - ratios[0], numpy.arange(0, 20000), samples[:,0])
+
+        for block_size in [1024, 333]:
+            config.block_size = block_size
+            resampler = stream.resample((block for block in [samples]))
+            resampler.set_ratio(ratios)
+            actual = numpy.concatenate([next(resampler) for i in range(0, 10000 // block_size)])
+            numpy.testing.assert_array_almost_equal(actual[:,0], expected[:actual.shape[0]])
+
+
+    def silence_test(self):
+        config.frame_rate = 4
+        config.block_size = 4
+
+        def gen():
+            yield numpy.ones((2, 1))
+            for i in range(0, 4):
+                yield buffering.silence(4, 1)
+
+        resampler = stream.resample(gen())
+        resampler.set_ratio(0.5)
+        blocks = [next(resampler) for i in range(0, 5)]
+        self.assertEqual([buffering.is_silent(block) for block in blocks], [False, True, True, True, True])
+        numpy.testing.assert_array_equal(blocks[0], [[1], [1], [1], [0.5]])
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks[1:]), numpy.zeros((16, 1)))
+
+
+class convolve_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+        config.block_size = 1024
+
+    def mono_test(self):
+        config.block_size = 7
+        samples = numpy.random.random((50, 1)) * 2 - 1
+        ir = numpy.random.random((23, 1)) * 2 - 1
+
+        def gen():
+            for i in range(0, 50, 6):
+                yield samples[i:i+6]
+
+        blocks = list(stream.convolve(gen(), ir, partition_size=4))
+        self.assertEqual([len(b) for b in blocks], [4] * 18)
+        actual = numpy.concatenate(blocks)
+        expected = numpy.convolve(samples[:,0], ir[:,0]).reshape(72, 1)
+        numpy.testing.assert_array_almost_equal(actual, expected)
+
+    def multichannel_test(self):
+        """
+        Stereo IR applied on a stereo source, and mono IR applied on all channels.
+        """
+        samples = numpy.random.random((100, 2)) * 2 - 1
+        ir_stereo = numpy.random.random((30, 2)) * 2 - 1
+        ir_mono = numpy.random.random(30) * 2 - 1
+
+        actual = stream.concatenate(stream.convolve(stream.iter(samples), ir_stereo, partition_size=16))
+        self.assertEqual(actual.shape, (129, 2))
+        for ch in range(2):
+            numpy.testing.assert_array_almost_equal(
+                actual[:,ch], numpy.convolve(samples[:,ch], ir_stereo[:,ch]))
+
+        actual = stream.concatenate(stream.convolve(stream.iter(samples), ir_mono, partition_size=16))
+        self.assertEqual(actual.shape, (129, 2))
+        for ch in range(2):
+            numpy.testing.assert_array_almost_equal(
+                actual[:,ch], numpy.convolve(samples[:,ch], ir_mono))
+
+    def ir_spectra_cached_test(self):
+        ir = numpy.random.random((40, 1))
+        conv1 = stream.convolve(stream.iter(numpy.zeros((10, 1))), ir, partition_size=8)
+        conv2 = stream.convolve(stream.iter(numpy.zeros((10, 1))), ir.copy(), partition_size=8)
+        self.assertTrue(conv1.ir_spectra is conv2.ir_spectra)
+        self.assertEqual(conv1.ir_spectra.shape, (5, 9, 1))
+
+    def ir_spectra_cache_limit_test(self):
+        ir = numpy.random.random((40, 1))
+        spectra = stream.convolve(stream.iter(numpy.zeros((10, 1))), ir, partition_size=8).ir_spectra
+        for i in range(stream.convolve._spectra_cache_limit - 1):
+            stream.convolve(stream.iter(numpy.zeros((10, 1))), numpy.random.random((40, 1)), partition_size=8)
+            # Used recently, so it stays in the cache
+            self.assertTrue(stream.convolve(stream.iter(numpy.zeros((10, 1))), ir, partition_size=8).ir_spectra is spectra)
+        stream.convolve(stream.iter(numpy.zeros((10, 1))), numpy.random.random((40, 1)), partition_size=8)
+        self.assertEqual(len(stream.convolve._spectra_cache), stream.convolve._spectra_cache_limit)
+        for i in range(stream.convolve._spectra_cache_limit):
+            stream.convolve(stream.iter(numpy.zeros((10, 1))), numpy.random.random((40, 1)), partition_size=8)
+        self.assertEqual(len(stream.convolve._spectra_cache), stream.convolve._spectra_cache_limit)
+        self.assertFalse(stream.convolve(stream.iter(numpy.zeros((10, 1))), ir, partition_size=8).ir_spectra is spectra)
+
+    def channel_count_mismatch_test(self):
+        ir = numpy.random.random((10, 2))
+        conv = stream.convolve(stream.iter(numpy.zeros((10, 3))), ir)
+        self.assertRaises(ValueError, next, conv)
+
+
+class stft_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+        config.block_size = 1024
+
+    def frames_test(self):
+        config.block_size = 32
+        samples = numpy.random.random((100, 2)) * 2 - 1
+        blocks = list(stream.stft(stream.iter(samples), 16, 8))
+        self.assertEqual(blocks[0].shape, (4, 9, 2))
+        self.assertEqual(blocks[0].dtype, numpy.complex128)
+
+        # First frame is half silence, half samples
+        window = numpy.hanning(17)[:-1].reshape((16, 1))
+        frame = numpy.vstack([numpy.zeros((8, 2)), samples[:8]])
+        numpy.testing.assert_array_almost_equal(blocks[0][0], numpy.fft.rfft(frame * window, axis=0))
+        numpy.testing.assert_array_almost_equal(blocks[0][3], numpy.fft.rfft(samples[16:32] * window, axis=0))
+        numpy.testing.assert_array_almost_equal(blocks[1][0], numpy.fft.rfft(samples[24:40] * window, axis=0))
+
+    def complex64_test(self):
+        samples = numpy.random.random((100, 1))
+        block = next(stream.stft(stream.iter(samples), 16, 4, window=None, dtype='complex64'))
+        self.assertEqual(block.dtype, numpy.complex64)
+        numpy.testing.assert_array_almost_equal(block[3], numpy.fft.rfft(samples[:16], axis=0), 5)
+
+    def round_trip_test(self):
+        config.block_size = 50
+        samples = numpy.random.random((1000, 2)) * 2 - 1
+        for n_fft, hop, window in [(64, 16, 'hann'), (64, 24, 'hamming'), (32, 32, None)]:
+            actual = stream.concatenate(stream.istft(
+                stream.stft(stream.iter(samples), n_fft, hop, window=window), hop, window=window))
+            self.assertTrue(actual.shape[0] >= 1000)
+            numpy.testing.assert_array_almost_equal(actual[:1000], samples)
+            numpy.testing.assert_array_almost_equal(actual[1000:], 0)
+
+    def window_test(self):
+        self.assertRaises(ValueError, next, stream.stft(stream.iter(numpy.zeros((10, 1))), 8, 4, window='blabla'))
+        self.assertRaises(ValueError, next, stream.stft(stream.iter(numpy.zeros((10, 1))), 8, 4, window=numpy.ones(4)))
+
+    def hop_test(self):
+        for hop in [0, -2, 9]:
+            self.assertRaises(ValueError, next, stream.stft(stream.iter(numpy.zeros((10, 1))), 8, hop))
+
+
+class tee_Test(unittest.TestCase):
+
+    def source(self, count=5):
+        for i in range(count):
+            yield numpy.ones((2, 1)) * i
+
+    def simple_test(self):
+        stream1, stream2, stream3 = stream.tee(self.source(), 3)
+        blocks1 = [next(stream1) for i in range(3)]
+        self.assertEqual(len(stream1.shared.blocks), 3)
+        blocks2 = list(stream2)
+        blocks3 = list(stream3)
+        self.assertEqual(len(stream1.shared.blocks), 2)
+        blocks1 += list(stream1)
+        self.assertEqual(len(stream1.shared.blocks), 0)
+
+        self.assertEqual(len(blocks1), 5)
+        for block1, block2, block3 in zip(blocks1, blocks2, blocks3):
+            self.assertTrue(block1 is block2 and block2 is block3)
+        self.assertRaises(StopIteration, next, stream1)
+
+    def close_test(self):
+        stream1, stream2 = stream.tee(self.source())
+        next(stream2)
+        self.assertEqual(len(list(stream1)), 5)
+        self.assertEqual(len(stream1.shared.blocks), 4)
+        stream2.close()
+        self.assertEqual(len(stream1.shared.blocks), 0)
+
+    def drop_policy_test(self):
+        stream1, stream2 = stream.tee(self.source(), max_blocks=2, policy='drop')
+        blocks1 = list(stream1)
+        self.assertEqual(len(blocks1), 5)
+        blocks2 = list(stream2)
+        self.assertEqual([b[0,0] for b in blocks2], [3, 4])
+        self.assertEqual((stream1.dropped, stream2.dropped), (0, 3))
+
+    def error_policy_test(self):
+        stream1, stream2 = stream.tee(self.source(), max_blocks=2, policy='error')
+        next(stream1)
+        next(stream1)
+        self.assertRaises(BufferError, next, stream1)
+        next(stream2)
+        next(stream1)
+        self.assertRaises(ValueError, stream.tee, self.source(), policy='blabla')
+
+    def wait_policy_test(self):
+        stream1, stream2 = stream.tee(self.source(100), max_blocks=3)
+        results = {}
+        def consume(name, branch):
+            results[name] = [b[0,0] for b in branch]
+        threads = [threading.Thread(target=consume, args=(name, branch))
+            for name, branch in [('a', stream1), ('b', stream2)]]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(results['a'], list(range(100)))
+        self.assertEqual(results['b'], list(range(100)))
+
+    def read_while_fetching_test(self):
+        # While a branch waits for a slow source, the others can read the blocks already buffered
+        release = threading.Event()
+        def source():
+            yield numpy.zeros((2, 1))
+            release.wait(5)
+            yield numpy.ones((2, 1))
+
+        stream1, stream2 = stream.tee(source())
+        next(stream1)
+        fetching = threading.Thread(target=next, args=(stream1,))
+        fetching.start()
+        time.sleep(0.05)
+        got = []
+        reading = threading.Thread(target=lambda: got.append(next(stream2)))
+        reading.start()
+        reading.join(1)
+        self.assertEqual(len(got), 1)
+        numpy.testing.assert_array_equal(got[0], numpy.zeros((2, 1)))
+        release.set()
+        fetching.join()
+        numpy.testing.assert_array_equal(next(stream2), numpy.ones((2, 1)))
+
 
 class mixer_test(unittest.TestCase):
 
@@ -428,6 +704,53 @@ class mixer_test(unittest.TestCase):
             [0]
         ])
 
+    def silent_sources_test(self):
+        config.block_size = 4
+
+        def source_silent():
+            for i in range(0, 2):
+                yield buffering.silence(4, 2)
+
+        def source_mono():
+            yield numpy.ones((6, 1)) * 0.5
+
+        mixer = stream.mixer(2)
+        mixer.plug(source_silent())
+        block = next(mixer)
+        self.assertTrue(buffering.is_silent(block))
+        self.assertEqual(block.shape, (4, 2))
+
+        mixer.plug(source_mono())
+        block = next(mixer)
+        self.assertFalse(buffering.is_silent(block))
+        numpy.testing.assert_array_equal(block, [[0.5, 0]] * 4)
+        numpy.testing.assert_array_equal(next(mixer), [[0.5, 0]] * 2 + [[0, 0]] * 2)
+
+    def no_sources_writable_test(self):
+        config.block_size = 4
+        mixer = stream.mixer(1, stop_when_empty=False)
+        block = next(mixer)
+        self.assertFalse(buffering.is_silent(block))
+        block *= 0.5
+        numpy.testing.assert_array_equal(block, [[0]] * 4)
+
+    def block_pool_test(self):
+        temp_file = NamedTemporaryFile()
+        mixer = stream.mixer(1)
+        mixer.plug(stream.iter(numpy.ones((44100, 1)) * 0.1))
+        mixer.plug(stream.iter(numpy.ones((44100, 1)) * 0.2))
+        before = buffering.pool.stats()
+        stream.write_wav(mixer, temp_file)
+        after = buffering.pool.stats()
+
+        # Blocks of the sources and of the mixer are reused once the first ones are released
+        acquired = after['acquired'] - before['acquired']
+        self.assertEqual(acquired, 3 * 44)
+        self.assertTrue(after['hits'] - before['hits'] >= acquired - 4)
+        frame_rate, actual = sp_wavfile.read(temp_file.name)
+        numpy.testing.assert_array_equal(actual[:44100], pcm.float_to_int(numpy.ones((44100, 1)) * 0.3)[:,0])
+        numpy.testing.assert_array_equal(actual[44100:], numpy.zeros(44 * 1024 - 44100))
+
 
 class iter_Test(unittest.TestCase):
 
@@ -477,9 +800,136 @@ class iter_Test(unittest.TestCase):
         numpy.testing.assert_array_equal(next(iter_gen), [[4, 8], [0, 0]])
         self.assertRaises(StopIteration, next, iter_gen)
 
+    def frame_count_hint_test(self):
+        config.block_size = 4
+        samples = numpy.zeros((10, 2))
+        iter_gen = stream.iter(samples, start=1.0/config.frame_rate)
+        self.assertEqual(iter_gen.frame_count_hint(), 9)
+        next(iter_gen)
+        self.assertEqual(iter_gen.frame_count_hint(), 5)
+
+        iter_gen = stream.iter(samples, start=1.0/config.frame_rate, pad=True)
+        self.assertEqual(iter_gen.frame_count_hint(), 12)
+        self.assertEqual(stream.concatenate(iter_gen).shape, (12, 2))
+
+    def views_test(self):
+        config.block_size = 3
+        samples = numpy.random.random((10, 2))
+        blocks = list(stream.iter(samples, pad=True))
+        self.assertEqual([b.shape for b in blocks], [(3, 2)] * 4)
+        for block in blocks[:3]:
+            self.assertTrue(numpy.may_share_memory(block, samples))
+        numpy.testing.assert_array_equal(blocks[3], [samples[9], [0, 0], [0, 0]])
+
+    def memmap_test(self):
+        config.block_size = 1000
+        temp_file = NamedTemporaryFile()
+        samples = numpy.memmap(temp_file.name, dtype='float32', mode='w+', shape=(10500, 2))
+        samples[:] = numpy.random.random((10500, 2))
+        blocks = list(stream.iter(samples))
+        self.assertEqual([b.shape[0] for b in blocks], [1000] * 10 + [500])
+        self.assertTrue(all(isinstance(b, numpy.memmap) for b in blocks))
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks), samples)
+
+    def step_test(self):
+        config.block_size = 2
+        samples = numpy.vstack([numpy.arange(0, 10), numpy.arange(0, 10) * 2]).transpose()
+        iter_gen = stream.iter(samples, start=1.0/config.frame_rate, step=3)
+        self.assertEqual(iter_gen.frame_count_hint(), 3)
+        numpy.testing.assert_array_equal(next(iter_gen), [[1, 2], [4, 8]])
+        numpy.testing.assert_array_equal(next(iter_gen), [[7, 14]])
+        self.assertRaises(StopIteration, next, iter_gen)
+
+
+class to_raw_Test(unittest.TestCase):
+
+    def simple_test(self):
+        def source():
+            yield numpy.array([[0.5, -0.5], [1, -1]])
+            yield numpy.array([[0.25, 2]])
+        blocks = list(stream.to_raw(source()))
+        self.assertEqual(blocks, [
+            numpy.array([[2**14, -2**14], [2**15 - 1, -2**15]], dtype='int16').tobytes(),
+            numpy.array([[2**13, 2**15 - 1]], dtype='int16').tobytes()
+        ])
+
+    def reuse_buffer_test(self):
+        samples = numpy.random.random((100, 2)) * 2.2 - 1.1
+        raw = stream.to_raw(stream.iter(samples), reuse_buffer=True)
+        chunks = []
+        for chunk in raw:
+            self.assertTrue(isinstance(chunk, memoryview))
+            chunks.append(chunk.tobytes())
+        self.assertEqual(b''.join(chunks), pcm.samples_to_string(samples))
+
+    def reuse_buffer_empty_block_test(self):
+        def source():
+            yield numpy.zeros((0, 2))
+            yield numpy.array([[0.5, -0.5]])
+        chunks = [chunk.tobytes() for chunk in stream.to_raw(source(), reuse_buffer=True)]
+        self.assertEqual(chunks, [b'', numpy.array([[2**14, -2**14]], dtype='int16').tobytes()])
+
+    def silence_test(self):
+        def source():
+            yield buffering.silence(3, 2)
+            yield numpy.array([[0.5, -0.5]])
+            yield buffering.silence(2, 2)
+        expected = [b'\x00' * 12, numpy.array([[2**14, -2**14]], dtype='int16').tobytes(), b'\x00' * 8]
+        self.assertEqual(list(stream.to_raw(source())), expected)
+        self.assertEqual([chunk.tobytes() for chunk in stream.to_raw(source(), reuse_buffer=True)], expected)
+
+
+class from_raw_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.block_size = 1024
+
+    def int16_test(self):
+        config.block_size = 3
+        samples = numpy.array([[0, 2**14], [-2**14, 2**13], [1, 2], [3, 4]], dtype='int16')
+        blocks = list(stream.from_raw(io.BytesIO(samples.tobytes()), 2))
+        self.assertEqual([b.shape for b in blocks], [(3, 2), (1, 2)])
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks), samples / float(2**15))
+
+    def float32_test(self):
+        config.block_size = 2
+        samples = numpy.array([[0.5], [-0.25], [0.125]], dtype='float32')
+        blocks = list(stream.from_raw(io.BytesIO(samples.tobytes()), 1, dtype='float32'))
+        self.assertEqual([b.shape for b in blocks], [(2, 1), (1, 1)])
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks), samples)
+
+    def partial_reads_test(self):
+        """
+        Reading from a pipe or socket returns less data than requested, with incomplete frames.
+        """
+        config.block_size = 4
+        samples = (numpy.random.random((21, 2)) * 2**15).astype('int16')
+
+        class Pipe(object):
+            def __init__(self, data):
+                self.data = data
+            def readinto(self, buf):
+                count = min(3, len(buf), len(self.data))
+                buf[:count] = self.data[:count]
+                self.data = self.data[count:]
+                return count
+
+        # The last frame is incomplete, and is dropped
+        blocks = list(stream.from_raw(Pipe(samples.tobytes() + b'\x01'), 2))
+        self.assertEqual([b.shape[0] for b in blocks], [4, 4, 4, 4, 4, 1])
+        numpy.testing.assert_array_equal(numpy.concatenate(blocks), samples / float(2**15))
+
+    def relay_test(self):
+        samples = (numpy.random.random((5000, 2)) * 2**15).astype('int16')
+        raw = stream.to_raw(stream.from_raw(io.BytesIO(samples.tobytes()), 2), reuse_buffer=True)
+        self.assertEqual(b''.join(chunk.tobytes() for chunk in raw), samples.tobytes())
+
 
 class concatenate_Test(unittest.TestCase):
 
+    def tearDown(self):
+        config.block_size = 1024
+
     def simple_test(self):
         def source():
             for i in range(0, 3):
@@ -489,6 +939,40 @@ class concatenate_Test(unittest.TestCase):
             [0], [0], [0], [1], [1], [1], [2], [2], [2]
         ]))
 
+    def frame_count_hint_test(self):
+        config.block_size = 100
+        blocks = stream.read_wav(A440_STEREO_16B)
+        self.assertEqual(stream.frame_count_hint(blocks), 441)
+        next(blocks)
+        self.assertEqual(stream.frame_count_hint(blocks), 341)
+        block = stream.concatenate(blocks)
+        self.assertEqual(block.shape, (341, 2))
+        frame_rate, expected = sp_wavfile.read(A440_STEREO_16B)
+        numpy.testing.assert_array_equal((expected[100:] / float(2**15)).round(4), block.round(4))
+
+    def wrong_frame_count_hint_test(self):
+        class source(object):
+            def __init__(self, hint):
+                self.hint = hint
+                self.blocks = [numpy.ones([3, 2]) * i for i in range(0, 5)]
+            def frame_count_hint(self):
+                return self.hint
+            def __next__(self):
+                if self.blocks: return self.blocks.pop(0)
+                else: raise StopIteration
+            next = __next__
+
+        expected = numpy.repeat(numpy.arange(0, 5), 3).reshape((15, 1)) * numpy.ones((1, 2))
+        for hint in [None, 1, 15, 1000]:
+            numpy.testing.assert_array_equal(stream.concatenate(source(hint)), expected)
+
+    def upcast_test(self):
+        def source():
+            yield numpy.array([[1], [2]], dtype='int16')
+            yield numpy.array([[0.5]])
+        block = stream.concatenate(source())
+        numpy.testing.assert_array_equal(block, [[1], [2], [0.5]])
+
 
 class read_wav_Test(unittest.TestCase):
 
@@ -496,6 +980,24 @@ class read_wav_Test(unittest.TestCase):
         config.frame_rate = 44100
         config.block_size = 1024
 
+    def convert_rate_test(self):
+        config.frame_rate = 48000
+        config.block_size = 1000
+        blocks = stream.read_wav(STEPS_MONO_16B)
+        self.assertEqual(blocks.infos['frame_rate'], 44100)
+        frame_count = stream.frame_count_hint(blocks)
+        self.assertEqual(frame_count, int(numpy.ceil(blocks.infos['frame_count'] * 48000 / 44100.0)))
+        next(blocks)
+        samples = stream.concatenate(blocks)
+        self.assertEqual(stream.frame_count_hint(blocks), 0)
+
+        expected, infos = chunk.read_wav(STEPS_MONO_16B)
+        self.assertEqual(expected.shape, (frame_count, 1))
+        numpy.testing.assert_array_almost_equal(samples, expected[-samples.shape[0]:])
+
+        blocks = stream.read_wav(STEPS_MONO_16B, convert_rate=False)
+        self.assertEqual(stream.frame_count_hint(blocks), blocks.infos['frame_count'])
+
     def blocks_size_test(self):
         config.block_size = 50
         blocks = stream.read_wav(A440_STEREO_16B)
@@ -574,6 +1076,46 @@ class read_wav_Test(unittest.TestCase):
         numpy.testing.assert_array_equal(expected.round(3), samples.round(3))
 
 
+class normalize_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_file = NamedTemporaryFile()
+        config.loudness_cache = self.cache_file.name
+
+    def tearDown(self):
+        config.loudness_cache = os.path.join(os.path.expanduser('~'), '.pychedelic', 'loudness.json')
+
+    def measure_loudness_test(self):
+        results = stream.measure_loudness(STEPS_MONO_16B)
+        self.assertTrue(-40 < results['integrated'] < -30)
+        self.assertTrue(-3 < results['true_peak'] < 3)
+        # Second time the results come from the cache
+        self.assertEqual(core_loudness.get_cache().get(STEPS_MONO_16B), results)
+        self.assertEqual(stream.measure_loudness(STEPS_MONO_16B), results)
+
+    def measure_loudness_frame_rate_test(self):
+        # The file's frame rate is not `config.frame_rate`
+        temp_file = NamedTemporaryFile(suffix='.wav')
+        samples = numpy.sin(2 * numpy.pi * 30 * numpy.arange(48000 * 3) / 48000.0) * 0.5
+        sp_wavfile.write(temp_file.name, 48000, pcm.float_to_int(samples))
+        meter = core_loudness.Meter(1, 48000)
+        meter.process(pcm.int_to_float(pcm.float_to_int(samples)).reshape((-1, 1)))
+        results = stream.measure_loudness(temp_file.name)
+        self.assertAlmostEqual(results['integrated'], meter.integrated, 2)
+
+    def normalize_test(self):
+        blocks = stream.normalize(STEPS_MONO_16B, target=-40, peak_limit=None)
+        self.assertEqual(blocks.infos['channel_count'], 1)
+        meter = core_loudness.Meter(1, 44100)
+        meter.process(stream.concatenate(blocks))
+        self.assertEqual(round(meter.integrated, 1), -40)
+
+    def normalize_peak_limit_test(self):
+        results = stream.measure_loudness(STEPS_MONO_16B)
+        blocks = stream.normalize(STEPS_MONO_16B, target=-20, peak_limit=-1)
+        self.assertAlmostEqual(blocks.gain, 10 ** ((-1 - results['true_peak']) / 20))
+
+
 class write_wav_Test(unittest.TestCase):
 
     def simple_write_test(self):
@@ -657,3 +1199,283 @@ class write_wav_Test(unittest.TestCase):
         except core_wav.WavSizeLimitError:
             got_error = True 
         self.assertTrue(got_error)
+
+    def silence_test(self):
+        temp_file = NamedTemporaryFile()
+
+        def source():
+            yield numpy.ones((100, 2)) * 0.5
+            yield buffering.silence(200, 2)
+
+        stream.write_wav(source(), temp_file)
+        frame_rate, actual = sp_wavfile.read(temp_file.name)
+        numpy.testing.assert_array_equal(actual, [[2**14, 2**14]] * 100 + [[0, 0]] * 200)
+
+
+FAKE_AVCONV = '''#!/bin/sh
+# Fake avconv, writing the PCM from stdin to the output file.
+for last; do true; done
+case "$*" in
+    *"-f crash"*) echo "crashed" >&2; exit 1;;
+    *"-f bad"*) cat > /dev/null; echo "unknown format" >&2; exit 1;;
+    *"-f late"*) sleep 0.2; echo "crashed" >&2; exit 1;;
+esac
+cat > "$last"
+'''
+
+
+class write_audio_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'avconv'), 'w') as fd: fd.write(FAKE_AVCONV)
+        os.chmod(os.path.join(self.tempdir, 'avconv'), 0o755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.tempdir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tempdir)
+
+    def simple_write_test(self):
+        samples = numpy.random.random((10000, 2)) * 2 - 1
+        filename = os.path.join(self.tempdir, 'out.mp3')
+        sink = stream.write_audio(stream.iter(samples), filename)
+        self.assertEqual(sink.format, 'mp3')
+        self.assertEqual(sink.infos, {'frame_rate': 44100, 'channel_count': 2})
+        with open(filename, 'rb') as fd:
+            self.assertEqual(fd.read(), pcm.float_to_int(samples).tobytes())
+
+    def encoder_error_test(self):
+        samples = numpy.zeros((44100 * 10, 2))
+        filename = os.path.join(self.tempdir, 'out.mp3')
+        for format, message in [('bad', 'unknown format'), ('crash', 'crashed')]:
+            try:
+                stream.write_audio(stream.iter(samples), filename, format=format)
+            except core_files.ConversionError as err:
+                self.assertTrue(message in err.stderr)
+            else: raise AssertionError('should have failed')
+
+    def encoder_error_stops_rendering_test(self):
+        pulled = []
+        def source():
+            while True:
+                pulled.append(1)
+                yield numpy.zeros((1024, 2))
+
+        filename = os.path.join(self.tempdir, 'out.mp3')
+        self.assertRaises(core_files.ConversionError, stream.write_audio, source(), filename, format='crash')
+        self.assertTrue(len(pulled) < 10000)
+
+    def source_error_test(self):
+        def source():
+            yield numpy.zeros((100, 2))
+            raise RuntimeError('source failed')
+
+        filename = os.path.join(self.tempdir, 'out.mp3')
+        # `late` fails only after the source failed
+        for format in ['mp3', 'late']:
+            try:
+                stream.write_audio(source(), filename, format=format)
+            except RuntimeError as err:
+                self.assertEqual(str(err), 'source failed')
+            else: raise AssertionError('should have failed')
+
+    def write_incorrect_channel_count_test(self):
+        def source():
+            yield numpy.ones((100, 2)) * 0.1
+            yield numpy.ones((100, 1)) * 0.1
+
+        filename = os.path.join(self.tempdir, 'out.mp3')
+        self.assertRaises(ValueError, stream.write_audio, source(), filename)
+        with open(filename, 'rb') as fd:
+            self.assertEqual(len(fd.read()), 100 * 2 * 2)
+
+_timeline_samples = numpy.random.RandomState(1).uniform(-0.5, 0.5, (44100 * 2, 2))
+
+
+def _timeline(start):
+    return stream.iter(_timeline_samples, start=start)
+
+
+def _filtered_timeline(start):
+    # Moving average, that needs the previous frames to render exactly.
+    def moving_average(source):
+        previous = numpy.zeros((9, 2))
+        for block in source:
+            padded = numpy.concatenate([previous, block])
+            previous = padded[-9:]
+            yield sum(padded[i:i + block.shape[0]] for i in range(10)) / 10.0
+    return moving_average(stream.iter(_timeline_samples, start=start))
+
+
+def _failing_timeline(start):
+    if start > 0: raise RuntimeError('segment failed')
+    return stream.iter(_timeline_samples, start=start)
+
+
+class render_wav_Test(unittest.TestCase):
+
+    def segments_test(self):
+        expected = pcm.float_to_int(_timeline_samples[:int(1.5 * 44100)])
+        for processes in [0, 2]:
+            temp_file = NamedTemporaryFile(suffix='.wav')
+            stream.render_wav(_timeline, temp_file, duration=1.5,
+                segment_duration=0.333, processes=processes)
+            frame_rate, samples = sp_wavfile.read(temp_file.name)
+            numpy.testing.assert_array_equal(samples, expected)
+
+    def preroll_test(self):
+        expected = pcm.float_to_int(stream.concatenate(_filtered_timeline(0))[:int(1.5 * 44100)])
+        temp_file = NamedTemporaryFile(suffix='.wav')
+        stream.render_wav(_filtered_timeline, temp_file, duration=1.5,
+            segment_duration=0.333, preroll=0.001, processes=2)
+        frame_rate, samples = sp_wavfile.read(temp_file.name)
+        numpy.testing.assert_array_equal(samples, expected)
+
+        # Without pre-roll, the beginning of the segments is different
+        temp_file = NamedTemporaryFile(suffix='.wav')
+        stream.render_wav(_filtered_timeline, temp_file, duration=1.5,
+            segment_duration=0.333, processes=2)
+        frame_rate, samples = sp_wavfile.read(temp_file.name)
+        self.assertFalse((samples == expected).all())
+
+    def pad_test(self):
+        expected = pcm.float_to_int(_timeline_samples)
+        temp_file = NamedTemporaryFile(suffix='.wav')
+        stream.render_wav(_timeline, temp_file, duration=2.5,
+            segment_duration=0.7, processes=0)
+        frame_rate, samples = sp_wavfile.read(temp_file.name)
+        self.assertEqual(samples.shape, (int(2.5 * 44100), 2))
+        numpy.testing.assert_array_equal(samples[:expected.shape[0]], expected)
+        numpy.testing.assert_array_equal(samples[expected.shape[0]:], numpy.zeros((22050, 2)))
+
+    def segment_error_test(self):
+        temp_file = NamedTemporaryFile(suffix='.wav')
+        opened = []
+        open_write_mode = core_wav.open_write_mode
+        core_wav.open_write_mode = lambda *args: opened.append(open_write_mode(*args)) or opened[-1]
+        try:
+            self.assertRaises(RuntimeError, stream.render_wav, _failing_timeline, temp_file,
+                duration=1.5, segment_duration=0.5, processes=0)
+        finally:
+            core_wav.open_write_mode = open_write_mode
+
+        # The wav file was closed, with the first segment
+        wfile, infos = opened[0]
+        self.assertTrue(wfile._file is None)
+        frame_rate, samples = sp_wavfile.read(temp_file.name)
+        numpy.testing.assert_array_equal(samples, pcm.float_to_int(_timeline_samples[:22050]))
+
+    def segments_window_test(self):
+        submitted = []
+
+        class Result(object):
+            def __init__(self, value): self.value = value
+            def get(self): return self.value
+
+        class Pool(object):
+            def apply_async(self, func, args):
+                submitted.append(args[0])
+                return Result(func(*args))
+
+        results = stream._imap_window(Pool(), lambda job: job * 2, range(10), 3)
+        consumed = []
+        for result in results:
+            consumed.append(result)
+            # No more than `window` jobs are submitted ahead of the consumer
+            self.assertTrue(len(submitted) - len(consumed) < 3)
+        self.assertEqual(consumed, [job * 2 for job in range(10)])
+
+
+class meter_Test(unittest.TestCase):
+
+    def tearDown(self):
+        config.frame_rate = 44100
+        config.block_size = 1024
+
+    def passthrough_test(self):
+        blocks = [numpy.random.random((10, 2)) for i in range(3)]
+        metered = stream.meter((block for block in blocks), window=1)
+        self.assertTrue(metered.snapshot is None)
+        self.assertTrue(all(block_out is block for block_out, block in zip(metered, blocks)))
+
+    def measurements_test(self):
+        config.frame_rate = 10
+
+        def source():
+            yield numpy.array([[0.5, 1], [-0.5, 0.1], [0.5, -1.2], [-0.5, 0.1]])
+            yield numpy.array([[0.5, 0], [0.5, 0]] * 4)
+            yield buffering.silence(4, 2)
+
+        metered = stream.meter(source(), window=1)
+        next(metered)
+        next(metered)
+        snapshot = metered.snapshot
+        self.assertEqual(snapshot.position, 10)
+        self.assertEqual(snapshot.peak, (0.5, 1.2))
+        numpy.testing.assert_array_almost_equal(snapshot.rms,
+            [0.5, numpy.sqrt((1 + 0.01 + 1.44 + 0.01) / 10)])
+        self.assertEqual(snapshot.clips, (0, 2))
+        numpy.testing.assert_array_almost_equal(snapshot.dc_offset, [0.3, 0.0])
+        self.assertEqual(snapshot.silent, (False, False))
+        self.assertRaises(AttributeError, setattr, snapshot, 'peak', (0, 0))
+
+        # Last window is published when the source is exhausted
+        next(metered)
+        self.assertRaises(StopIteration, next, metered)
+        snapshot = metered.snapshot
+        self.assertEqual(snapshot.position, 16)
+        self.assertEqual(snapshot.peak, (0.5, 0))
+        self.assertEqual(snapshot.silent, (False, True))
+
+    def windows_test(self):
+        config.frame_rate = 100
+        samples = numpy.concatenate([numpy.ones((50, 1)) * 0.5, numpy.ones((50, 1)) * 0.0001])
+        metered = stream.meter(stream.iter(samples), window=0.5, silence_threshold=-60)
+        snapshots = []
+        config.block_size = 30
+        for block in metered:
+            snapshots.append(metered.snapshot)
+        self.assertEqual(snapshots[0], None)
+        self.assertEqual((snapshots[1].position, snapshots[1].peak, snapshots[1].silent), (50, (0.5,), (False,)))
+        self.assertEqual(snapshots[2], snapshots[1])
+        self.assertEqual((snapshots[3].position, snapshots[3].peak, snapshots[3].silent), (100, (0.0001,), (True,)))
+
+    def channel_count_change_test(self):
+        config.frame_rate = 10
+        blocks = [numpy.ones((4, 1)) * 0.5, numpy.ones((3, 2)) * 0.2]
+        metered = stream.meter(iter(blocks), window=1)
+        next(metered)
+        self.assertTrue(metered.snapshot is None)
+        next(metered)
+        # The partial mono window is published before metering the stereo blocks
+        self.assertEqual((metered.snapshot.position, metered.snapshot.peak), (4, (0.5,)))
+        self.assertRaises(StopIteration, next, metered)
+        self.assertEqual((metered.snapshot.position, metered.snapshot.peak), (7, (0.2, 0.2)))
+
+
+class playback_Test(unittest.TestCase):
+
+    def file_backend_test(self):
+        temp_file = NamedTemporaryFile()
+        samples = numpy.random.random((5000, 2)) * 2 - 1
+
+        def source():
+            for i in range(0, 5000, 300):
+                yield samples[i:i+300]
+
+        engine = stream.playback(source(), backend='file', filelike=temp_file.name)
+        self.assertEqual(engine.underruns, 0)
+        frame_rate, actual = sp_wavfile.read(temp_file.name)
+        numpy.testing.assert_array_equal(actual, pcm.float_to_int(samples))
+
+    def unknown_backend_test(self):
+        self.assertRaises(ValueError, stream.playback, [numpy.zeros((10, 1))], backend='bla')
+
+    def source_error_test(self):
+        def source():
+            for i in range(0, 3):
+                yield numpy.zeros((1024, 1))
+            raise RuntimeError('source failed')
+        self.assertRaises(RuntimeError, stream.playback, source(), backend='null')